@@ -0,0 +1,228 @@
+#
+# fitting the similarity stage into a memory budget
+#
+# The stage builds the gensim index a shard at a time and scores
+# blocks of queries against every headword.  Its memory is estimated
+# from the shape of the corpus: a shard's documents, held as Python
+# tuples while the shard fills, then converted to a matrix; and a
+# block of queries' scores, held sparse, then dense, then copied
+# while the top k are picked.  The planner takes the largest shard
+# and block that fit under a tenth less than the budget, since the
+# estimate runs a little short, scoring in float16 if float32 would
+# leave the block too small.  A Monitor samples the process's memory
+# while the stage runs, so the estimate can be checked against what
+# was used.
+#
+
+import os
+import re
+import time
+import resource
+import threading
+
+import numpy
+
+file_log = os.path.join('data', 'memory.txt')
+
+# bytes per stored value, roughly: a (term, weight) tuple while a
+# shard fills; data, index and scratch once it is a sparse matrix
+
+TUPLE_BYTES  = 120
+SPARSE_BYTES = 24
+
+# bounds on the choices
+
+MAX_SHARD = 32768
+MIN_SHARD = 256
+MAX_BLOCK = 1024
+MIN_BLOCK = 64
+
+# share of the budget planned for, against the estimate falling short
+
+HEADROOM = 0.9
+
+_units = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(text):
+	'''Bytes in a size such as 4G, 512M or 1000000'''
+	
+	m = re.match(r'^\s*(\d+(?:\.\d*)?)\s*([KMGT]?)i?B?\s*$', text, re.I)
+	
+	if m is None:
+		raise ValueError('not a size: ' + text)
+	
+	return int(float(m.group(1)) * _units[m.group(2).upper()])
+
+
+def format_size(n):
+	'''A size in bytes, as 1.5G or 300.0M'''
+	
+	for unit in ['T', 'G', 'M', 'K']:
+		if n >= _units[unit]:
+			return '{0:.1f}{1}'.format(float(n) / _units[unit], unit)
+	
+	return '{0}B'.format(int(n))
+
+
+def current_rss():
+	'''Resident memory of this process now, in bytes, or None if unknown'''
+	
+	try:
+		f = open('/proc/self/statm', 'r')
+		pages = int(f.read().split()[1])
+		f.close()
+	except (IOError, OSError, ValueError, IndexError):
+		return None
+	
+	return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def peak_rss():
+	'''Largest resident memory of this process so far, in bytes'''
+	
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Plan:
+	'''Shard size, query block size and scoring dtype for a corpus'''
+	
+	def __init__(self, n_docs, n_index, n_features, nnz, dense, budget, base=0):
+	
+		self.n_docs     = n_docs
+		self.n_index    = n_index
+		self.n_features = n_features
+		self.nnz        = nnz
+		self.dense      = dense
+		self.budget     = budget
+		self.base       = base
+		
+		self.shard = None
+		self.block = None
+		self.dtype = numpy.float32
+	
+	def fixed_bytes(self):
+		'''The corpus, normalized and transposed for the top k'''
+		
+		return 2 * (self.nnz * 8 + self.n_docs * 4)
+	
+	def shard_bytes(self, shard):
+		'''Building one shard of the index'''
+		
+		if self.dense:
+			values = shard * self.n_features
+			return values * TUPLE_BYTES + 2 * values * 4
+		
+		values = self.nnz * shard / max(self.n_docs, 1)
+		return values * (TUPLE_BYTES + SPARSE_BYTES)
+	
+	def block_bytes(self, block, dtype):
+		'''Scoring one block of queries against every headword
+		
+		The sparse product, the dense scores as dtype, their
+		negation and the int64 positions argpartition returns.
+		'''
+		
+		cells = block * self.n_docs
+		
+		return cells * (8 + 2 * numpy.dtype(dtype).itemsize + 8)
+	
+	def expected(self):
+		'''Estimated peak resident memory for the stage'''
+		
+		return self.base + self.fixed_bytes() + max(
+			self.shard_bytes(self.shard), self.block_bytes(self.block, self.dtype))
+	
+	def fit(self):
+		'''Choose the largest shard and block that fit; False if none do'''
+		
+		free = int(self.budget * HEADROOM) - self.base - self.fixed_bytes()
+		
+		shard = MAX_SHARD
+		
+		while shard > MIN_SHARD and self.shard_bytes(shard) > free:
+			shard /= 2
+		
+		if self.shard_bytes(shard) > free:
+			return False
+		
+		self.shard = min(shard, max(self.n_index, 1))
+		
+		def largest(dtype):
+			return max(min(MAX_BLOCK, free / self.block_bytes(1, dtype)), 0)
+		
+		self.block = largest(numpy.float32)
+		
+		# half-size scores, if full ones leave the block too small
+		
+		if self.block < MIN_BLOCK:
+			block = largest(numpy.float16)
+			
+			if block > self.block:
+				self.block = block
+				self.dtype = numpy.float16
+		
+		return self.block >= MIN_BLOCK
+	
+	def describe(self):
+	
+		return 'shard {0}, block {1}, {2} scores'.format(
+			self.shard, self.block, numpy.dtype(self.dtype).name)
+	
+	def log(self, actual, file=file_log):
+		'''Append the plan, its estimate and the actual peak to file'''
+		
+		f = open(file, 'a')
+		f.write('{0}\tbudget {1}\tdocs {2}\tfeatures {3}\tnnz {4}\t{5}\texpected {6}\tactual {7}\n'.format(
+			time.strftime('%Y-%m-%d %H:%M:%S'), format_size(self.budget),
+			self.n_docs, self.n_features, self.nnz, self.describe(),
+			format_size(self.expected()), format_size(actual)))
+		f.close()
+
+
+def plan(n_docs, n_index, n_features, nnz, dense, budget):
+	'''A Plan for the corpus under budget bytes, or None if it can't fit
+	
+	n_docs headwords, n_index of them indexed (fewer with dedup);
+	n_features terms or dimensions; nnz stored weights, every one
+	for dense LSI or projected vectors.  What the process holds
+	already counts against the budget.
+	'''
+	
+	p = Plan(n_docs, n_index, n_features, nnz, dense, budget, current_rss() or peak_rss())
+	
+	if not p.fit():
+		return None
+	
+	return p
+
+
+class Monitor(threading.Thread):
+	'''Samples resident memory in the background until stopped'''
+	
+	def __init__(self, interval=0.05):
+	
+		threading.Thread.__init__(self)
+		self.daemon = True
+		
+		self.interval = interval
+		self.peak     = current_rss() or 0
+		
+		self._stop_event = threading.Event()
+	
+	def run(self):
+	
+		while not self._stop_event.is_set():
+			self.peak = max(self.peak, current_rss() or 0)
+			self._stop_event.wait(self.interval)
+	
+	def stop(self):
+		'''Stop sampling; return the peak seen, in bytes'''
+		
+		self._stop_event.set()
+		self.join()
+		
+		if current_rss() is None:
+			return peak_rss()
+		
+		return max(self.peak, current_rss())
@@ -0,0 +1,71 @@
+#
+# queries by groups of headwords
+#
+# A group's query vector is the centroid of its headwords' unit
+# vectors, renormalized.  The centroids of a whole batch of groups
+# come from one sparse product with a group x headword membership
+# matrix, and are scored against every headword by another; results
+# are returned in the shape of the neighbour table.
+#
+
+import numpy
+from scipy import sparse
+
+from Tesserae import matrix
+from Tesserae import neighbours
+
+
+def membership(groups, n_heads):
+	'''Sparse group x headword matrix, 1 where the headword is in the group'''
+	
+	sizes = [len(g) for g in groups]
+	
+	rows = numpy.repeat(numpy.arange(len(groups)), sizes)
+	cols = numpy.concatenate([numpy.asarray(g, dtype=numpy.int64) for g in groups] or
+								[numpy.zeros(0, dtype=numpy.int64)])
+	
+	m = sparse.csr_matrix((numpy.ones(len(cols), dtype=numpy.float32), (rows, cols)),
+							shape=(len(groups), n_heads))
+	
+	# a headword named twice still counts once
+	
+	m.sum_duplicates()
+	m.data[:] = 1
+	
+	return m
+
+
+def centroids(csr, groups):
+	'''Unit-length centroid of each group of row ids of csr'''
+	
+	return matrix.normalize(membership(groups, csr.shape[0]).dot(csr))
+
+
+def search(csr, groups, n, csr_t=None, block=256):
+	'''Top n headwords for each group of row ids, leaving out its members
+	
+	csr should have unit-length rows; csr_t is its transpose, if
+	already at hand.  Returns ids and scores as neighbours.topk
+	does, one row per group, padded with id -1.
+	'''
+	
+	if csr_t is None:
+		csr_t = csr.T.tocsc()
+	
+	ids    = numpy.empty((len(groups), n), dtype=numpy.int32)
+	scores = numpy.empty((len(groups), n), dtype=numpy.float32)
+	
+	for i in range(0, len(groups), block):
+		part = groups[i:i + block]
+		
+		m = membership(part, csr.shape[0])
+		
+		sims = matrix.normalize(m.dot(csr)).dot(csr_t).toarray()
+		
+		# never return the group's own headwords
+		
+		sims[m.nonzero()] = 0
+		
+		ids[i:i + block], scores[i:i + block] = neighbours.select(sims, n)
+	
+	return ids, scores
@@ -0,0 +1,134 @@
+#
+# checkpoints for long-running jobs
+#
+# A job works through numbered queries and records the ranges it has
+# finished, plus whatever else it needs to pick up again: an output
+# offset, partly filled result columns.  Each save goes to a temporary
+# file which is synced and renamed over the last, so an interrupted
+# save leaves the previous checkpoint whole.  The job's parameters are
+# saved too, and a checkpoint is only resumed by the same job.
+#
+
+import os
+import json
+
+import numpy
+
+
+def stamp(files):
+	'''Size and modification time of each file, to tell if it has changed'''
+	
+	stamps = []
+	
+	for file in files:
+		st = os.stat(file)
+		stamps.append([file, st.st_size, st.st_mtime])
+	
+	return stamps
+
+
+def merge(ranges):
+	'''Sorted, non-overlapping [start, end) ranges covering the same ids'''
+	
+	merged = []
+	
+	for start, end in sorted(ranges):
+		if merged and start <= merged[-1][1]:
+			merged[-1][1] = max(merged[-1][1], end)
+		else:
+			merged.append([start, end])
+	
+	return merged
+
+
+class Checkpoint:
+	'''Finished query ranges and saved state for one job
+	
+	params identifies the job and must be JSON-serializable; info
+	is a dict of JSON-serializable state, arrays a dict of named
+	NumPy arrays, both saved with the ranges.
+	'''
+	
+	def __init__(self, file, params):
+	
+		self.file   = file
+		self.params = json.loads(json.dumps(params))
+		self.ranges = []
+		self.info   = dict()
+		self.arrays = dict()
+	
+	def exists(self):
+	
+		return os.path.exists(self.file)
+	
+	def load(self):
+		'''Read back the saved checkpoint; ValueError if it's another job's'''
+		
+		f = open(self.file, 'rb')
+		
+		try:
+			npz  = numpy.load(f)
+			meta = json.loads(str(npz['meta']))
+			
+			if meta['params'] != self.params:
+				raise ValueError('{0} was saved with different settings'.format(self.file))
+			
+			self.arrays = dict((k, npz[k]) for k in npz.files if k != 'meta')
+		finally:
+			f.close()
+		
+		self.ranges = merge(meta['ranges'])
+		self.info   = meta['info']
+	
+	def add(self, start, end):
+		'''Mark queries start to end-1 as finished'''
+		
+		self.ranges = merge(self.ranges + [[start, end]])
+	
+	def finished(self):
+		'''How many queries are finished'''
+		
+		return sum(end - start for start, end in self.ranges)
+	
+	def prefix(self):
+		'''How many queries from the first are finished without a gap'''
+		
+		if self.ranges and self.ranges[0][0] == 0:
+			return self.ranges[0][1]
+		
+		return 0
+	
+	def todo(self, n):
+		'''The [start, end) ranges of 0 to n-1 not yet finished'''
+		
+		gaps = []
+		prev = 0
+		
+		for start, end in self.ranges + [[n, n]]:
+			if start > prev:
+				gaps.append([prev, min(start, n)])
+			
+			prev = max(prev, end)
+		
+		return [g for g in gaps if g[0] < g[1]]
+	
+	def save(self):
+		'''Atomically replace the saved checkpoint with this one'''
+		
+		meta = json.dumps({'params': self.params, 'ranges': self.ranges, 'info': self.info})
+		
+		tmp = self.file + '.tmp'
+		
+		f = open(tmp, 'wb')
+		numpy.savez(f, meta=numpy.array(meta), **self.arrays)
+		f.flush()
+		os.fsync(f.fileno())
+		f.close()
+		
+		os.rename(tmp, self.file)
+	
+	def remove(self):
+		'''Forget the checkpoint once the job is done'''
+		
+		if os.path.exists(self.file):
+			os.remove(self.file)
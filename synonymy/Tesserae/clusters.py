@@ -0,0 +1,172 @@
+#
+# candidate synsets from the neighbour graph
+#
+# Every headword is linked to those of its top k neighbours scoring
+# above a threshold, in both directions, or, if mutual, only where
+# each is in the other's list.  The graph is split into clusters
+# either by connected components, found by a union-find run over all
+# the edges at once, or by label propagation, where every headword
+# repeatedly takes the label weighing most among its neighbours.
+#
+
+import codecs
+
+import numpy
+from scipy import sparse
+
+
+def graph(ids, scores, threshold=0., mutual=False, keep=None):
+	'''Symmetric sparse adjacency matrix from a neighbour table
+	
+	Edges scoring at or below threshold are dropped, as are those
+	touching a headword where keep, a boolean array, is false.
+	'''
+	
+	n = ids.shape[0]
+	
+	found = (ids >= 0) & (scores > threshold)
+	
+	rows = numpy.repeat(numpy.arange(n), found.sum(axis=1))
+	cols = numpy.asarray(ids[found], dtype=numpy.int64)
+	vals = numpy.asarray(scores[found], dtype=numpy.float32)
+	
+	if keep is not None:
+		sel = keep[rows] & keep[cols]
+		rows, cols, vals = rows[sel], cols[sel], vals[sel]
+	
+	adj = sparse.csr_matrix((vals, (rows, cols)), shape=(n, n))
+	adj.sum_duplicates()
+	
+	# cosines are symmetric, so an edge has the same weight both ways
+	
+	if mutual:
+		adj = adj.minimum(adj.T)
+	else:
+		adj = adj.maximum(adj.T)
+	
+	adj.eliminate_zeros()
+	
+	return adj.tocsr()
+
+
+def components(adj):
+	'''Connected component label of every node, its smallest member
+	
+	Union-find over the whole edge list at once: each round hooks
+	every edge's larger root under its smaller, then jumps pointers
+	until every node points at its root.  Rounds stop when no edge
+	joins two roots, after O(log n) of them.
+	'''
+	
+	n = adj.shape[0]
+	
+	coo = adj.tocoo()
+	
+	u = coo.row.astype(numpy.int64)
+	v = coo.col.astype(numpy.int64)
+	
+	parent = numpy.arange(n, dtype=numpy.int64)
+	
+	while len(u):
+		pu, pv = parent[u], parent[v]
+		
+		live = pu != pv
+		
+		if not live.any():
+			break
+		
+		u, v, pu, pv = u[live], v[live], pu[live], pv[live]
+		
+		numpy.minimum.at(parent, numpy.maximum(pu, pv), numpy.minimum(pu, pv))
+		
+		while True:
+			grand = parent[parent]
+			
+			if (grand == parent).all():
+				break
+			
+			parent = grand
+	
+	return parent
+
+
+def propagate(adj, iterations=20, seed=0):
+	'''Label propagation; returns a label for every node
+	
+	Each round, a random half of the nodes takes the label with the
+	largest total edge weight among its neighbours, ties going to
+	the smaller label; updating only half at a time stops labels
+	from flipping back and forth.  Nodes without edges keep their
+	own.  Stops when a round changes nothing, or after iterations.
+	'''
+	
+	n = adj.shape[0]
+	
+	coo = adj.tocoo()
+	
+	rows = coo.row.astype(numpy.int64)
+	cols = coo.col.astype(numpy.int64)
+	vals = coo.data.astype(numpy.float64)
+	
+	labels = numpy.arange(n, dtype=numpy.int64)
+	
+	rng = numpy.random.RandomState(seed)
+	
+	for i in range(iterations):
+	
+		# total weight of each (node, label) pair among the node's edges
+		
+		keys = rows * n + labels[cols]
+		
+		uniq, inv = numpy.unique(keys, return_inverse=True)
+		
+		weight = numpy.bincount(inv, weights=vals)
+		
+		node  = uniq // n
+		label = uniq % n
+		
+		# best label per node: heaviest, then smallest
+		
+		order = numpy.lexsort((label, -weight, node))
+		
+		first = numpy.ones(len(order), dtype=bool)
+		first[1:] = node[order][1:] != node[order][:-1]
+		
+		best = numpy.array(labels)
+		best[node[order][first]] = label[order][first]
+		
+		if (best == labels).all():
+			break
+		
+		turn = rng.random_sample(n) < 0.5
+		
+		labels[turn] = best[turn]
+	
+	return labels
+
+
+def groups(labels, min_size=2, max_size=None):
+	'''Node ids of each cluster, largest first, then by smallest member'''
+	
+	order = numpy.argsort(labels, kind='mergesort')
+	
+	bounds = numpy.flatnonzero(numpy.diff(labels[order])) + 1
+	
+	found = [g for g in numpy.split(order, bounds)
+				if len(g) >= min_size and (max_size is None or len(g) <= max_size)]
+	
+	found.sort(key=lambda g: (-len(g), g[0]))
+	
+	return found
+
+
+def write_synsets(file, found, by_id):
+	'''Write clusters in the synset format synset-check.py reads'''
+	
+	f = codecs.open(file, 'w', encoding='utf_8')
+	
+	for n, g in enumerate(found, 1):
+		f.write(u'<synset no="{0}">{1}</synset>\n'.format(
+			n, u''.join(u'<grcword>{0}</grcword>'.format(by_id[i]) for i in g)))
+	
+	f.close()
@@ -0,0 +1,218 @@
+#
+# compact storage for the neighbour table
+#
+# Scores are quantized, either to float16 or to int8 with one
+# float32 scale per row.  Neighbour ids are stored in ranked order
+# as zigzag-encoded differences from the previous id, written as
+# little-endian base-128 varints.  The file is a single .npz with
+# the per-row byte offsets needed to decode any slice of rows.
+#
+
+import numpy
+
+# how each quantization stores its scores
+
+DTYPES = {'float16': numpy.float16, 'int8': numpy.int8}
+
+
+def quantize(scores, mode):
+	'''Quantize scores; return the stored array and per-row scales'''
+	
+	scores = numpy.asarray(scores, dtype=numpy.float32)
+	
+	if mode == 'float16':
+		return scores.astype(numpy.float16), None
+	
+	if mode == 'int8':
+		top = abs(scores).max(axis=1)
+		scale = numpy.where(top > 0, top / 127., 1).astype(numpy.float32)
+		
+		q = numpy.rint(scores / scale[:, None]).astype(numpy.int8)
+		
+		return q, scale
+	
+	raise ValueError('unknown quantization ' + str(mode))
+
+
+def dequantize(q, scale):
+	'''Turn stored scores back into float32'''
+	
+	if scale is None:
+		return q.astype(numpy.float32)
+	
+	return q.astype(numpy.float32) * scale[:, None]
+
+
+def encode_ids(ids):
+	'''Delta/zigzag/varint-encode each row of ids
+	
+	Returns the bytes as a uint8 array, and each row's starting
+	offset in it (n + 1 entries).
+	'''
+	
+	ids = numpy.asarray(ids, dtype=numpy.int64)
+	
+	# differences along each row, the first from zero
+	
+	delta = numpy.hstack([ids[:, :1], numpy.diff(ids, axis=1)])
+	
+	zz = ((delta << 1) ^ (delta >> 63)).astype(numpy.uint64).ravel()
+	
+	# number of 7-bit groups needed by each value
+	
+	width = numpy.ones(len(zz), dtype=numpy.int64)
+	
+	for shift in range(7, 64, 7):
+		width += (zz >> numpy.uint64(shift)) > 0
+	
+	ends = numpy.cumsum(width)
+	out  = numpy.empty(ends[-1] if len(ends) else 0, dtype=numpy.uint8)
+	
+	starts = ends - width
+	
+	# write the j-th group of every value wide enough to have one
+	
+	for j in range(int(width.max()) if len(width) else 0):
+		has = width > j
+		
+		group = (zz[has] >> numpy.uint64(7 * j)) & numpy.uint64(0x7f)
+		more  = (width[has] > j + 1).astype(numpy.uint64) << numpy.uint64(7)
+		
+		out[starts[has] + j] = (group | more).astype(numpy.uint8)
+	
+	k = ids.shape[1]
+	
+	offsets = numpy.concatenate([[0], ends[k-1::k]]) if k else numpy.zeros(len(ids) + 1)
+	
+	return out, offsets.astype(numpy.int64)
+
+
+def decode_ids(buf, k, n):
+	'''Decode n rows of k varint-encoded ids, as encode_ids wrote them'''
+	
+	buf = numpy.asarray(buf, dtype=numpy.uint8)
+	
+	if n * k == 0:
+		return numpy.zeros((n, k), dtype=numpy.int32)
+	
+	# a value ends at each byte without the continuation bit
+	
+	last  = (buf & 0x80) == 0
+	ends  = numpy.flatnonzero(last) + 1
+	start = numpy.concatenate([[0], ends[:-1]])
+	
+	value = numpy.zeros(len(ends), dtype=numpy.uint64)
+	width = ends - start
+	
+	for j in range(int(width.max())):
+		has = width > j
+		
+		group = (buf[start[has] + j] & 0x7f).astype(numpy.uint64)
+		value[has] |= group << numpy.uint64(7 * j)
+	
+	# undo zigzag, then the differences
+	
+	value = value.astype(numpy.int64)
+	delta = (value >> 1) ^ -(value & 1)
+	
+	return numpy.cumsum(delta.reshape(n, k), axis=1).astype(numpy.int32)
+
+
+def save(file, ids, scores, mode='int8'):
+	'''Save a neighbour table in compact form'''
+	
+	buf, offsets = encode_ids(ids)
+	q, scale = quantize(scores, mode)
+	
+	arrays = {'ids': buf, 'offsets': offsets, 'scores': q,
+				'shape': numpy.array(numpy.shape(ids))}
+	
+	if scale is not None:
+		arrays['scale'] = scale
+	
+	numpy.savez(file, **arrays)
+
+
+class CompactTable:
+	'''Read access to a compact neighbour table
+	
+	The arrays are loaded once; rows() decodes any slice of rows
+	into NumPy arrays of ids and float32 scores.
+	'''
+	
+	def __init__(self, file):
+	
+		z = numpy.load(file)
+		
+		self.buf     = z['ids']
+		self.offsets = z['offsets']
+		self.q       = z['scores']
+		self.scale   = z['scale'] if 'scale' in z.files else None
+		self.shape   = tuple(z['shape'])
+	
+	def __len__(self):
+	
+		return self.shape[0]
+	
+	def rows(self, start=0, end=None):
+		'''Decode ids and scores for rows start to end'''
+		
+		if end is None:
+			end = self.shape[0]
+		
+		buf = self.buf[self.offsets[start]:self.offsets[end]]
+		
+		ids = decode_ids(buf, self.shape[1], end - start)
+		
+		scale  = None if self.scale is None else self.scale[start:end]
+		scores = dequantize(self.q[start:end], scale)
+		
+		return ids, scores
+
+
+def tied_rank(values):
+	'''Rank of each entry in rows sorted best first, ties sharing one
+	
+	An entry's rank is the number of entries scoring strictly
+	higher, i.e. the position where its run of equal values starts.
+	'''
+	
+	pos = numpy.arange(values.shape[1])[None, :]
+	
+	start = numpy.ones(values.shape, dtype=bool)
+	start[:, 1:] = values[:, 1:] != values[:, :-1]
+	
+	return numpy.maximum.accumulate(numpy.where(start, pos, 0), axis=1)
+
+
+def fidelity(scores, restored, ids):
+	'''How ranks change when scores are quantized
+	
+	Both quantizations are monotonic within a row, so the order
+	of a row never changes; what is lost is the difference between
+	neighbours whose scores become tied.  Each neighbour is ranked
+	with ties as ties, before and after, and moves up by as many
+	places as it joins ties with better neighbours.  Returns a dict
+	of summary figures: largest score error, fraction of rows where
+	no rank changes, mean and largest rank change, and the fraction
+	of adjacent neighbours whose scores become tied.
+	'''
+	
+	scores   = numpy.asarray(scores, dtype=numpy.float32)
+	restored = numpy.asarray(restored, dtype=numpy.float32)
+	
+	valid = numpy.asarray(ids) >= 0
+	
+	shift = tied_rank(scores) - tied_rank(restored)
+	shift = numpy.where(valid, shift, 0)
+	
+	adjacent = valid[:, 1:] & valid[:, :-1]
+	tied = (restored[:, 1:] == restored[:, :-1]) & (scores[:, 1:] != scores[:, :-1]) & adjacent
+	
+	return {
+		'max_error':   float(abs(scores - restored)[valid].max()) if valid.any() else 0.,
+		'rows_intact': float((shift.max(axis=1) == 0).mean()) if len(shift) else 1.,
+		'mean_shift':  float(shift[valid].mean()) if valid.any() else 0.,
+		'max_shift':   int(shift.max()) if shift.size else 0,
+		'new_ties':    float(tied.sum()) / max(int(adjacent.sum()), 1),
+	}
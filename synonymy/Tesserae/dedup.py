@@ -0,0 +1,95 @@
+#
+# collapse headwords with identical definitions
+#
+
+import os
+
+import numpy
+from gensim import similarities
+
+
+def group_rows(corpus, quiet=0):
+	'''Assign each bag of words to a group of identical bags
+	
+	Returns an array giving each row's group number and a list of
+	one representative row per group, in order of group number.
+	'''
+	
+	seen   = dict()
+	groups = numpy.empty(len(corpus), dtype=numpy.int32)
+	reps   = []
+	
+	for i, doc in enumerate(corpus):
+		key = tuple(doc)
+		
+		if key not in seen:
+			seen[key] = len(reps)
+			reps.append(i)
+		
+		groups[i] = seen[key]
+	
+	if not quiet:
+		print 'Collapsed {} headwords into {} unique definitions ({:.2f}:1)'.format(
+			len(corpus), len(reps), float(len(corpus)) / max(len(reps), 1))
+	
+	return groups, reps
+
+
+def groups_file(file_index):
+	'''Where the group numbers for an index are kept'''
+	
+	return file_index + '.groups.npy'
+
+
+def save_groups(groups, file_index, quiet=0):
+	'''Save group numbers alongside the similarity index'''
+	
+	file_groups = groups_file(file_index)
+	
+	if not quiet:
+		print 'Saving definition groups ' + file_groups
+	
+	numpy.save(file_groups, groups)
+
+
+def remove_groups(file_index):
+	'''Forget any groups saved with an earlier index'''
+	
+	if os.path.exists(groups_file(file_index)):
+		os.remove(groups_file(file_index))
+
+
+class FannedIndex:
+	'''A similarity index over unique definitions, queried per headword
+	
+	Looks like the gensim index it wraps, except that each query
+	returns one score per headword, copying the score of its group.
+	A block of queries returns one such row per query.
+	'''
+	
+	def __init__(self, index, groups):
+	
+		self.index  = index
+		self.groups = groups
+	
+	def __getitem__(self, query):
+	
+		return numpy.asarray(self.index[query])[..., self.groups]
+	
+	def __len__(self):
+	
+		return len(self.groups)
+
+
+def load_index(file_index, quiet=0):
+	'''Load a gensim similarity index, fanned out if deduplicated'''
+	
+	if not quiet:
+		print 'Loading similarity index ' + file_index
+	
+	index = similarities.Similarity.load(file_index)
+	
+	if os.path.exists(groups_file(file_index)):
+		index = FannedIndex(index, numpy.load(groups_file(file_index)))
+	
+	return index
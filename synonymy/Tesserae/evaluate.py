@@ -0,0 +1,186 @@
+#
+# summary figures for synset-check results
+#
+# Everything is computed from the rank columns at once: recall at
+# every k from one sort and a searchsorted, per-synset figures from
+# bincount over the (pair, synset) memberships.
+#
+# Ranks are positions in a headword's results.  The query itself
+# normally takes position 0, so a partner at position r is its r-th
+# hit; a partner tied with the query at position 0 counts as 1.
+#
+
+import json
+import csv
+
+import numpy
+
+# default cut-offs for recall
+
+KS = (1, 5, 10, 20, 50, 100, 500, 1000)
+
+# lower edges of the rank histogram's bins
+
+BINS = (1, 2, 6, 11, 21, 51, 101, 501, 1001, 5001)
+
+
+def effective(rank):
+	'''Ranks counted from 1; -1 where unknown'''
+	
+	rank = numpy.asarray(rank, dtype=numpy.int64)
+	
+	return numpy.where(rank < 0, -1, numpy.maximum(rank, 1))
+
+
+def at_k(ranks, ks):
+	'''Fraction of ranks no greater than each k'''
+	
+	ranks = numpy.sort(ranks)
+	
+	return numpy.searchsorted(ranks, ks, 'right') / float(max(len(ranks), 1))
+
+
+def evaluate(ranka, rankb, offsets, synsets, ks=KS, k_synset=10):
+	'''Summary figures and a per-synset table
+	
+	Only pairs with both words in the lexicon are scored; each
+	counts twice, once in each direction, for recall, MRR and the
+	rank histogram.  Reciprocal agreement is the fraction of pairs
+	whose words are both within k of each other, and the fraction
+	with either.  The per-synset table gives, for each synset, its
+	pairs, those scored, and their recall at k_synset and MRR.
+	'''
+	
+	ks = numpy.array(sorted(ks))
+	
+	ra = effective(ranka)
+	rb = effective(rankb)
+	
+	found = (ra > 0) & (rb > 0)
+	
+	r = numpy.concatenate([ra[found], rb[found]])
+	
+	if len(r):
+		mrr    = float((1. / r).mean())
+		mean   = float(r.mean())
+		median = float(numpy.median(r))
+	else:
+		mrr = mean = median = None
+	
+	edges = numpy.append(BINS, numpy.iinfo(numpy.int64).max)
+	hist  = numpy.histogram(r, bins=edges)[0]
+	
+	hi = [int(x) for x in edges[1:] - 1]
+	hi[-1] = None
+	
+	summary = {
+		'pairs':       int(len(ra)),
+		'scored':      int(found.sum()),
+		'recall':      dict((str(k), float(v)) for k, v in zip(ks, at_k(r, ks))),
+		'mrr':         mrr,
+		'mean_rank':   mean,
+		'median_rank': median,
+		'histogram':   [{'from': int(lo), 'to': h, 'count': int(c)}
+							for lo, h, c in zip(edges[:-1], hi, hist)],
+		'reciprocal': {
+			'both':   dict((str(k), float(v)) for k, v in
+							zip(ks, at_k(numpy.maximum(ra[found], rb[found]), ks))),
+			'either': dict((str(k), float(v)) for k, v in
+							zip(ks, at_k(numpy.minimum(ra[found], rb[found]), ks)))
+		}
+	}
+	
+	# per synset, via each pair's memberships
+	
+	offsets = numpy.asarray(offsets)
+	
+	pair_of = numpy.repeat(numpy.arange(len(offsets) - 1), numpy.diff(offsets))
+	
+	ids, inv = numpy.unique(synsets, return_inverse=True)
+	
+	f  = found[pair_of]
+	ma = numpy.where(f, ra[pair_of], 1)
+	mb = numpy.where(f, rb[pair_of], 1)
+	
+	hits = f * (((ma <= k_synset) * 1. + (mb <= k_synset)) / 2)
+	recip = f * ((1. / ma + 1. / mb) / 2)
+	
+	n_pairs  = numpy.bincount(inv, minlength=len(ids))
+	n_scored = numpy.bincount(inv, weights=f, minlength=len(ids))
+	
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		recall_s = numpy.bincount(inv, weights=hits, minlength=len(ids)) / n_scored
+		mrr_s    = numpy.bincount(inv, weights=recip, minlength=len(ids)) / n_scored
+	
+	table = {
+		'synset': ids,
+		'pairs':  n_pairs,
+		'scored': n_scored.astype(numpy.int64),
+		'recall': recall_s,
+		'mrr':    mrr_s,
+		'k':      k_synset
+	}
+	
+	return summary, table
+
+
+def read_results(file):
+	'''Rank columns and synset memberships from a test.results file'''
+	
+	ranka   = []
+	rankb   = []
+	synsets = []
+	offsets = [0]
+	
+	f = open(file, 'r')
+	
+	for line in f:
+		field = line.rstrip('\n').split('\t')
+		
+		if len(field) < 5:
+			continue
+		
+		ranka.append(-1 if field[2] == 'None' else int(field[2]))
+		rankb.append(-1 if field[3] == 'None' else int(field[3]))
+		
+		syn = [int(n) for n in field[4].split(';') if n != '']
+		
+		synsets.extend(syn)
+		offsets.append(offsets[-1] + len(syn))
+	
+	f.close()
+	
+	return (numpy.array(ranka, dtype=numpy.int64), numpy.array(rankb, dtype=numpy.int64),
+			numpy.array(offsets, dtype=numpy.int64), numpy.array(synsets, dtype=numpy.int64))
+
+
+def save(summary, table, stem, quiet=0):
+	'''Write the summary to stem.json and the table to stem.synsets.csv'''
+	
+	if not quiet:
+		print 'Writing evaluation to {0}.json, {0}.synsets.csv'.format(stem)
+	
+	f = open(stem + '.json', 'w')
+	json.dump(summary, f, indent=1, sort_keys=True)
+	f.close()
+	
+	f = open(stem + '.synsets.csv', 'wb')
+	w = csv.writer(f)
+	w.writerow(['synset', 'pairs', 'scored', 'recall@{0}'.format(table['k']), 'mrr'])
+	
+	for row in zip(table['synset'], table['pairs'], table['scored'],
+					table['recall'], table['mrr']):
+		w.writerow([row[0], row[1], row[2]] +
+					['' if numpy.isnan(x) else '{0:.4f}'.format(x) for x in row[3:]])
+	
+	f.close()
+
+
+def load(stem):
+	'''Read back a summary written by save()'''
+	
+	f = open(stem + '.json', 'r')
+	summary = json.load(f)
+	f.close()
+	
+	return summary
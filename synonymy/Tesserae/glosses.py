@@ -0,0 +1,204 @@
+#
+# a reverse index from English terms to the headwords they define
+#
+# Built from every headword's raw English terms, hapax legomena
+# included, so that a rare word still finds the one entry using it.
+# Postings are stored term by term as flat arrays, headword ids and
+# tf-idf weights, and memory-mapped when loaded: a query reads only
+# its own terms' lists.
+#
+
+import os
+import pickle
+
+import numpy
+from scipy import sparse
+
+from Tesserae import incremental
+from Tesserae import tesslang
+
+stem_glosses = os.path.join('data', 'glosses')
+
+
+def build(raw, stem_flag, quiet=0):
+	'''Index raw terms, a dict of headword -> English terms'''
+	
+	if not quiet:
+		print 'Building gloss index'
+	
+	heads = sorted(raw)
+	terms = sorted(set(t for tokens in raw.itervalues() for t in tokens))
+	
+	term_id = dict((t, i) for i, t in enumerate(terms))
+	
+	rows = []
+	cols = []
+	
+	for i, head in enumerate(heads):
+		ids = [term_id[t] for t in raw[head]]
+		
+		rows.extend([i] * len(ids))
+		cols.extend(ids)
+	
+	counts = sparse.csr_matrix((numpy.ones(len(cols), dtype=numpy.float32), (rows, cols)),
+								shape=(len(heads), len(terms)))
+	counts.sum_duplicates()
+	
+	df = numpy.bincount(counts.indices, minlength=len(terms))
+	
+	csc = incremental.tfidf(counts, df).tocsc()
+	csc.sort_indices()
+	
+	return GlossIndex(heads, terms, stem_flag,
+					csc.indptr.astype(numpy.int64),
+					csc.indices.astype(numpy.int32),
+					csc.data.astype(numpy.float32))
+
+
+def exists(stem=stem_glosses):
+	'''Whether a gloss index has been saved'''
+	
+	return os.path.exists(stem + '.pickle')
+
+
+def load(stem=stem_glosses, quiet=0):
+	'''Load a saved gloss index, its postings memory-mapped'''
+	
+	if not quiet:
+		print 'Loading gloss index {}.*'.format(stem)
+	
+	f = open(stem + '.pickle', 'rb')
+	meta = pickle.load(f)
+	f.close()
+	
+	return GlossIndex(meta['heads'], meta['terms'], meta['stem'],
+					numpy.load(stem + '.indptr.npy', mmap_mode='r'),
+					numpy.load(stem + '.docs.npy', mmap_mode='r'),
+					numpy.load(stem + '.weights.npy', mmap_mode='r'))
+
+
+def parse_query(text):
+	'''Split a query into required (+), excluded (-) and optional words'''
+	
+	must, may, must_not = [], [], []
+	
+	for word in text.split():
+		if word.startswith('+') and len(word) > 1:
+			must.append(word[1:])
+		elif word.startswith('-') and len(word) > 1:
+			must_not.append(word[1:])
+		else:
+			may.append(word)
+	
+	return must, may, must_not
+
+
+class GlossIndex:
+	'''English term -> (headword, tf-idf weight) posting lists'''
+	
+	def __init__(self, heads, terms, stem_flag, indptr, docs, weights):
+	
+		self.heads   = heads
+		self.terms   = terms
+		self.stem    = stem_flag
+		self.indptr  = indptr
+		self.docs    = docs
+		self.weights = weights
+		
+		self.term_id = dict((t, i) for i, t in enumerate(terms))
+		
+		self._greek = None
+	
+	def __len__(self):
+	
+		return len(self.heads)
+	
+	def save(self, stem=stem_glosses, quiet=0):
+		'''Write the postings as .npy files, terms and headwords as a pickle'''
+		
+		if not quiet:
+			print 'Saving gloss index as {}.*'.format(stem)
+		
+		numpy.save(stem + '.indptr.npy', self.indptr)
+		numpy.save(stem + '.docs.npy', self.docs)
+		numpy.save(stem + '.weights.npy', self.weights)
+		
+		f = open(stem + '.pickle', 'wb')
+		pickle.dump({'heads': self.heads, 'terms': self.terms, 'stem': self.stem}, f, 2)
+		f.close()
+	
+	def postings(self, term):
+		'''Headword ids and weights for a term; empty if it's unknown'''
+		
+		t = self.term_id.get(term)
+		
+		if t is None:
+			return numpy.zeros(0, dtype=numpy.int32), numpy.zeros(0, dtype=numpy.float32)
+		
+		start, end = self.indptr[t], self.indptr[t+1]
+		
+		return self.docs[start:end], self.weights[start:end]
+	
+	def greek(self):
+		'''Boolean array, true where the headword is Greek'''
+		
+		if self._greek is None:
+			self._greek = numpy.array([tesslang.is_greek(h) for h in self.heads], dtype=bool)
+		
+		return self._greek
+	
+	def search(self, must=(), may=(), must_not=(), n=None, lang=None):
+		'''Headword ids and scores for a query, best first
+		
+		Terms are as they appear in the index.  A headword must have
+		every term in must and none in must_not; its score is the
+		sum of its weights for the terms in must and may.  Without
+		must, it needs at least one term in may.  lang 'la' or 'grc'
+		keeps only Latin or Greek headwords.
+		'''
+		
+		must     = sorted(set(must))
+		may      = sorted(set(may) - set(must))
+		must_not = sorted(set(must_not))
+		
+		empty = numpy.zeros(0, dtype=numpy.int32), numpy.zeros(0, dtype=numpy.float32)
+		
+		if not must and not may:
+			return empty
+		
+		lists = [self.postings(t) for t in must + may]
+		
+		if any(len(docs) == 0 for docs, w in lists[:len(must)]):
+			return empty
+		
+		docs = numpy.concatenate([d for d, w in lists])
+		
+		if len(docs) == 0:
+			return empty
+		
+		weights  = numpy.concatenate([w for d, w in lists])
+		required = numpy.concatenate([numpy.full(len(d), i < len(must), dtype=bool)
+										for i, (d, w) in enumerate(lists)])
+		
+		ids, inv = numpy.unique(docs, return_inverse=True)
+		
+		scores = numpy.bincount(inv, weights=weights, minlength=len(ids))
+		
+		keep = numpy.bincount(inv, weights=required, minlength=len(ids)) == len(must)
+		
+		if must_not:
+			keep &= ~numpy.in1d(ids, numpy.concatenate([self.postings(t)[0] for t in must_not]))
+		
+		if lang is not None:
+			keep &= self.greek()[ids] == (lang == 'grc')
+		
+		ids, scores = ids[keep], scores[keep].astype(numpy.float32)
+		
+		# best first, ties in id order
+		
+		order = numpy.argsort(-scores, kind='mergesort')
+		
+		if n is not None:
+			order = order[:n]
+		
+		return ids[order], scores[order]
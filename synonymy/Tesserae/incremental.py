@@ -0,0 +1,417 @@
+#
+# incremental updates to the tf-idf corpus and neighbour table
+#
+# A full build leaves behind enough state to patch its results:
+# the raw English tokens of every headword before hapax filtering,
+# with their global counts (data/raw_tokens.pickle), and the raw
+# headword x term counts (data/counts.npz).  Given a new set of
+# full definitions, only the headwords whose definitions changed,
+# or which contain a term crossing the hapax boundary, are
+# re-tokenized; idf is recomputed from updated document frequencies,
+# and neighbour lists are refreshed only for headwords whose scores
+# can have changed.
+#
+
+import os
+import pickle
+import collections
+
+import numpy
+from scipy import sparse
+
+from Tesserae import matrix
+from Tesserae import neighbours
+
+file_state  = os.path.join('data', 'raw_tokens.pickle')
+file_counts = os.path.join('data', 'counts.npz')
+
+# how the last build reduced its vectors, if it did
+
+file_reduction = os.path.join('data', 'reduction.txt')
+
+
+def save_state(raw, stem_flag, quiet=0, count=None):
+	'''Save raw tokens and their counts for later updates'''
+	
+	if not quiet:
+		print 'Saving token state ' + file_state
+	
+	if count is None:
+		count = collections.Counter()
+		
+		for tokens in raw.itervalues():
+			count.update(tokens)
+	
+	f = open(file_state, 'wb')
+	pickle.dump({'stem': stem_flag, 'tokens': raw, 'count': count}, f, 2)
+	f.close()
+
+
+def load_state(quiet=0):
+	'''Load the token state saved by the last build'''
+	
+	if not quiet:
+		print 'Loading token state ' + file_state
+	
+	f = open(file_state, 'rb')
+	state = pickle.load(f)
+	f.close()
+	
+	return state
+
+
+def have_state():
+	'''Whether an earlier build saved what an update needs'''
+	
+	return os.path.exists(file_state) and os.path.exists(file_counts)
+
+
+def save_reduction(method=None, dims=None):
+	'''Note the reduction used for the current corpus, or that there was none'''
+	
+	f = open(file_reduction, 'w')
+	
+	if method is not None:
+		f.write('{0}\t{1}\n'.format(method, dims))
+	
+	f.close()
+
+
+def last_reduction():
+	'''(method, dims) of the current corpus' reduction; None if unreduced'''
+	
+	if not os.path.exists(file_reduction):
+		return None
+	
+	f = open(file_reduction, 'r')
+	fields = f.read().split()
+	f.close()
+	
+	if not fields:
+		return None
+	
+	return fields[0], int(fields[1])
+
+
+def save_counts(counts, quiet=0):
+	'''Save the raw headword x term counts'''
+	
+	if not quiet:
+		print 'Saving term counts ' + file_counts
+	
+	sparse.save_npz(file_counts, counts.tocsr())
+
+
+def tfidf(counts, df):
+	'''Closed-form tf-idf, as gensim's default TfidfModel computes it'''
+	
+	n = counts.shape[0]
+	
+	idf = numpy.zeros(len(df))
+	idf[df > 0] = numpy.log2(float(n) / df[df > 0])
+	
+	weighted = counts.tocsr().astype(numpy.float64)
+	weighted.data *= idf[weighted.indices]
+	weighted.eliminate_zeros()
+	
+	return matrix.normalize(weighted)
+
+
+def diff_defs(old, new):
+	'''Headwords removed, added and changed between two sets of defs'''
+	
+	removed = [l for l in old if l not in new]
+	added   = [l for l in new if l not in old]
+	changed = [l for l in new if l in old and new[l] != old[l]]
+	
+	return removed, added, changed
+
+
+class Update:
+	'''Apply a new set of full definitions to the saved state
+	
+	After run(), by_id, counts, weights and dictionary describe the
+	new corpus, remap gives each old id's new id (-1 if dropped), and
+	changed / refresh are the new ids whose vectors changed and whose
+	neighbour lists must be recomputed.
+	'''
+	
+	def __init__(self, old_defs, new_defs, by_id, dictionary, tokenize, quiet=0):
+	
+		self.old_defs   = old_defs
+		self.new_defs   = new_defs
+		self.old_by_id  = by_id
+		self.dictionary = dictionary
+		self.tokenize   = tokenize
+		self.quiet      = quiet
+	
+	def retokenize(self, state):
+		'''Update raw tokens and counts; return headwords to rebuild'''
+		
+		raw   = state['tokens']
+		count = state['count']
+		
+		removed, added, changed = diff_defs(self.old_defs, self.new_defs)
+		
+		if not self.quiet:
+			print '{} removed, {} added, {} changed definitions'.format(
+				len(removed), len(added), len(changed))
+		
+		old_tokens = dict((l, raw.pop(l, [])) for l in removed + changed)
+		new_tokens = dict((l, self.tokenize(self.new_defs[l])) for l in added + changed)
+		
+		touched = set()
+		
+		for tokens in old_tokens.values() + new_tokens.values():
+			touched.update(tokens)
+		
+		before = dict((t, count[t]) for t in touched)
+		
+		for tokens in old_tokens.itervalues():
+			count.subtract(tokens)
+		
+		for l, tokens in new_tokens.iteritems():
+			count.update(tokens)
+			
+			if tokens:
+				raw[l] = tokens
+		
+		# terms that became, or stopped being, hapax legomena
+		# change the bags of every headword that uses them
+		
+		crossed = set(t for t in touched if (before[t] > 1) != (count[t] > 1))
+		
+		affected = set(removed) | set(added) | set(changed)
+		
+		if crossed:
+			for l, tokens in raw.iteritems():
+				if l not in affected and not crossed.isdisjoint(tokens):
+					affected.add(l)
+		
+		if not self.quiet:
+			print '{} terms crossed the hapax boundary; rebuilding {} headwords'.format(
+				len(crossed), len(affected))
+		
+		return affected
+	
+	def run(self, state, counts, old_weights, tolerance=0):
+		'''Patch the counts and weights; work out what to refresh'''
+		
+		self.tolerance = tolerance
+		
+		raw   = state['tokens']
+		count = state['count']
+		
+		affected = self.retokenize(state)
+		
+		# final bags for the affected headwords
+		
+		bags = dict()
+		
+		for l in affected:
+			if l in raw:
+				bag = [w for w in raw[l] if count[w] > 1]
+				
+				if bag:
+					bags[l] = bag
+		
+		# old headwords keep their order; new ones go at the end
+		
+		old_by_word = dict((w, i) for i, w in enumerate(self.old_by_id))
+		
+		keep = numpy.array([w not in affected or w in bags for w in self.old_by_id], dtype=bool)
+		
+		self.remap = numpy.full(len(self.old_by_id), -1, dtype=numpy.int64)
+		self.remap[keep] = numpy.arange(keep.sum())
+		
+		self.by_id = [w for w, k in zip(self.old_by_id, keep) if k]
+		self.by_id.extend(sorted(l for l in bags if l not in old_by_word))
+		
+		by_word = dict((w, i) for i, w in enumerate(self.by_id))
+		
+		n = len(self.by_id)
+		
+		# rows to rebuild, and the old rows they replace
+		
+		new_rows = numpy.array(sorted(by_word[l] for l in bags), dtype=numpy.int64)
+		old_rows = numpy.array(sorted(old_by_word[l] for l in affected if l in old_by_word),
+						dtype=numpy.int64)
+		
+		bows = [self.dictionary.doc2bow(bags[self.by_id[i]], allow_update=True)
+					for i in new_rows]
+		
+		m = len(self.dictionary)
+		
+		# document frequencies by delta
+		
+		counts = counts.tocsr()
+		
+		df = numpy.zeros(m, dtype=numpy.int64)
+		df[:counts.shape[1]] = numpy.bincount(counts.indices, minlength=counts.shape[1])
+		
+		old_part = counts[old_rows] if len(old_rows) else sparse.csr_matrix((0, counts.shape[1]))
+		df[:counts.shape[1]] -= numpy.bincount(old_part.indices, minlength=counts.shape[1])
+		
+		cols = numpy.array([t for bow in bows for t, c in bow], dtype=numpy.int64)
+		vals = numpy.array([c for bow in bows for t, c in bow], dtype=numpy.float32)
+		rows = numpy.repeat(new_rows, [len(bow) for bow in bows])
+		
+		df += numpy.bincount(cols, minlength=m)
+		
+		self.df = df
+		
+		# doc2bow counted the new rows; set the real figures
+		
+		self.dictionary.dfs = dict((t, int(f)) for t, f in enumerate(df) if f > 0)
+		self.dictionary.num_docs = n
+		
+		# unaffected rows move to their new ids
+		
+		stay = keep.copy()
+		stay[old_rows] = False
+		
+		old = counts[numpy.flatnonzero(stay)].tocoo()
+		
+		self.counts = sparse.csr_matrix((
+			numpy.concatenate([old.data, vals]),
+			(numpy.concatenate([self.remap[numpy.flatnonzero(stay)][old.row], rows]),
+			 numpy.concatenate([old.col, cols]))),
+			shape=(n, m))
+		self.counts.sort_indices()
+		
+		self.weights = tfidf(self.counts, df)
+		
+		self.find_changes(old_weights)
+	
+	def find_changes(self, old_weights):
+		'''Work out which rows changed and which lists need refreshing'''
+		
+		n, m = self.weights.shape
+		
+		# old weights at their new ids, padded to the new vocabulary
+		
+		old_w = old_weights.tocsr()
+		
+		if old_w.shape[1] < m:
+			old_w = sparse.hstack([old_w,
+				sparse.csr_matrix((old_w.shape[0], m - old_w.shape[1]))]).tocsr()
+		
+		ids = numpy.flatnonzero(self.remap >= 0)
+		
+		moved = sparse.csr_matrix((n, m), dtype=numpy.float32)
+		
+		if len(ids):
+			P = sparse.csr_matrix((numpy.ones(len(ids)), (self.remap[ids], ids)),
+						shape=(n, old_w.shape[0]))
+			moved = P.dot(old_w).tocsr()
+		
+		delta = abs(self.weights - moved).max(axis=1).toarray().ravel()
+		
+		changed = (delta > self.tolerance)
+		changed[len(ids):] = True
+		
+		self.changed = numpy.flatnonzero(changed)
+		
+		# anyone sharing a term with the old or new version
+		# of a changed row may have gained or lost a neighbour
+		
+		terms = numpy.zeros(m)
+		
+		terms[self.weights[self.changed].indices] = 1
+		
+		gone = numpy.flatnonzero(self.remap < 0)
+		
+		if len(gone):
+			terms[old_w[gone].indices] = 1
+		
+		if len(self.changed):
+			terms[moved[self.changed].indices] = 1
+		
+		refresh = self.weights.dot(terms) > 0
+		refresh[self.changed] = True
+		
+		self.refresh = numpy.flatnonzero(refresh)
+		
+		if not self.quiet:
+			print '{} vectors changed; refreshing {} of {} neighbour lists'.format(
+				len(self.changed), len(self.refresh), n)
+	
+	def patch_neighbours(self, ids, scores, k):
+		'''Carry over unaffected neighbour lists; recompute the rest'''
+		
+		n = len(self.by_id)
+		
+		new_ids    = numpy.full((n, k), -1, dtype=numpy.int32)
+		new_scores = numpy.zeros((n, k), dtype=numpy.float32)
+		
+		old = numpy.flatnonzero(self.remap >= 0)
+		
+		# old lists at the new ids, with neighbour ids remapped
+		
+		kk = min(k, ids.shape[1])
+		
+		moved = numpy.asarray(ids[old, :kk])
+		moved = numpy.where(moved >= 0, self.remap[moved], -1)
+		
+		new_ids[self.remap[old], :kk]    = moved
+		new_scores[self.remap[old], :kk] = scores[old, :kk]
+		
+		# a list that lost a member, or is too short, is stale too
+		
+		stale = ((numpy.asarray(ids[old, :kk]) >= 0) & (moved < 0)).any(axis=1)
+		
+		refresh = numpy.union1d(self.refresh, self.remap[old][stale])
+		
+		if kk < k:
+			refresh = numpy.arange(n)
+		
+		if len(refresh):
+			new_ids[refresh], new_scores[refresh] = neighbours.topk(
+				self.weights, k, refresh, quiet=self.quiet)
+		
+		return new_ids, new_scores
+
+
+def align(by_id_a, terms_a, by_id_b, csr_b, terms_b):
+	'''csr_b with its rows in by_id_a's order and its columns in terms_a's
+	
+	Rows are matched by headword and columns by term string; terms
+	of b that a lacks go after a's.  Returns None if the two have
+	different headwords.
+	'''
+	
+	if sorted(by_id_a) != sorted(by_id_b):
+		return None
+	
+	row_b = dict((w, i) for i, w in enumerate(by_id_b))
+	col_a = dict((t, i) for i, t in enumerate(terms_a))
+	
+	for t in terms_b:
+		col_a.setdefault(t, len(col_a))
+	
+	rows = numpy.array([row_b[w] for w in by_id_a], dtype=numpy.int64)
+	cols = numpy.array([col_a[t] for t in terms_b], dtype=numpy.int64)
+	
+	b = csr_b[rows].tocoo()
+	
+	return sparse.csr_matrix((b.data, (b.row, cols[b.col])), shape=(len(by_id_a), len(col_a)))
+
+
+def compare(by_id_a, csr_a, terms_a, by_id_b, csr_b, terms_b):
+	'''Largest weight difference between two tf-idf builds
+	
+	Rows and columns are matched as by align.  Returns None if
+	the two have different headwords.
+	'''
+	
+	b = align(by_id_a, terms_a, by_id_b, csr_b, terms_b)
+	
+	if b is None:
+		return None
+	
+	a = csr_a.tocsr()
+	a = sparse.csr_matrix((a.data, a.indices, a.indptr), shape=b.shape)
+	
+	d = a - b
+	
+	return float(abs(d).max()) if d.nnz else 0.
@@ -0,0 +1,187 @@
+#
+# streaming extraction of definitions with a SAX parser
+#
+
+import xml.sax
+import xml.sax.handler
+
+from Tesserae import tesslang
+
+
+class EntryHandler(xml.sax.handler.ContentHandler):
+	'''Collect headword keys and definition strings from a lexicon
+	
+	Nothing is built for stop-listed elements: their start and end
+	tags only move a depth counter, and their text is never kept.
+	Text inside <foreign lang="greek"> is transliterated to unicode.
+	A <ref> inside an <xr>, or straight after one, is kept as a
+	cross-reference (target id, text).  Finished entries accumulate
+	in self.entries as (key, defs, id, refs) until the caller takes
+	them.
+	'''
+	
+	def __init__(self, stop_tags, def_tag, def_attrs=None):
+	
+		xml.sax.handler.ContentHandler.__init__(self)
+		
+		self.stop_tags = stop_tags
+		self.def_tag   = def_tag
+		self.def_attrs = def_attrs or dict()
+		
+		self.entries = []
+		
+		self.key   = None
+		self.id    = None
+		self.defs  = None
+		self.refs  = None
+		self.skip  = 0
+		self.stack = []
+		self.buf   = []
+		self.beta  = []
+		
+		self.after_xr = False
+		self.target   = None
+		self.ref_buf  = []
+	
+	def is_def(self, name, attrs):
+	
+		if name != self.def_tag:
+			return False
+		
+		for k, v in self.def_attrs.iteritems():
+			if attrs.get(k) != v:
+				return False
+		
+		return True
+	
+	def startElement(self, name, attrs):
+	
+		if self.skip:
+			self.skip += 1
+			return
+		
+		if name == 'entryFree':
+			self.key   = attrs.get('key')
+			self.id    = attrs.get('id')
+			self.defs  = []
+			self.refs  = []
+			self.stack = []
+			
+			self.after_xr = False
+			return
+		
+		if self.key is None:
+			return
+		
+		if name in self.stop_tags:
+			self.skip = 1
+			return
+		
+		after_xr, self.after_xr = self.after_xr, False
+		
+		if name == 'ref' and (after_xr or 'xr' in self.stack):
+			self.target  = attrs.get('target')
+			self.ref_buf = []
+			self.stack.append('ref')
+		
+		elif name == 'xr':
+			self.stack.append('xr')
+		
+		elif self.is_def(name, attrs):
+			if 'def' not in self.stack:
+				self.buf = []
+			
+			self.stack.append('def')
+		
+		elif name == 'foreign' and attrs.get('lang') == 'greek':
+			self.beta = []
+			self.stack.append('foreign')
+		
+		else:
+			self.stack.append(None)
+	
+	def endElement(self, name):
+	
+		if self.skip:
+			self.skip -= 1
+			return
+		
+		if self.key is None:
+			return
+		
+		if name == 'entryFree':
+			self.entries.append((self.key, self.defs, self.id, self.refs))
+			self.key = None
+			return
+		
+		kind = self.stack.pop() if self.stack else None
+		
+		if kind == 'ref':
+			self.refs.append((self.target, ''.join(self.ref_buf)))
+		
+		elif kind == 'xr':
+			self.after_xr = 'xr' not in self.stack
+		
+		elif kind == 'foreign':
+			if 'def' in self.stack:
+				self.buf.append(tesslang.beta_to_uni(''.join(self.beta)))
+		
+		elif kind == 'def' and 'def' not in self.stack:
+			self.defs.append(''.join(self.buf))
+	
+	def characters(self, content):
+	
+		if self.skip or self.key is None:
+			return
+		
+		if self.after_xr and not content.isspace():
+			self.after_xr = False
+		
+		if 'ref' in self.stack:
+			self.ref_buf.append(content)
+		
+		if self.stack and self.stack[-1] == 'foreign':
+			self.beta.append(content)
+		
+		elif 'def' in self.stack:
+			self.buf.append(content)
+
+
+def iter_entries(filename, handler, pr=None, chunk=1 << 20):
+	'''Feed a lexicon to the handler in chunks; yield its entries
+	
+	Entries are handed on as soon as they are complete, so memory
+	use doesn't grow with the size of the lexicon.
+	'''
+	
+	parser = xml.sax.make_parser()
+	parser.setFeature(xml.sax.handler.feature_namespaces, False)
+	parser.setFeature(xml.sax.handler.feature_external_ges, False)
+	parser.setContentHandler(handler)
+	
+	f = open(filename, 'rb')
+	
+	while True:
+		data = f.read(chunk)
+		
+		if not data:
+			break
+		
+		parser.feed(data)
+		
+		if pr is not None:
+			pr.advance(len(data))
+		
+		for entry in handler.entries:
+			yield entry
+		
+		del handler.entries[:]
+	
+	f.close()
+	
+	parser.close()
+	
+	for entry in handler.entries:
+		yield entry
+	
+	del handler.entries[:]
@@ -0,0 +1,95 @@
+#
+# memory-mapped access to the XML lexica
+#
+
+import os
+import mmap
+import pickle
+
+
+def lexicon_file(lang):
+	'''Where the XML lexicon for a language is kept'''
+	
+	return os.path.join('dict', lang + '.lexicon.xml')
+
+
+def open_map(filename):
+	'''Map a file read-only into memory'''
+	
+	f = open(filename, 'rb')
+	
+	try:
+		mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	finally:
+		f.close()
+	
+	return mm
+
+
+class EntryIndex:
+	'''Byte offsets of each headword's entries in the XML lexica
+	
+	Keys are standardized headwords; values are lists of
+	(lang, start, end), one for each entry that was collapsed
+	into the headword.
+	'''
+	
+	file = os.path.join('data', 'entry_offsets.pickle')
+	
+	def __init__(self, offsets=None):
+	
+		self.offsets = offsets if offsets is not None else dict()
+		self._maps   = dict()
+	
+	def __len__(self):
+	
+		return len(self.offsets)
+	
+	def __contains__(self, lemma):
+	
+		return lemma in self.offsets
+	
+	def add(self, lemma, lang, start, end):
+		'''Record one entry for lemma'''
+		
+		self.offsets.setdefault(lemma, []).append((lang, start, end))
+	
+	def save(self, file=None, quiet=0):
+		'''Save the offsets in pickle format'''
+		
+		file = file or EntryIndex.file
+		
+		if not quiet:
+			print 'Saving entry offsets to ' + file
+		
+		f = open(file, 'wb')
+		pickle.dump(self.offsets, f, 2)
+		f.close()
+	
+	@classmethod
+	def load(cls, file=None, quiet=0):
+		'''Load offsets saved by save()'''
+		
+		file = file or EntryIndex.file
+		
+		if not quiet:
+			print 'Loading entry offsets from ' + file
+		
+		f = open(file, 'rb')
+		offsets = pickle.load(f)
+		f.close()
+		
+		return cls(offsets)
+	
+	def raw(self, lemma):
+		'''The raw XML of each of lemma's entries, decoded'''
+		
+		entries = []
+		
+		for lang, start, end in self.offsets.get(lemma, []):
+			if lang not in self._maps:
+				self._maps[lang] = open_map(lexicon_file(lang))
+			
+			entries.append(self._maps[lang][start:end].decode('utf-8'))
+		
+		return entries
@@ -0,0 +1,226 @@
+#
+# forgiving headword lookup
+#
+# Headwords are keyed by a folded form: no accents or breathings,
+# lower case, j as i, v as u, final sigma as medial.  A query typed
+# without diacritics, or with the wrong ones, still finds its
+# headwords by a dictionary lookup.  The folded keys are also kept
+# sorted, for prefix completion, and broken into trigrams, to find
+# near misses by edit distance without looking at every key.
+#
+
+import os
+import bisect
+import pickle
+import unicodedata
+
+import numpy
+
+file_lookup = os.path.join('data', 'lookup_folded.pickle')
+
+# letters that fold together, besides accents and case
+
+_fold_table = dict((ord(a), b) for a, b in [
+	(u'j', u'i'),
+	(u'v', u'u'),
+	(u'\u03c2', u'\u03c3')
+])
+
+
+def fold(word):
+	'''The folded form of a word'''
+	
+	word = unicodedata.normalize('NFD', word.lower())
+	
+	word = u''.join(c for c in word if not unicodedata.combining(c))
+	
+	return word.translate(_fold_table)
+
+
+def trigrams(key):
+	'''The distinct trigrams of a key, padded at both ends'''
+	
+	padded = u'$$' + key + u'$'
+	
+	return set(padded[i:i+3] for i in range(len(padded) - 2))
+
+
+def edit_distance(a, b, limit):
+	'''Levenshtein distance between a and b, or limit + 1 if greater'''
+	
+	if abs(len(a) - len(b)) > limit:
+		return limit + 1
+	
+	prev = range(len(b) + 1)
+	
+	for i, ca in enumerate(a, 1):
+		cur = [i]
+		
+		for j, cb in enumerate(b, 1):
+			cur.append(min(prev[j] + 1, cur[j-1] + 1, prev[j-1] + (ca != cb)))
+		
+		if min(cur) > limit:
+			return limit + 1
+		
+		prev = cur
+	
+	return prev[-1]
+
+
+class HeadwordLookup:
+	'''Folded keys, their headwords, and a trigram index of the keys'''
+	
+	def __init__(self, keys, heads, grams, indptr, postings):
+	
+		# keys are sorted; heads[i] lists the headwords folding to keys[i]
+		
+		self.keys   = keys
+		self.heads  = heads
+		self.key_id = dict((k, i) for i, k in enumerate(keys))
+		self.length = numpy.array([len(k) for k in keys], dtype=numpy.int32)
+		
+		# the keys with trigram grams[g] are postings[indptr[g]:indptr[g+1]]
+		
+		self.grams    = grams
+		self.gram_id  = dict((g, i) for i, g in enumerate(grams))
+		self.indptr   = indptr
+		self.postings = postings
+	
+	def __len__(self):
+		
+		return sum(len(h) for h in self.heads)
+	
+	@classmethod
+	def build(cls, by_id, quiet=0):
+		'''Index a list of headwords'''
+		
+		if not quiet:
+			print 'Building folded headword lookup'
+		
+		folded = dict()
+		
+		for word in by_id:
+			folded.setdefault(fold(word), []).append(word)
+		
+		keys  = sorted(folded)
+		heads = [sorted(folded[k]) for k in keys]
+		
+		by_gram = dict()
+		
+		for i, k in enumerate(keys):
+			for g in trigrams(k):
+				by_gram.setdefault(g, []).append(i)
+		
+		grams = sorted(by_gram)
+		
+		indptr = numpy.cumsum([0] + [len(by_gram[g]) for g in grams]).astype(numpy.int64)
+		
+		postings = numpy.array([i for g in grams for i in by_gram[g]], dtype=numpy.int32)
+		
+		return cls(keys, heads, grams, indptr, postings)
+	
+	@classmethod
+	def load(cls, file=file_lookup, quiet=0):
+	
+		if not quiet:
+			print 'Loading folded headword lookup ' + file
+		
+		f = open(file, 'rb')
+		state = pickle.load(f)
+		f.close()
+		
+		return cls(state['keys'], state['heads'], state['grams'],
+					state['indptr'], state['postings'])
+	
+	def save(self, file=file_lookup, quiet=0):
+	
+		if not quiet:
+			print 'Saving folded headword lookup ' + file
+		
+		f = open(file, 'wb')
+		pickle.dump({'keys': self.keys, 'heads': self.heads, 'grams': self.grams,
+					'indptr': self.indptr, 'postings': self.postings}, f, 2)
+		f.close()
+	
+	def exact(self, word):
+		'''Headwords folding to the same key as word'''
+		
+		i = self.key_id.get(fold(word))
+		
+		return [] if i is None else self.heads[i]
+	
+	def prefix(self, word, n=10):
+		'''Up to n headwords whose folded form begins with word's'''
+		
+		key = fold(word)
+		
+		found = []
+		
+		i = bisect.bisect_left(self.keys, key)
+		
+		while i < len(self.keys) and self.keys[i].startswith(key) and len(found) < n:
+			found.extend(self.heads[i])
+			i += 1
+		
+		return found[:n]
+	
+	def similar(self, word, n=10, max_dist=2):
+		'''Up to n headwords nearest word, folded, within max_dist edits
+		
+		Tries one edit, then two, and so on, stopping at the first
+		distance with any headwords.  A key within d edits of the
+		query shares all but at most 3d of the query's trigrams, and
+		differs in length by at most d, so only keys passing both
+		tests are compared letter by letter.
+		'''
+		
+		key = fold(word)
+		qg  = [self.gram_id[g] for g in trigrams(key) if g in self.gram_id]
+		
+		if not qg:
+			return []
+		
+		cand, shared = numpy.unique(numpy.concatenate(
+			[self.postings[self.indptr[g]:self.indptr[g+1]] for g in qg]), return_counts=True)
+		
+		n_grams = len(trigrams(key))
+		
+		for d in range(1, max_dist + 1):
+			near = cand[(shared >= max(n_grams - 3 * d, 1)) &
+						(abs(self.length[cand] - len(key)) <= d)]
+			
+			scored = []
+			
+			for i in near:
+				dist = edit_distance(key, self.keys[i], d)
+				
+				if dist <= d:
+					scored.append((dist, self.keys[i], i))
+			
+			if scored:
+				found = []
+				
+				for dist, k, i in sorted(scored):
+					found.extend(self.heads[i])
+				
+				return found[:n]
+		
+		return []
+	
+	def resolve(self, word, n=10, max_dist=2):
+		'''Headwords a query may mean, and how they were found
+		
+		Returns (headwords, how), where how is 'folded', 'prefix',
+		'similar', or None if nothing was found.
+		'''
+		
+		for how, found in [
+				('folded',  lambda: self.exact(word)),
+				('prefix',  lambda: self.prefix(word, n)),
+				('similar', lambda: self.similar(word, n, max_dist))]:
+			heads = found()
+			
+			if heads:
+				return heads, how
+		
+		return [], None
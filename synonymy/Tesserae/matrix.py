@@ -0,0 +1,96 @@
+#
+# sparse matrix views of the gensim corpora
+#
+
+import numpy
+from scipy import sparse
+from gensim import corpora, matutils
+
+from Tesserae import tesslang
+
+
+def to_csr(corpus, num_terms):
+	'''Convert any gensim corpus to a headword x term CSR matrix'''
+	
+	csc = matutils.corpus2csc(corpus, 
+				num_terms = num_terms, 
+				num_docs  = len(corpus), 
+				dtype     = numpy.float32)
+	
+	csr = csc.T.tocsr()
+	csr.sort_indices()
+	
+	return csr
+
+
+def load_csr(file_corpus, quiet=0):
+	'''Read a Market Matrix corpus as a headword x term CSR matrix'''
+	
+	if not quiet:
+		print 'Loading corpus ' + file_corpus
+	
+	corpus = corpora.MmCorpus(file_corpus)
+	
+	return to_csr(corpus, corpus.num_terms)
+
+
+def to_corpus(csr):
+	'''Wrap a CSR matrix as a gensim corpus, one document per row'''
+	
+	return matutils.Sparse2Corpus(csr, documents_columns=False)
+
+
+def normalize(csr):
+	'''Scale each row to unit length'''
+	
+	norms = numpy.sqrt(numpy.asarray(csr.multiply(csr).sum(axis=1)).ravel())
+	norms[norms == 0] = 1
+	
+	return sparse.diags(1. / norms).dot(csr).tocsr().astype(numpy.float32)
+
+
+def save_mmap(csr, stem, quiet=0):
+	'''Save a CSR matrix as .npy arrays that can be memory-mapped'''
+	
+	if not quiet:
+		print 'Saving matrix as {}.*.npy'.format(stem)
+	
+	numpy.save(stem + '.data.npy', csr.data)
+	numpy.save(stem + '.indices.npy', csr.indices)
+	numpy.save(stem + '.indptr.npy', csr.indptr)
+	numpy.save(stem + '.shape.npy', numpy.array(csr.shape))
+
+
+def load_mmap(stem, quiet=0):
+	'''Memory-map a CSR matrix saved by save_mmap'''
+	
+	if not quiet:
+		print 'Mapping matrix {}.*.npy'.format(stem)
+	
+	data    = numpy.load(stem + '.data.npy', mmap_mode='r')
+	indices = numpy.load(stem + '.indices.npy', mmap_mode='r')
+	indptr  = numpy.load(stem + '.indptr.npy', mmap_mode='r')
+	shape   = tuple(numpy.load(stem + '.shape.npy'))
+	
+	return sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+def row(csr, i):
+	'''Return the term ids and weights of one row'''
+	
+	start, end = csr.indptr[i], csr.indptr[i+1]
+	
+	return csr.indices[start:end], csr.data[start:end]
+
+
+def row_keys(csr):
+	'''A hashable key per row, equal for rows with equal contents'''
+	
+	return [(csr.indices[s:e].tobytes(), csr.data[s:e].tobytes())
+				for s, e in zip(csr.indptr[:-1], csr.indptr[1:])]
+
+
+def greek_mask(by_id):
+	'''Boolean array, true where the headword is Greek'''
+	
+	return numpy.array([tesslang.is_greek(w) for w in by_id], dtype=bool)
@@ -0,0 +1,207 @@
+#
+# minhash signatures and banded LSH over headword term sets
+#
+
+import codecs
+import unicodedata
+
+import numpy
+from scipy import sparse
+
+from Tesserae import simjoin
+
+# a Mersenne prime larger than any term id
+
+PRIME = (1 << 31) - 1
+
+
+def read_flat(file):
+	'''Read dict.flat.txt: return headwords in order and their terms'''
+	
+	by_id = []
+	docs  = []
+	
+	f = codecs.open(file, encoding='utf8')
+	
+	for line in f:
+		head, short_def = line.split('\t')
+		
+		by_id.append(unicodedata.normalize('NFC', head))
+		docs.append(short_def.split())
+	
+	f.close()
+	
+	return by_id, docs
+
+
+def term_sets(docs):
+	'''A binary headword x term CSR matrix of each headword's term set'''
+	
+	vocab   = dict()
+	indices = []
+	indptr  = [0]
+	
+	for doc in docs:
+		for t in set(doc):
+			indices.append(vocab.setdefault(t, len(vocab)))
+		
+		indptr.append(len(indices))
+	
+	data = numpy.ones(len(indices), dtype=numpy.float32)
+	
+	csr = sparse.csr_matrix((data, indices, indptr), shape=(len(docs), len(vocab)))
+	csr.sort_indices()
+	
+	return csr
+
+
+def signatures(csr, num_perm=128, seed=0, chunk=16):
+	'''MinHash signatures, one row of num_perm values per headword
+	
+	Each permutation is a universal hash (a*t + b) mod PRIME of the
+	term id t; a headword's value is the minimum over its terms.
+	Headwords with no terms get PRIME in every column.
+	'''
+	
+	rng = numpy.random.RandomState(seed)
+	
+	a = rng.randint(1, PRIME, num_perm).astype(numpy.int64)
+	b = rng.randint(0, PRIME, num_perm).astype(numpy.int64)
+	
+	n = csr.shape[0]
+	
+	sig = numpy.full((n, num_perm), PRIME, dtype=numpy.uint32)
+	
+	has    = numpy.diff(csr.indptr) > 0
+	starts = csr.indptr[:-1][has]
+	terms  = csr.indices.astype(numpy.int64)
+	
+	if len(terms) == 0:
+		return sig
+	
+	# a few permutations at a time, to bound memory
+	
+	for i in range(0, num_perm, chunk):
+		h = (a[i:i+chunk, None] * terms[None, :] + b[i:i+chunk, None]) % PRIME
+		
+		sig[has, i:i+chunk] = numpy.minimum.reduceat(h, starts, axis=1).T
+	
+	return sig
+
+
+def band_pairs(sig, bands, rows, max_bucket=None):
+	'''Candidate pairs a < b sharing a bucket in at least one band
+	
+	Buckets holding more than max_bucket headwords are skipped;
+	they come from very common terms and say little.
+	'''
+	
+	n = sig.shape[0]
+	
+	valid = sig[:, 0] != PRIME
+	
+	found = []
+	
+	for band in range(bands):
+		block = numpy.ascontiguousarray(sig[:, band*rows:(band+1)*rows])
+		
+		# one opaque key per row of the band
+		
+		keys = block.view(numpy.dtype((numpy.void, block.dtype.itemsize * rows))).ravel()
+		
+		uniq, bucket, size = numpy.unique(keys,
+					return_inverse=True, return_counts=True)
+		
+		ok = valid & (size[bucket] > 1)
+		
+		if max_bucket is not None:
+			ok &= size[bucket] <= max_bucket
+		
+		docs = numpy.flatnonzero(ok)
+		docs = docs[numpy.argsort(bucket[docs], kind='mergesort')]
+		bk   = bucket[docs]
+		
+		if len(docs) == 0:
+			continue
+		
+		# pair each member with the one d places later in its bucket
+		
+		for d in range(1, size[bk].max()):
+			same = bk[d:] == bk[:-d]
+			
+			found.append(docs[:-d][same].astype(numpy.int64) * n + docs[d:][same])
+	
+	if not found:
+		return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+	
+	keys = numpy.unique(numpy.concatenate(found))
+	
+	return keys // n, keys % n
+
+
+def estimate(sig, a, b, chunk=100000):
+	'''Jaccard similarity estimated from the signatures'''
+	
+	out = numpy.empty(len(a), dtype=numpy.float32)
+	
+	for i in range(0, len(a), chunk):
+		j = slice(i, i + chunk)
+		out[j] = (sig[a[j]] == sig[b[j]]).mean(axis=1)
+	
+	return out
+
+
+def jaccard(csr, a, b, chunk=100000):
+	'''Exact Jaccard similarity of the term sets'''
+	
+	size = numpy.diff(csr.indptr)
+	
+	out = numpy.empty(len(a), dtype=numpy.float32)
+	
+	for i in range(0, len(a), chunk):
+		j = slice(i, i + chunk)
+		
+		inter = simjoin.rowwise_dot(csr, a[j], csr, b[j])
+		out[j] = inter / (size[a[j]] + size[b[j]] - inter)
+	
+	return out
+
+
+def to_pairs(a, b, score):
+	'''Pack candidate arrays as simjoin.PAIR records'''
+	
+	out = numpy.empty(len(a), dtype=simjoin.PAIR)
+	out['a']     = a
+	out['b']     = b
+	out['score'] = score
+	
+	return out
+
+
+def recall(sig, exact_a, exact_b, settings, max_bucket=None):
+	'''Recall of exact neighbour pairs under several band settings
+	
+	settings is a list of (bands, rows); exact_a, exact_b are the
+	pairs to be found.  Returns one tuple per setting:
+	(bands, rows, threshold, candidates, recall), where threshold is
+	the approximate Jaccard at which the chance of a hit is 1/2.
+	'''
+	
+	n = sig.shape[0]
+	
+	lo = numpy.minimum(exact_a, exact_b).astype(numpy.int64)
+	hi = numpy.maximum(exact_a, exact_b).astype(numpy.int64)
+	
+	target = numpy.unique(lo * n + hi)
+	
+	report = []
+	
+	for bands, rows in settings:
+		a, b = band_pairs(sig, bands, rows, max_bucket)
+		
+		hit = numpy.in1d(target, a * n + b, assume_unique=True)
+		
+		report.append((bands, rows, (1. / bands) ** (1. / rows), len(a),
+					hit.mean() if len(target) else 0.))
+	
+	return report
@@ -0,0 +1,96 @@
+#
+# mutual nearest neighbours across languages
+#
+# Latin headwords are scored against Greek ones only, and Greek
+# against Latin, a block of rows at a time, keeping the top k of each
+# as neighbours.topk does.  A Latin-Greek pair is mutual if each is
+# among the other's top k.  Both tables are flattened into packed
+# (latin, greek) keys, and the mutual pairs found by one sorted
+# search of the one in the other.
+#
+
+import numpy
+
+from Tesserae import neighbours
+from Tesserae import pairs
+from Tesserae import progressbar
+
+
+def cross_topk(csr, rows, cols, k, block=256, pr=None):
+	'''Top k of the columns cols for each of the rows, by cosine
+	
+	csr should have unit-length rows.  Returns ids, as indices
+	into cols, and scores, shaped as by neighbours.topk; ties
+	go to the lower id.
+	'''
+	
+	cols_t = csr[cols].T.tocsc()
+	
+	ids    = numpy.empty((len(rows), k), dtype=numpy.int32)
+	scores = numpy.empty((len(rows), k), dtype=numpy.float32)
+	
+	for i in range(0, len(rows), block):
+		j = slice(i, i + block)
+		
+		sims = csr[rows[j]].dot(cols_t).toarray()
+		
+		ids[j], scores[j] = neighbours.select_exact(sims, k)
+		
+		if pr is not None:
+			pr.advance(len(ids[j]))
+	
+	return ids, scores
+
+
+def flatten(ids, rows, cols):
+	'''Row ids, column ids and 1-based ranks of every link in a neighbour table'''
+	
+	found = ids >= 0
+	
+	a = numpy.repeat(rows, found.sum(axis=1))
+	b = cols[ids[found]]
+	
+	rank = numpy.nonzero(found)[1].astype(numpy.int32) + 1
+	
+	return a, b, rank
+
+
+def mutual(csr, greek, k, block=256, quiet=0):
+	'''Latin-Greek pairs each in the other's top k
+	
+	csr should have unit-length rows; greek is a boolean array, true
+	for the Greek rows.  Returns arrays of Latin ids, Greek ids,
+	scores, the Greek word's rank among the Latin's neighbours, and
+	the Latin word's among the Greek's, sorted by Latin id and rank.
+	'''
+	
+	la = numpy.nonzero(~greek)[0]
+	gr = numpy.nonzero(greek)[0]
+	
+	pr = progressbar.ProgressBar(len(la) + len(gr), quiet)
+	
+	la_ids, la_scores = cross_topk(csr, la, gr, k, block, pr)
+	gr_ids, gr_scores = cross_topk(csr, gr, la, k, block, pr)
+	
+	# every Latin -> Greek link, and every Greek -> Latin one turned round
+	
+	la_a, la_b, la_rank = flatten(la_ids, la, gr)
+	gr_b, gr_a, gr_rank = flatten(gr_ids, gr, la)
+	
+	fwd = (la_a.astype(numpy.int64) << 32) | la_b
+	rev = (gr_a.astype(numpy.int64) << 32) | gr_b
+	
+	order = numpy.argsort(rev)
+	rev   = rev[order]
+	
+	pos = numpy.searchsorted(rev, fwd)
+	pos[pos == len(rev)] = 0
+	
+	hit = (rev[pos] == fwd) if len(rev) else numpy.zeros(len(fwd), dtype=bool)
+	
+	latin, greek_ids = pairs.unpack(fwd[hit])
+	
+	return (latin, greek_ids,
+			la_scores[la_ids >= 0][hit],
+			la_rank[hit],
+			gr_rank[order][pos[hit]])
@@ -0,0 +1,167 @@
+#
+# the top-k neighbour store
+#
+# For every headword, the ids and cosine similarities of its k most
+# similar headwords, best first, not counting itself.  Rows with
+# fewer than k neighbours scoring above zero are padded with id -1.
+#
+
+import os
+
+import numpy
+
+from Tesserae import progressbar
+
+
+def topk_block(csr, csr_t, rows, k, dtype=numpy.float32):
+	'''Top k neighbours of the given rows; csr_t is csr transposed
+	
+	Scores are compared as dtype; float16 halves the dense block.
+	'''
+	
+	rows = numpy.asarray(rows)
+	
+	prod = csr[rows].dot(csr_t)
+	
+	if dtype == numpy.float32:
+		sims = prod.toarray()
+	else:
+		# scipy can't densify to float16, so fill the rows by hand
+		
+		sims = numpy.zeros(prod.shape, dtype=dtype)
+		
+		sims[numpy.repeat(numpy.arange(prod.shape[0]), numpy.diff(prod.indptr)),
+				prod.indices] = prod.data
+	
+	# never return the query itself
+	
+	sims[numpy.arange(len(rows)), rows] = 0
+	
+	return select(sims, k)
+
+
+def select(sims, k):
+	'''Ids and scores of the k best columns in each row of sims'''
+	
+	r = numpy.arange(sims.shape[0])[:, None]
+	
+	kk = min(k, sims.shape[1])
+	
+	if kk < sims.shape[1]:
+		cand = numpy.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+	else:
+		cand = numpy.tile(numpy.arange(kk), (sims.shape[0], 1))
+	
+	scores = sims[r, cand]
+	
+	order  = numpy.argsort(-scores, axis=1, kind='mergesort')
+	cand   = cand[r, order]
+	scores = scores[r, order]
+	
+	ids = numpy.full((sims.shape[0], k), -1, dtype=numpy.int32)
+	out = numpy.zeros((sims.shape[0], k), dtype=numpy.float32)
+	
+	ids[:, :kk] = cand
+	out[:, :kk] = scores
+	
+	empty = out <= 0
+	
+	ids[empty] = -1
+	out[empty] = 0
+	
+	return ids, out
+
+
+def select_exact(sims, k, positive=True):
+	'''As select, but with ties broken by id, lowest first
+	
+	Everything better than a row's k-th best score is taken, and as
+	many tied with it as fit, so the same sims always give the same
+	neighbours in the same order.  Unless positive is false, hits
+	scoring zero or less are left out.
+	'''
+	
+	r = numpy.arange(sims.shape[0])[:, None]
+	
+	kk = min(k, sims.shape[1])
+	
+	ids = numpy.full((sims.shape[0], k), -1, dtype=numpy.int32)
+	out = numpy.zeros((sims.shape[0], k), dtype=numpy.float32)
+	
+	if kk == 0:
+		return ids, out
+	
+	t = -numpy.partition(-sims, kk - 1, axis=1)[:, kk - 1:kk]
+	
+	above = sims > t
+	tied  = sims == t
+	
+	need = kk - above.sum(axis=1)[:, None]
+	
+	chosen = above | (tied & (numpy.cumsum(tied, axis=1) <= need))
+	
+	cand  = numpy.nonzero(chosen)[1].reshape(sims.shape[0], kk)
+	order = numpy.argsort(-sims[r, cand], axis=1, kind='mergesort')
+	cand  = cand[r, order]
+	
+	ids[:, :kk] = cand
+	out[:, :kk] = sims[r, cand]
+	
+	if positive:
+		empty = out <= 0
+		
+		ids[empty] = -1
+		out[empty] = 0
+	
+	return ids, out
+
+
+def topk(csr, k, rows=None, block=256, quiet=0, dtype=numpy.float32):
+	'''Top k neighbours for rows (default all) of a unit-length CSR matrix'''
+	
+	if rows is None:
+		rows = numpy.arange(csr.shape[0])
+	
+	csr_t = csr.T.tocsc()
+	
+	ids    = numpy.empty((len(rows), k), dtype=numpy.int32)
+	scores = numpy.empty((len(rows), k), dtype=numpy.float32)
+	
+	pr = progressbar.ProgressBar(len(rows), quiet)
+	
+	for i in range(0, len(rows), block):
+		j = slice(i, i + block)
+		
+		ids[j], scores[j] = topk_block(csr, csr_t, rows[j], k, dtype)
+		
+		pr.advance(len(ids[j]))
+	
+	return ids, scores
+
+
+def save(ids, scores, stem=os.path.join('data', 'neighbours'), quiet=0):
+	'''Save a neighbour table as stem.ids.npy and stem.scores.npy'''
+	
+	if not quiet:
+		print 'Saving neighbours as {}.*.npy'.format(stem)
+	
+	numpy.save(stem + '.ids.npy', ids)
+	numpy.save(stem + '.scores.npy', scores)
+
+
+def load(stem=os.path.join('data', 'neighbours'), mmap_mode='r', quiet=0):
+	'''Load a neighbour table, memory-mapped by default'''
+	
+	if not quiet:
+		print 'Loading neighbours from {}.*.npy'.format(stem)
+	
+	ids    = numpy.load(stem + '.ids.npy', mmap_mode=mmap_mode)
+	scores = numpy.load(stem + '.scores.npy', mmap_mode=mmap_mode)
+	
+	return ids, scores
+
+
+def exists(stem=os.path.join('data', 'neighbours')):
+	'''Whether a neighbour table has been saved'''
+	
+	return os.path.exists(stem + '.ids.npy') and os.path.exists(stem + '.scores.npy')
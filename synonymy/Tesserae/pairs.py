@@ -0,0 +1,237 @@
+#
+# pairs of headwords purported to be synonyms, in NumPy columns
+#
+# Each pair of ids (a < b) is packed into a single int64, a << 32 | b.
+# Synsets are added as arrays of ids; finish() sorts the collected
+# (pair, synset) memberships, drops duplicates, and leaves one row per
+# distinct pair with its synsets given by offsets into a flat array.
+#
+
+import re
+import codecs
+import unicodedata
+
+import numpy
+
+
+def pack(a, b):
+	'''Pack arrays of ids into int64 pair keys, smaller id first'''
+	
+	a = numpy.asarray(a, dtype=numpy.int64)
+	b = numpy.asarray(b, dtype=numpy.int64)
+	
+	return (numpy.minimum(a, b) << 32) | numpy.maximum(a, b)
+
+
+def unpack(keys):
+	'''Split pair keys back into arrays of ids'''
+	
+	keys = numpy.asarray(keys, dtype=numpy.int64)
+	
+	return (keys >> 32).astype(numpy.int32), (keys & 0xffffffff).astype(numpy.int32)
+
+
+class PairStore:
+	'''Synonym pairs, their synsets, similarities and ranks
+	
+	After finish(), for pair i:
+	   a[i], b[i]     ids, a < b
+	   synsets[offsets[i]:offsets[i+1]]
+	                  the synsets joining them
+	   sim[i]         similarity of b in a's results; NaN if unknown
+	   ranka[i]       rank of b in a's results; -1 if unknown
+	   rankb[i]       rank of a in b's results; -1 if unknown
+	'''
+	
+	def __init__(self):
+	
+		self._keys = []
+		self._sets = []
+		
+		self.keys = None
+	
+	def __len__(self):
+	
+		return 0 if self.keys is None else len(self.keys)
+	
+	def add_synset(self, n, ids):
+		'''Add every pair of distinct ids as joined by synset n'''
+		
+		ids = numpy.unique(numpy.asarray(ids, dtype=numpy.int64))
+		
+		i, j = numpy.triu_indices(len(ids), 1)
+		
+		self._keys.append(pack(ids[i], ids[j]))
+		self._sets.append(numpy.repeat(numpy.int32(n), len(i)))
+	
+	def finish(self):
+		'''Deduplicate the memberships and set up the columns'''
+		
+		keys = numpy.concatenate(self._keys) if self._keys else numpy.zeros(0, dtype=numpy.int64)
+		sets = numpy.concatenate(self._sets) if self._sets else numpy.zeros(0, dtype=numpy.int32)
+		
+		self._keys = []
+		self._sets = []
+		
+		# sort by pair, then synset; drop repeats of both
+		
+		order = numpy.lexsort((sets, keys))
+		keys  = keys[order]
+		sets  = sets[order]
+		
+		new = numpy.ones(len(keys), dtype=bool)
+		new[1:] = (keys[1:] != keys[:-1]) | (sets[1:] != sets[:-1])
+		
+		keys = keys[new]
+		sets = sets[new]
+		
+		# one row per distinct pair
+		
+		first = numpy.ones(len(keys), dtype=bool)
+		first[1:] = keys[1:] != keys[:-1]
+		
+		self.keys    = keys[first]
+		self.synsets = sets
+		self.offsets = numpy.append(numpy.flatnonzero(first), len(keys))
+		
+		self.a, self.b = unpack(self.keys)
+		
+		# each id's pairs, for lookup to find by binary search
+		
+		self.by_a = numpy.argsort(self.a, kind='mergesort')
+		self.by_b = numpy.argsort(self.b, kind='mergesort')
+		
+		self.sorted_a = self.a[self.by_a]
+		self.sorted_b = self.b[self.by_b]
+		
+		self.sim   = numpy.empty(len(self.keys), dtype=numpy.float32)
+		self.sim.fill(numpy.nan)
+		self.ranka = -numpy.ones(len(self.keys), dtype=numpy.int32)
+		self.rankb = -numpy.ones(len(self.keys), dtype=numpy.int32)
+	
+	def synsets_of(self, i):
+		'''The synsets joining pair i'''
+		
+		return self.synsets[self.offsets[i]:self.offsets[i+1]]
+	
+	def queries(self, n_ids):
+		'''The distinct ids below n_ids found in any pair'''
+		
+		ids = numpy.unique(numpy.concatenate([self.a, self.b]))
+		
+		return ids[ids < n_ids]
+	
+	def lookup(self, get_ranks, n_ids, pr=None, queries=None):
+		'''Fill sim and ranks, querying each id only once
+		
+		get_ranks(id) returns the similarities of every id to the
+		query and the rank of each in its results.  Only ids below
+		n_ids are queried; given queries, a part of queries(n_ids),
+		only the pairs' entries for those are filled in.
+		'''
+		
+		by_a, sorted_a = self.by_a, self.sorted_a
+		by_b, sorted_b = self.by_b, self.sorted_b
+		
+		if queries is None:
+			queries = self.queries(n_ids)
+		
+		for q in queries:
+			if pr is not None:
+				pr.advance()
+			
+			sims, rank = get_ranks(q)
+			
+			# pairs where q is the smaller id
+			
+			sel = by_a[numpy.searchsorted(sorted_a, q):numpy.searchsorted(sorted_a, q, 'right')]
+			sel = sel[self.b[sel] < n_ids]
+			
+			self.sim[sel]   = sims[self.b[sel]]
+			self.ranka[sel] = rank[self.b[sel]]
+			
+			# pairs where q is the larger
+			
+			sel = by_b[numpy.searchsorted(sorted_b, q):numpy.searchsorted(sorted_b, q, 'right')]
+			sel = sel[self.a[sel] < n_ids]
+			
+			self.rankb[sel] = rank[self.a[sel]]
+
+
+def read_synsets(file, pr=None):
+	'''Yield synset number and NFC-normalized words for each synset
+	
+	The file has one synset per line, beginning <synset no="N">,
+	with each word in <grcword></grcword>.
+	'''
+	
+	f = codecs.open(file, encoding='utf_8')
+	
+	for line in f:
+		if pr is not None:
+			pr.advance(len(line.encode('utf-8')))
+		
+		m = re.match(r'<synset no="(\d+)">', line)
+		
+		# skip lines that don't match synset format
+		
+		if m is None:
+			continue
+		
+		nodes = re.findall('<grcword>(.+?)</grcword>', line)
+		
+		yield int(m.group(1)), [unicodedata.normalize('NFC', node) for node in nodes]
+	
+	f.close()
+
+
+def from_synsets(synsets, lookup, n_known):
+	'''A finished PairStore for (number, words) records
+	
+	lookup(word) gives a word's id, or None if it isn't among the
+	n_known headwords; such words get ids from n_known up and are
+	listed, in order, in the store's attribute extra.
+	'''
+	
+	store = PairStore()
+	
+	unknown = dict()
+	
+	for n, words in synsets:
+		ids = []
+		
+		for word in words:
+			id = lookup(word)
+			
+			if id is None:
+				id = unknown.setdefault(word, n_known + len(unknown))
+			
+			ids.append(id)
+		
+		# every possible pair is joined by this synset
+		
+		store.add_synset(n, ids)
+	
+	store.finish()
+	
+	store.n_known = n_known
+	store.extra   = sorted(unknown, key=unknown.get)
+	
+	return store
+
+
+def matrix_ranks(csr):
+	'''A get_ranks function for PairStore.lookup over a row-normalized matrix'''
+	
+	def get_ranks(id):
+	
+		sims = numpy.asarray(csr.dot(csr[id].T).todense()).ravel()
+		
+		order = numpy.argsort(-sims, kind='mergesort')
+		
+		rank = numpy.empty(len(order), dtype=numpy.int32)
+		rank[order] = numpy.arange(len(order), dtype=numpy.int32)
+		
+		return sims, rank
+	
+	return get_ranks
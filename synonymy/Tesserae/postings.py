@@ -0,0 +1,143 @@
+#
+# inverted-index scoring of sparse headword vectors
+#
+
+import numpy
+
+from Tesserae import matrix
+
+
+class PostingsIndex:
+	'''Term -> (headword id, weight) posting lists over a CSR corpus
+	
+	Scores are accumulated only over the postings of the query's
+	own terms, so the cost of a query depends on the length of those
+	lists rather than on the number of headwords.  Terms occurring in
+	more than max_df (a fraction of all headwords) can be pruned; this
+	drops their contribution from every score.
+	'''
+	
+	def __init__(self, csr, max_df=None, quiet=0):
+		
+		if not quiet:
+			print 'Building posting lists'
+		
+		self.rows = csr
+		self.n_docs, self.n_terms = csr.shape
+		
+		csc = csr.tocsc()
+		csc.sort_indices()
+		
+		self.indptr  = csc.indptr
+		self.docs    = csc.indices
+		self.weights = csc.data.astype(numpy.float32)
+		self.df      = numpy.diff(self.indptr)
+		
+		# largest weight in each list: an upper bound on what
+		# the term can add to any headword's score
+		
+		self.max_weight = numpy.zeros(self.n_terms, dtype=numpy.float32)
+		
+		nonempty = self.df > 0
+		
+		if nonempty.any():
+			self.max_weight[nonempty] = numpy.maximum.reduceat(
+				self.weights, self.indptr[:-1][nonempty])
+		
+		# optionally prune very common terms
+		
+		self.active = nonempty
+		
+		if max_df is not None:
+			self.active = self.active & (self.df <= max_df * self.n_docs)
+			
+			if not quiet:
+				print 'Pruned {} terms with df > {}'.format(
+					int((nonempty & ~self.active).sum()), 
+					int(max_df * self.n_docs))
+		
+		# scratch space, reset after every query
+		
+		self._acc  = numpy.zeros(self.n_docs, dtype=numpy.float32)
+		self._seen = numpy.zeros(self.n_docs, dtype=bool)
+	
+	def search(self, terms, weights, n=None, max_score=False):
+		'''Score a query vector; return ids, scores best first
+		
+		With max_score, once the n-th best score exceeds the most 
+		that the remaining terms could add, headwords not yet seen 
+		can no longer reach the top n and are ignored.
+		'''
+		
+		keep    = self.active[terms]
+		terms   = terms[keep]
+		weights = numpy.asarray(weights, dtype=numpy.float32)[keep]
+		
+		# take the terms in order of their maximum contribution
+		
+		bounds = weights * self.max_weight[terms]
+		order  = numpy.argsort(-bounds)
+		
+		terms, weights, bounds = terms[order], weights[order], bounds[order]
+		
+		remaining = numpy.cumsum(bounds[::-1])[::-1]
+		
+		acc  = self._acc
+		seen = self._seen
+		
+		found  = []
+		n_seen = 0
+		closed = False
+		
+		for i in range(len(terms)):
+			
+			if max_score and n and not closed and n_seen >= n:
+				scores = acc[numpy.concatenate(found)]
+				kth = numpy.partition(scores, n_seen - n)[n_seen - n]
+				
+				closed = kth > remaining[i]
+			
+			start, end = self.indptr[terms[i]], self.indptr[terms[i]+1]
+			
+			docs = self.docs[start:end]
+			post = self.weights[start:end]
+			
+			if closed:
+				mask = seen[docs]
+				docs = docs[mask]
+				post = post[mask]
+			else:
+				new = docs[~seen[docs]]
+				seen[new] = True
+				n_seen += len(new)
+				found.append(new)
+			
+			acc[docs] += weights[i] * post
+		
+		if n_seen == 0:
+			return numpy.zeros(0, dtype=numpy.int32), numpy.zeros(0, dtype=numpy.float32)
+		
+		ids    = numpy.concatenate(found)
+		scores = acc[ids]
+		
+		acc[ids]  = 0
+		seen[ids] = False
+		
+		# select and sort the top n
+		
+		if n is not None and n < len(ids):
+			top = numpy.argpartition(-scores, n)[:n]
+			ids, scores = ids[top], scores[top]
+		
+		order = numpy.argsort(-scores, kind='mergesort')
+		
+		return ids[order], scores[order]
+	
+	def get_sims(self, q_id, n=None, max_score=False):
+		'''Top n (id, score) pairs for headword q_id'''
+		
+		terms, weights = matrix.row(self.rows, q_id)
+		
+		ids, scores = self.search(terms, weights, n, max_score)
+		
+		return zip(ids, scores)
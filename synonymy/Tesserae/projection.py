@@ -0,0 +1,93 @@
+#
+# sparse random projection of the weighted corpus
+#
+# A cheap alternative to LSI.  Each term gets a random, very sparse
+# vector of +s and -s (Li, Hastie and Church's "very sparse" random
+# projection, density 1/sqrt(number of terms)), and each headword's
+# vector is the weighted sum of its terms'.  Cosine similarities are
+# preserved approximately; nothing is fitted, so the corpus is
+# projected in one pass over its rows, and a given seed always gives
+# the same vectors.
+#
+
+import os
+
+import numpy
+from scipy import sparse
+
+from Tesserae import progressbar
+
+file_projected = os.path.join('data', 'corpus_rp.npy')
+
+
+def random_matrix(n_terms, dims, seed=0, density=None, block=4096):
+	'''Sparse n_terms x dims projection matrix, drawn block by block'''
+	
+	if density is None:
+		density = 1. / numpy.sqrt(max(n_terms, 1))
+	
+	density = min(density, 1.)
+	
+	# scaled so that projected lengths are right on average
+	
+	scale = numpy.float32(1. / numpy.sqrt(density * dims))
+	
+	rng = numpy.random.RandomState(seed)
+	
+	blocks = []
+	
+	for i in range(0, n_terms, block):
+		rows = min(block, n_terms - i)
+		
+		mask  = rng.random_sample((rows, dims)) < density
+		signs = rng.randint(0, 2, size=(rows, dims)) * 2 - 1
+		
+		blocks.append(sparse.csr_matrix(numpy.where(mask, signs * scale, 0).astype(numpy.float32)))
+	
+	if not blocks:
+		return sparse.csr_matrix((0, dims), dtype=numpy.float32)
+	
+	return sparse.vstack(blocks).tocsr()
+
+
+def project(csr, dims, seed=0, file=file_projected, block=4096, quiet=0):
+	'''Project the rows of csr onto dims random dimensions
+	
+	Rows are projected a block at a time, straight into a float32
+	.npy file, which is returned memory-mapped.  With file None,
+	the result is kept in memory instead.
+	'''
+	
+	proj = random_matrix(csr.shape[1], dims, seed)
+	
+	if file is None:
+		out = numpy.empty((csr.shape[0], dims), dtype=numpy.float32)
+	else:
+		if not quiet:
+			print 'Saving projected corpus as ' + file
+		
+		out = numpy.lib.format.open_memmap(file, mode='w+', dtype=numpy.float32,
+											shape=(csr.shape[0], dims))
+	
+	pr = progressbar.ProgressBar(csr.shape[0], quiet)
+	
+	for i in range(0, csr.shape[0], block):
+		j = min(i + block, csr.shape[0])
+		
+		out[i:j] = csr[i:j].dot(proj).toarray()
+		
+		pr.advance(j - i)
+	
+	if file is None:
+		return out
+	
+	out.flush()
+	del out
+	
+	return load(file)
+
+
+def load(file=file_projected):
+	'''The projected corpus, memory-mapped'''
+	
+	return numpy.load(file, mmap_mode='r')
@@ -0,0 +1,115 @@
+#
+# cross-references between lexicon entries
+#
+# Many entries have no definition of their own, only an <xr> pointing
+# at another headword.  The readers record each entry's id and any
+# cross-references as they go; once all entries are in memory, the
+# redirects form a graph over standardized headwords, and each chain
+# is followed to a headword that has definitions.
+#
+
+
+class Redirects:
+	'''Cross-references collected while the lexica are read
+	
+	ids maps (lang, entry id) to the standardized headword of that
+	entry; refs maps each headword to a list of (lang, target id,
+	target headword), target id or headword being None where the
+	lexicon doesn't give it.
+	'''
+	
+	def __init__(self):
+	
+		self.ids  = dict()
+		self.refs = dict()
+	
+	def __len__(self):
+	
+		return len(self.refs)
+	
+	def add(self, lemma, lang, entry_id, targets=()):
+		'''Record an entry's id and its cross-references'''
+		
+		if entry_id is not None:
+			self.ids[(lang, entry_id)] = lemma
+		
+		for target_id, word in targets:
+			self.refs.setdefault(lemma, []).append((lang, target_id, word))
+	
+	def graph(self, has_defs):
+		'''One edge for each headword without definitions of its own
+		
+		A target given by entry id is preferred to one given by name;
+		the first target that is itself a headword is taken.
+		'''
+		
+		edges = dict()
+		
+		for lemma, targets in self.refs.iteritems():
+			if has_defs(lemma):
+				continue
+			
+			for lang, target_id, word in targets:
+				target = self.ids.get((lang, target_id), word)
+				
+				if target is None or target == lemma:
+					continue
+				
+				if has_defs(target) or target in self.refs:
+					edges[lemma] = target
+					break
+		
+		return edges
+	
+	def resolve(self, has_defs):
+		'''Follow each chain of redirects to a headword with definitions
+		
+		Every headword on a chain is settled when the chain is, so
+		each edge is followed once.  Returns a dict mapping redirecting
+		headwords to their final targets, and a dict counting those
+		resolved and those lost in cycles or at dead ends.
+		'''
+		
+		edges = self.graph(has_defs)
+		
+		final = dict()
+		stats = {'resolved': 0, 'cycles': 0, 'dangling': 0}
+		
+		for start in edges:
+			path    = []
+			on_path = set()
+			node    = start
+			
+			while True:
+				if node in final:
+					end, why = final[node]
+					break
+				
+				if has_defs(node):
+					end, why = node, 'resolved'
+					break
+				
+				if node in on_path:
+					end, why = None, 'cycles'
+					break
+				
+				if node not in edges:
+					end, why = None, 'dangling'
+					break
+				
+				path.append(node)
+				on_path.add(node)
+				node = edges[node]
+			
+			for n in path:
+				final[n] = (end, why)
+		
+		targets = dict()
+		
+		for lemma, (end, why) in final.iteritems():
+			stats[why] += 1
+			
+			if end is not None:
+				targets[lemma] = end
+		
+		return targets, stats
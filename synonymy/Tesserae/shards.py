@@ -0,0 +1,152 @@
+#
+# top-k neighbours computed in row-range shards
+#
+# Shard i of N (counting from 1) covers rows [(i-1)*n/N, i*n/N) of
+# the memory-mapped corpus and writes its own neighbour file, so
+# shards can run as separate processes or on separate machines
+# sharing a filesystem.  merge() checks that a complete set of
+# shards is present and assembles the global neighbour table.
+#
+
+import os
+import pickle
+
+import numpy
+
+from Tesserae import neighbours
+
+
+def parse(spec):
+	'''Turn "i/N" into (i, N)'''
+	
+	try:
+		i, n = [int(x) for x in spec.split('/')]
+	except ValueError:
+		raise ValueError('shard must be given as i/N, not ' + spec)
+	
+	if n < 1 or not 1 <= i <= n:
+		raise ValueError('shard {} is out of range'.format(spec))
+	
+	return i, n
+
+
+def row_range(i, n_shards, n_rows):
+	'''The rows covered by shard i of n_shards'''
+	
+	return (i - 1) * n_rows // n_shards, i * n_rows // n_shards
+
+
+def stem(dir, i, n_shards):
+	'''Where shard i of n_shards keeps its results'''
+	
+	return os.path.join(dir, 'neighbours.{0}of{1}'.format(i, n_shards))
+
+
+def replace(file, write):
+	'''Call write on a temporary file, then rename it to file
+	
+	The data is synced first, so file is either the old one or
+	the complete new one, never half written.
+	'''
+	
+	tmp = file + '.tmp'
+	
+	f = open(tmp, 'wb')
+	write(f)
+	f.flush()
+	os.fsync(f.fileno())
+	f.close()
+	
+	os.rename(tmp, file)
+
+
+def run(csr, i, n_shards, k, dir, block=256, quiet=0):
+	'''Compute and save the top k neighbours for one shard'''
+	
+	start, end = row_range(i, n_shards, csr.shape[0])
+	
+	if not quiet:
+		print 'Shard {0}/{1}: rows {2} to {3}'.format(i, n_shards, start, end - 1)
+	
+	ids, scores = neighbours.topk(csr, k, numpy.arange(start, end), block, quiet)
+	
+	if not os.path.isdir(dir):
+		os.makedirs(dir)
+	
+	s = stem(dir, i, n_shards)
+	
+	# the old meta would vouch for files half rewritten
+	
+	if os.path.exists(s + '.meta.pickle'):
+		os.remove(s + '.meta.pickle')
+	
+	if not quiet:
+		print 'Saving neighbours as {}.*.npy'.format(s)
+	
+	replace(s + '.ids.npy', lambda f: numpy.save(f, ids))
+	replace(s + '.scores.npy', lambda f: numpy.save(f, scores))
+	
+	# written last, so a shard without it is incomplete
+	
+	meta = {'start': start, 'end': end, 'k': k, 'rows': csr.shape[0], 'nnz': csr.nnz}
+	
+	replace(s + '.meta.pickle', lambda f: pickle.dump(meta, f))
+
+
+def merge(dir, n_shards, quiet=0):
+	'''Check that shards 1..n_shards cover every row; join them
+	
+	Raises ValueError naming the first problem found.
+	'''
+	
+	meta = []
+	
+	for i in range(1, n_shards + 1):
+		file_meta = stem(dir, i, n_shards) + '.meta.pickle'
+		
+		if not os.path.exists(file_meta):
+			raise ValueError('shard {0}/{1} is missing or unfinished'.format(i, n_shards))
+		
+		f = open(file_meta, 'rb')
+		meta.append(pickle.load(f))
+		f.close()
+	
+	# all from the same corpus, with the same k
+	
+	for key in ('rows', 'nnz', 'k'):
+		if len(set(m[key] for m in meta)) > 1:
+			raise ValueError('shards disagree about ' + key)
+	
+	n_rows = meta[0]['rows']
+	k      = meta[0]['k']
+	
+	# contiguous and complete
+	
+	expect = 0
+	
+	for i, m in enumerate(meta):
+		if m['start'] != expect:
+			raise ValueError('shard {0}/{1} starts at row {2}, expected {3}'.format(
+				i + 1, n_shards, m['start'], expect))
+		
+		expect = m['end']
+	
+	if expect != n_rows:
+		raise ValueError('shards end at row {0} of {1}'.format(expect, n_rows))
+	
+	ids    = numpy.empty((n_rows, k), dtype=numpy.int32)
+	scores = numpy.empty((n_rows, k), dtype=numpy.float32)
+	
+	for i, m in enumerate(meta):
+		try:
+			s_ids, s_scores = neighbours.load(stem(dir, i + 1, n_shards), quiet=quiet)
+		except (IOError, ValueError) as err:
+			raise ValueError('shard {0}/{1} is unreadable: {2}'.format(i + 1, n_shards, err))
+		
+		if s_ids.shape != (m['end'] - m['start'], k):
+			raise ValueError('shard {0}/{1} has the wrong shape'.format(i + 1, n_shards))
+		
+		ids[m['start']:m['end']]    = s_ids
+		scores[m['start']:m['end']] = s_scores
+	
+	return ids, scores
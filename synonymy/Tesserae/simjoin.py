@@ -0,0 +1,255 @@
+#
+# all-pairs similarity join with prefix filtering
+#
+
+import os
+import codecs
+import shutil
+import multiprocessing
+
+import numpy
+from scipy import sparse
+
+from Tesserae import progressbar
+
+# one record per similar pair
+
+PAIR = numpy.dtype([('a', '<i4'), ('b', '<i4'), ('score', '<f4')])
+
+# slack for rounding error in the filters
+
+EPS = 1e-6
+
+
+def split_prefix(csr, max_weight, threshold):
+	'''Divide each row into an unindexed prefix and an indexed suffix
+	
+	Features are taken in decreasing order of document frequency.
+	A row's prefix is the longest run whose upper bound against any
+	query, sum(w * max_weight), stays below threshold; a pair scoring
+	at least threshold must therefore share a feature in the suffix.
+	Returns the prefix and suffix matrices and each row's prefix bound.
+	'''
+	
+	n, m = csr.shape
+	lengths = numpy.diff(csr.indptr)
+	
+	df = numpy.bincount(csr.indices, minlength=m)
+	rank = numpy.empty(m, dtype=numpy.int64)
+	rank[numpy.argsort(-df, kind='mergesort')] = numpy.arange(m)
+	
+	rows  = numpy.repeat(numpy.arange(n), lengths)
+	order = numpy.lexsort((rank[csr.indices], rows))
+	
+	cols = csr.indices[order]
+	data = csr.data[order]
+	
+	# running bound within each row
+	
+	bound = data.astype(numpy.float64) * max_weight[cols]
+	cum   = numpy.cumsum(bound)
+	base  = numpy.concatenate([[0], cum])[csr.indptr[:-1]]
+	cum  -= numpy.repeat(base, lengths)
+	
+	prefix = cum < threshold - EPS
+	
+	pscore = numpy.bincount(rows[prefix], weights=bound[prefix], minlength=n)
+	
+	def part(mask):
+		return sparse.csr_matrix((data[mask], (rows[mask], cols[mask])),
+					shape=(n, m), dtype=numpy.float32)
+	
+	return part(prefix), part(~prefix), pscore
+
+
+def rowwise_dot(a, rows_a, b, rows_b):
+	'''Dot products of a[rows_a[i]] with b[rows_b[i]] for each i'''
+	
+	if len(rows_a) == 0:
+		return numpy.zeros(0)
+	
+	return numpy.asarray(a[rows_a].multiply(b[rows_b]).sum(axis=1)).ravel()
+
+
+class SimJoin:
+	'''Find every pair of rows with cosine >= threshold
+	
+	Rows are assumed to be non-negative and unit length, as in the
+	tf-idf corpus.  If targets is None, pairs are sought within
+	queries, each reported once with a < b; otherwise pairs run from
+	queries to targets (e.g. Latin x Greek).
+	'''
+	
+	def __init__(self, csr, threshold, queries=None, targets=None):
+	
+		n = csr.shape[0]
+		
+		self.threshold = threshold
+		self.csr       = csr
+		self.queries   = numpy.arange(n) if queries is None else numpy.asarray(queries)
+		self.within    = targets is None
+		
+		# per-feature maximum over the query side
+		
+		q_rows = csr[self.queries]
+		
+		max_weight = numpy.zeros(csr.shape[1])
+		
+		if q_rows.nnz:
+			numpy.maximum.at(max_weight, q_rows.indices, q_rows.data)
+		
+		# the index side; rows not in targets are emptied
+		
+		if targets is None:
+			t_rows = csr
+		else:
+			keep = numpy.zeros(n, dtype=numpy.float32)
+			keep[targets] = 1
+			t_rows = sparse.diags(keep).dot(csr).tocsr()
+			t_rows.eliminate_zeros()
+		
+		self.prefix, suffix, self.pscore = split_prefix(t_rows, max_weight, threshold)
+		self.suffix_t = suffix.T.tocsr()
+		
+		# per-row size and largest weight, for the size filter
+		
+		self.nnz  = numpy.diff(csr.indptr)
+		self.vmax = numpy.zeros(n)
+		
+		has = self.nnz > 0
+		
+		if has.any():
+			self.vmax[has] = numpy.maximum.reduceat(csr.data, csr.indptr[:-1][has])
+	
+	def join_block(self, start, end):
+		'''Join queries[start:end] against the index; return PAIR records'''
+		
+		q_ids = self.queries[start:end]
+		Q = self.csr[q_ids]
+		
+		# partial scores from the indexed suffixes
+		
+		A = Q.dot(self.suffix_t).tocoo()
+		
+		qi, b, partial = A.row, A.col, A.data
+		a = q_ids[qi]
+		
+		keep = partial + self.pscore[b] >= self.threshold - EPS
+		
+		if self.within:
+			keep &= b > a
+		
+		# size filter: x.y <= min(|x|, |y|) * max(x) * max(y)
+		
+		keep &= (numpy.minimum(self.nnz[a], self.nnz[b])
+					* self.vmax[a] * self.vmax[b] >= self.threshold - EPS)
+		
+		qi, a, b, partial = qi[keep], a[keep], b[keep], partial[keep]
+		
+		# add in the unindexed prefixes for the survivors
+		
+		score = partial + rowwise_dot(Q, qi, self.prefix, b)
+		
+		keep = score >= self.threshold
+		
+		out = numpy.empty(keep.sum(), dtype=PAIR)
+		out['a']     = a[keep]
+		out['b']     = b[keep]
+		out['score'] = score[keep]
+		
+		return out
+
+
+#
+# parallel driver
+#
+
+# set before the pool forks, so workers inherit it
+
+_job = None
+
+
+def _run_range(args):
+	'''Worker: join one range of queries, writing to its own part file'''
+	
+	k, start, end, block, file = args
+	
+	part = '{0}.part{1}'.format(file, k)
+	
+	f = open(part, 'wb')
+	
+	for i in range(start, end, block):
+		_job.join_block(i, min(i + block, end)).tofile(f)
+	
+	f.close()
+	
+	return k
+
+
+def run(job, file, processes=1, block=1000, quiet=0):
+	'''Stream all similar pairs to file, in parallel over query ranges'''
+	
+	global _job
+	_job = job
+	
+	n = len(job.queries)
+	
+	# several ranges per process so the load evens out
+	
+	step = max(block, -(-n // (processes * 8)))
+	ranges = [(k, s, min(s + step, n), block, file)
+					for k, s in enumerate(range(0, n, step))]
+	
+	pr = progressbar.ProgressBar(len(ranges), quiet)
+	
+	if processes > 1:
+		pool = multiprocessing.Pool(processes)
+		
+		for k in pool.imap_unordered(_run_range, ranges):
+			pr.advance()
+		
+		pool.close()
+		pool.join()
+	else:
+		for r in ranges:
+			_run_range(r)
+			pr.advance()
+	
+	# concatenate the parts in order
+	
+	f = open(file, 'wb')
+	
+	for r in ranges:
+		part = '{0}.part{1}'.format(file, r[0])
+		
+		g = open(part, 'rb')
+		shutil.copyfileobj(g, f)
+		g.close()
+		
+		os.remove(part)
+	
+	f.close()
+
+
+def read_pairs(file):
+	'''Memory-map a file of PAIR records'''
+	
+	if os.path.getsize(file) == 0:
+		return numpy.zeros(0, dtype=PAIR)
+	
+	return numpy.memmap(file, dtype=PAIR, mode='r')
+
+
+
+def write_text(pairs, file, by_id, quiet=0):
+	'''Write PAIR records as tab-separated headwords and scores'''
+	
+	if not quiet:
+		print 'Writing ' + file
+	
+	f = codecs.open(file, 'w', encoding='utf_8')
+	
+	for a, b, score in pairs:
+		f.write(u'{0}\t{1}\t{2:.4f}\n'.format(by_id[a], by_id[b], score))
+	
+	f.close()
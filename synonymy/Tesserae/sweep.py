@@ -0,0 +1,124 @@
+#
+# a grid of pipeline configurations run as a graph of cached stages
+#
+# A stage's output depends only on its own parameters and on the
+# outputs of the stages it reads, so each node is named by a hash of
+# those.  Configurations that agree on the early stages share their
+# nodes, and a node already finished by an earlier sweep isn't run
+# again.  Nodes at the same depth can't depend on one another, and
+# run in parallel.
+#
+
+import os
+import json
+import hashlib
+import itertools
+import multiprocessing
+
+# the stage functions, for worker processes
+
+_funcs = None
+
+
+def grid(spec):
+	'''Every combination of the values in spec, as a list of dicts'''
+	
+	keys = sorted(spec)
+	
+	return [dict(zip(keys, values))
+				for values in itertools.product(*[spec[k] for k in keys])]
+
+
+class Node:
+	'''One stage of the pipeline with particular inputs'''
+	
+	def __init__(self, stage, params, parents):
+	
+		self.stage   = stage
+		self.params  = params
+		self.parents = parents
+		
+		h = hashlib.sha1(json.dumps([stage, params, [p.key for p in parents]],
+									sort_keys=True))
+		
+		self.key   = '{0}.{1}'.format(stage, h.hexdigest()[:12])
+		self.depth = 1 + max([p.depth for p in parents] or [-1])
+
+
+class Graph:
+	'''Stages shared among configurations, cached under dir'''
+	
+	def __init__(self, dir):
+	
+		self.dir   = dir
+		self.nodes = dict()
+	
+	def __len__(self):
+	
+		return len(self.nodes)
+	
+	def add(self, stage, params, parents=()):
+		'''The node for stage with these inputs, added if it's new'''
+		
+		node = Node(stage, params, list(parents))
+		
+		return self.nodes.setdefault(node.key, node)
+	
+	def path(self, node):
+		'''Where a node keeps its output'''
+		
+		return os.path.join(self.dir, node.key)
+	
+	def done(self, node):
+		'''Whether a node's output is complete'''
+		
+		return os.path.exists(os.path.join(self.path(node), 'done.json'))
+	
+	def run(self, funcs, processes=1, quiet=0):
+		'''Run every unfinished node, a level at a time
+		
+		funcs maps each stage name to a function taking the node's
+		parameters, its parents' output directories, and its own.
+		'''
+		
+		global _funcs
+		_funcs = funcs
+		
+		levels = dict()
+		
+		for node in self.nodes.itervalues():
+			levels.setdefault(node.depth, []).append(node)
+		
+		for depth in sorted(levels):
+			todo = [n for n in levels[depth] if not self.done(n)]
+			
+			if not quiet:
+				print 'Level {0}: {1} stages, {2} cached'.format(
+					depth, len(levels[depth]), len(levels[depth]) - len(todo))
+			
+			jobs = [(n.stage, n.params, [self.path(p) for p in n.parents], self.path(n))
+						for n in sorted(todo, key=lambda n: n.key)]
+			
+			if processes > 1 and len(jobs) > 1:
+				pool = multiprocessing.Pool(min(processes, len(jobs)))
+				pool.map(_run, jobs, 1)
+				pool.close()
+				pool.join()
+			else:
+				for job in jobs:
+					_run(job)
+
+
+def _run(job):
+	'''Run one node; mark it done last, so a failed node reruns'''
+	
+	stage, params, inputs, out = job
+	
+	if not os.path.isdir(out):
+		os.makedirs(out)
+	
+	_funcs[stage](params, inputs, out)
+	
+	f = open(os.path.join(out, 'done.json'), 'w')
+	json.dump({'stage': stage, 'params': params, 'inputs': inputs}, f, sort_keys=True)
+	f.close()
@@ -52,3 +52,12 @@ def beta_to_uni(beta):
 	
 	return beta
 
+
+def is_greek(form):
+	'''try to guess whether a word is greek'''
+	
+	for c in form:
+		if ord(c) > 255:
+			return 1
+	
+	return 0
@@ -0,0 +1,184 @@
+#
+# translation tables in columns
+#
+# The results of sims-export.py as .npy arrays that can be memory-
+# mapped: the id of each query, the ids and scores of its hits, best
+# first (a hit's rank is its column, from 1), and the lexicon as one
+# UTF-8 string table with offsets.  Headwords are found by binary
+# search of the table in byte order, so a reader looks up a word's
+# translations without parsing or decoding anything else.
+#
+
+import time
+
+import numpy
+
+COLUMNS = ['queries', 'ids', 'scores', 'rows', 'strings', 'offsets', 'sorted']
+
+
+def write_lexicon(stem, by_id):
+	'''Save the headwords as a string table, with their byte order'''
+	
+	encoded = [w.encode('utf_8') for w in by_id]
+	
+	offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+	offsets[1:] = numpy.cumsum([len(b) for b in encoded])
+	
+	order = sorted(range(len(encoded)), key=lambda i: encoded[i])
+	
+	numpy.save(stem + '.strings.npy', numpy.frombuffer(''.join(encoded), dtype=numpy.uint8))
+	numpy.save(stem + '.offsets.npy', offsets)
+	numpy.save(stem + '.sorted.npy', numpy.array(order, dtype=numpy.int32))
+
+
+def create(stem, query_ids, width, n_ids, resume=False):
+	'''Memory-mapped hit columns for the queries, to be filled in
+	
+	Returns arrays of ids and scores, one row per query.  With
+	resume, the columns of an earlier run are reopened as they are.
+	'''
+	
+	shape = (len(query_ids), width)
+	
+	if resume:
+		return (numpy.load(stem + '.ids.npy', mmap_mode='r+'),
+				numpy.load(stem + '.scores.npy', mmap_mode='r+'))
+	
+	query_ids = numpy.asarray(query_ids, dtype=numpy.int32)
+	
+	rows = numpy.full(n_ids, -1, dtype=numpy.int32)
+	rows[query_ids] = numpy.arange(len(query_ids), dtype=numpy.int32)
+	
+	numpy.save(stem + '.queries.npy', query_ids)
+	numpy.save(stem + '.rows.npy', rows)
+	
+	ids = numpy.lib.format.open_memmap(stem + '.ids.npy', mode='w+',
+				dtype=numpy.int32, shape=shape)
+	scores = numpy.lib.format.open_memmap(stem + '.scores.npy', mode='w+',
+				dtype=numpy.float32, shape=shape)
+	
+	return ids, scores
+
+
+class ColumnWriter:
+	'''Fills the hit columns block by block, as BlockWriter writes lines
+	
+	Has the same put, sync and close, and the same statistics, so
+	sims-export.py can drive either.  Blocks are written in place,
+	so there is nothing to wait for.
+	'''
+	
+	def __init__(self, stem, query_ids, width, n_ids, resume=False):
+	
+		self.ids, self.scores = create(stem, query_ids, width, n_ids, resume)
+		
+		self.lines   = 0
+		self.bytes   = 0
+		self.seconds = 0.
+		self.waited  = 0.
+	
+	def put(self, block):
+		'''Store (first row, hit ids, scores) for a block of queries'''
+		
+		t = time.time()
+		
+		start, ids, scores = block
+		
+		self.ids[start:start + len(ids)]    = ids
+		self.scores[start:start + len(ids)] = scores
+		
+		self.lines   += len(ids)
+		self.bytes   += ids.nbytes + scores.nbytes
+		self.seconds += time.time() - t
+	
+	def flush(self):
+	
+		self.ids.flush()
+		self.scores.flush()
+	
+	def sync(self, callback):
+		'''Flush the columns to disk, then call callback'''
+		
+		self.flush()
+		
+		callback(None)
+	
+	def close(self):
+	
+		self.flush()
+
+
+class TranslationTable:
+	'''A saved translation table, memory-mapped'''
+	
+	def __init__(self, stem):
+	
+		self.stem = stem
+		
+		for name in COLUMNS:
+			setattr(self, name, numpy.load('{0}.{1}.npy'.format(stem, name), mmap_mode='r'))
+	
+	def __len__(self):
+	
+		return len(self.queries)
+	
+	def word(self, i):
+		'''The headword with id i'''
+		
+		return self.strings[self.offsets[i]:self.offsets[i+1]].tobytes().decode('utf_8')
+	
+	def _key(self, i):
+	
+		return self.strings[self.offsets[i]:self.offsets[i+1]].tobytes()
+	
+	def lookup(self, word):
+		'''The id of a headword, or None'''
+		
+		key = word.encode('utf_8')
+		
+		lo, hi = 0, len(self.sorted)
+		
+		while lo < hi:
+			mid = (lo + hi) // 2
+			
+			if self._key(self.sorted[mid]) < key:
+				lo = mid + 1
+			else:
+				hi = mid
+		
+		if lo < len(self.sorted) and self._key(self.sorted[lo]) == key:
+			return int(self.sorted[lo])
+		
+		return None
+	
+	def hits(self, i):
+		'''Ids and scores of the hits for headword id i, best first'''
+		
+		row = self.rows[i]
+		
+		if row < 0:
+			return self.ids[:0, :].ravel(), self.scores[:0, :].ravel()
+		
+		return self.ids[row], self.scores[row]
+	
+	def translations(self, word):
+		'''(headword, score, rank) for each hit of a headword, best first'''
+		
+		i = self.lookup(word)
+		
+		if i is None:
+			return []
+		
+		ids, scores = self.hits(i)
+		
+		return [(self.word(r), float(s), rank)
+					for rank, (r, s) in enumerate(zip(ids, scores), 1) if r >= 0]
+	
+	def lines(self, start=0, end=None):
+		'''The table's rows as trans2.csv lines: query, then hits'''
+		
+		if end is None:
+			end = len(self.queries)
+		
+		return [u','.join([self.word(q)] + [self.word(r) for r in row if r >= 0])
+					for q, row in zip(self.queries[start:end], self.ids[start:end])]
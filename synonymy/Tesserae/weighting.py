@@ -0,0 +1,152 @@
+#
+# term weighting over the raw headword x term count matrix
+#
+# Each scheme is a vectorized transform of the count matrix's
+# nonzero entries, so reweighting takes seconds and never goes back
+# to the definitions.  Every scheme returns a row-normalized CSR
+# matrix, ready for the similarity index or the neighbour table.
+#
+
+import os
+
+import numpy
+from scipy import sparse
+
+from Tesserae import matrix
+from Tesserae import incremental
+
+# which scheme the current corpus was weighted by
+
+file_scheme = os.path.join('data', 'weighting.txt')
+
+
+def doc_freq(counts):
+	'''Number of headwords using each term'''
+	
+	return numpy.bincount(counts.indices, minlength=counts.shape[1])
+
+
+def row_of(counts):
+	'''The row of each stored entry'''
+	
+	return numpy.repeat(numpy.arange(counts.shape[0]), numpy.diff(counts.indptr))
+
+
+def reweight(counts, data):
+	'''counts' sparsity pattern with new values, normalized'''
+	
+	weighted = sparse.csr_matrix((data, counts.indices.copy(), counts.indptr.copy()),
+								shape=counts.shape)
+	weighted.eliminate_zeros()
+	
+	return matrix.normalize(weighted)
+
+
+def tfidf(counts):
+	'''tf x log2(n / df), as gensim's TfidfModel'''
+	
+	return incremental.tfidf(counts, doc_freq(counts))
+
+
+def log_entropy(counts):
+	'''log(1 + tf) x (1 + sum p log p / log(n + 1)), as gensim's LogEntropyModel
+	
+	p is a term's count in one headword over its count in all of
+	them; terms spread evenly over many headwords weigh least.
+	'''
+	
+	n  = counts.shape[0]
+	tf = counts.data.astype(numpy.float64)
+	
+	gf = numpy.bincount(counts.indices, weights=tf, minlength=counts.shape[1])
+	
+	p = tf / gf[counts.indices]
+	
+	entropy = numpy.bincount(counts.indices, weights=p * numpy.log(p),
+								minlength=counts.shape[1])
+	
+	g = 1 + entropy / numpy.log(n + 1) if n > 0 else numpy.ones(counts.shape[1])
+	
+	return reweight(counts, numpy.log1p(tf) * g[counts.indices])
+
+
+def bm25(counts, k1=1.2, b=0.75):
+	'''Okapi BM25 term weights, each headword's definition a document'''
+	
+	n  = counts.shape[0]
+	tf = counts.data.astype(numpy.float64)
+	df = doc_freq(counts).astype(numpy.float64)
+	
+	idf = numpy.log(1 + (n - df + 0.5) / (df + 0.5))
+	
+	length = numpy.asarray(counts.sum(axis=1), dtype=numpy.float64).ravel()
+	avg    = length.mean() if n else 1.
+	
+	norm = k1 * (1 - b + b * length / avg)
+	
+	w = tf * (k1 + 1) / (tf + norm[row_of(counts)]) * idf[counts.indices]
+	
+	return reweight(counts, w)
+
+
+def ppmi(counts):
+	'''Positive pointwise mutual information of headword and term'''
+	
+	tf    = counts.data.astype(numpy.float64)
+	total = tf.sum()
+	
+	p_row  = numpy.asarray(counts.sum(axis=1), dtype=numpy.float64).ravel() / total
+	p_term = numpy.bincount(counts.indices, weights=tf, minlength=counts.shape[1]) / total
+	
+	pmi = numpy.log(tf / total / (p_row[row_of(counts)] * p_term[counts.indices]))
+	
+	return reweight(counts, numpy.maximum(pmi, 0))
+
+
+# the schemes by name
+
+SCHEMES = {
+	'tfidf':       tfidf,
+	'log-entropy': log_entropy,
+	'bm25':        bm25,
+	'ppmi':        ppmi
+}
+
+
+def apply(scheme, counts):
+	'''Weight a count matrix by the named scheme'''
+	
+	if scheme not in SCHEMES:
+		raise ValueError('unknown weighting ' + str(scheme))
+	
+	return SCHEMES[scheme](counts.tocsr())
+
+
+def load_counts(quiet=0):
+	'''The count matrix saved by the last full build'''
+	
+	if not quiet:
+		print 'Loading term counts ' + incremental.file_counts
+	
+	return sparse.load_npz(incremental.file_counts).tocsr()
+
+
+def save_scheme(scheme):
+	'''Note the scheme used for the current corpus'''
+	
+	f = open(file_scheme, 'w')
+	f.write(scheme + '\n')
+	f.close()
+
+
+def last_scheme():
+	'''The scheme used for the current corpus; tfidf if never noted'''
+	
+	if not os.path.exists(file_scheme):
+		return 'tfidf'
+	
+	f = open(file_scheme, 'r')
+	scheme = f.read().strip()
+	f.close()
+	
+	return scheme
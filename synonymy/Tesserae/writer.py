@@ -0,0 +1,194 @@
+#
+# a writer thread for large exports
+#
+# The thread computing results hands them over a block of lines at a
+# time through a bounded queue; the writer thread encodes each block
+# and writes it in one call, compressed if asked.  Computing and
+# writing overlap, and a full queue holds the computing side back
+# rather than letting finished blocks pile up in memory.
+#
+
+import os
+import io
+import time
+import gzip
+import Queue
+import threading
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+# stream compression available here
+
+COMPRESSION = ['gzip'] + (['zstd'] if zstandard is not None else [])
+
+# file name suffix for each
+
+SUFFIX = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+class _Sync:
+	'''Queue marker: flush, then call back with the file's length'''
+	
+	def __init__(self, callback):
+	
+		self.callback = callback
+
+
+class BlockWriter(threading.Thread):
+	'''Write blocks of unicode lines from a queue in the background
+	
+	Counts the lines and bytes written and the time spent encoding
+	and writing them, and the time the computing side spent waiting
+	for room in the queue.  An error in the writer is raised again
+	by the next put() or by close().
+	
+	Given an offset, the file is cut to that length and written on
+	from there, as when resuming from a sync() point.
+	'''
+	
+	def __init__(self, filename, compress=None, depth=8, buffer=1<<20, encoding='utf_8',
+					offset=None):
+		
+		threading.Thread.__init__(self)
+		self.daemon = True
+		
+		self.encoding = encoding
+		self.queue    = Queue.Queue(depth)
+		
+		self.lines   = 0
+		self.bytes   = 0
+		self.seconds = 0.
+		self.waited  = 0.
+		self.error   = None
+		
+		if compress not in [None] + COMPRESSION:
+			raise ValueError('unknown compression ' + str(compress))
+		
+		self.compress = compress
+		
+		if offset is None:
+			self.raw = io.open(filename, 'wb', buffering=buffer)
+		else:
+			if os.path.getsize(filename) < offset:
+				raise IOError('{0} is shorter than {1} bytes'.format(filename, offset))
+			
+			self.raw = io.open(filename, 'r+b', buffering=buffer)
+			self.raw.truncate(offset)
+			self.raw.seek(offset)
+		
+		self.file = self.open_stream()
+		
+		self.start()
+	
+	def open_stream(self):
+		'''A compressing stream over the raw file, or the file itself'''
+		
+		if self.compress == 'gzip':
+			return gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6)
+		
+		if self.compress == 'zstd':
+			return zstandard.ZstdCompressor().stream_writer(self.raw, closefd=False)
+		
+		return self.raw
+	
+	def flush(self):
+		'''End any compressed stream and get everything to disk
+		
+		Compressed output goes on in a new gzip member or zstd frame;
+		readers treat the concatenation as one stream, and the file
+		can be cut here and written on later.
+		'''
+		
+		if self.file is not self.raw:
+			self.file.close()
+		
+		self.raw.flush()
+		os.fsync(self.raw.fileno())
+		
+		offset = self.raw.tell()
+		
+		# a new gzip member starts with a header, which belongs after
+		# the offset
+		
+		if self.file is not self.raw:
+			self.file = self.open_stream()
+		
+		return offset
+	
+	def put(self, lines):
+		'''Queue a block of lines, without their newlines'''
+		
+		if self.error is not None:
+			raise self.error
+		
+		t = time.time()
+		
+		# a timeout keeps a full queue from blocking Ctrl-C
+		
+		while True:
+			try:
+				self.queue.put(lines, True, 1.)
+				break
+			except Queue.Full:
+				if self.error is not None:
+					raise self.error
+		
+		self.waited += time.time() - t
+	
+	def sync(self, callback):
+		'''Once the blocks queued so far are on disk, call callback(offset)
+		
+		The callback runs in the writer thread; offset is the length
+		of the file, which holds nothing else.
+		'''
+		
+		self.put(_Sync(callback))
+	
+	def run(self):
+	
+		while True:
+			lines = self.queue.get()
+			
+			if lines is None:
+				break
+			
+			# after an error, keep draining so put() never blocks
+			
+			if self.error is not None or not lines:
+				continue
+			
+			t = time.time()
+			
+			try:
+				if isinstance(lines, _Sync):
+					lines.callback(self.flush())
+					self.seconds += time.time() - t
+					continue
+				
+				data = (u'\n'.join(lines) + u'\n').encode(self.encoding)
+				self.file.write(data)
+			except (IOError, OSError, UnicodeError) as err:
+				self.error = err
+				continue
+			
+			self.seconds += time.time() - t
+			self.lines   += len(lines)
+			self.bytes   += len(data)
+	
+	def close(self):
+		'''Write what's left in the queue and close the file'''
+		
+		self.queue.put(None)
+		self.join()
+		
+		if self.file is not self.raw:
+			self.file.close()
+		
+		if not self.raw.closed:
+			self.raw.close()
+		
+		if self.error is not None:
+			raise self.error
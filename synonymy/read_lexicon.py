@@ -17,12 +17,30 @@ import pickle
 import collections
 import argparse
 import unicodedata
+import string
+import random
+import time
+import xml.sax
 
+import numpy
 from stemming.porter2 import stem
-from gensim import corpora, models, similarities
+from gensim import corpora, models, similarities, matutils
+from scipy import sparse
 
 from Tesserae import progressbar
 from Tesserae import tesslang
+from Tesserae import dedup
+from Tesserae import matrix
+from Tesserae import neighbours
+from Tesserae import incremental
+from Tesserae import lexscan
+from Tesserae import lexsax
+from Tesserae import redirects
+from Tesserae import weighting
+from Tesserae import glosses
+from Tesserae import lookup
+from Tesserae import projection
+from Tesserae import budget
 
 #
 # a collection of compiled regular expressions
@@ -37,27 +55,31 @@ class pat:
 	
 	# XML nodes to omit
 	
-	stop = [
-		re.compile(pat, re.U) for pat in [
-			r'<cit>.*?</cit>',
-			r'<bibl .+?>.*?</bibl>',
-			r'<orth .+?>.*?</orth>',
-			r'<etym .+?>.*?</etym>',
-			r'<itype .+?>.*?</itype>',
-			r'<pos .+?>.*?</pos>',
-			r'<number .+?>.*?</number>',
-			r'<gen .+?>.*?</gen>',
-			r'<mood .+?>.*?</mood>',
-			r'<case .+?>.*?</case>',
-			r'<tns .+?>.*?</tns>',
-			r'<per .+?>.*?</per>',
-			r'<pron .+?>.*?</pron>',
-			r'<date>.*?</date>',
-			r'<usg .+?>.*?</usg>',
-			r'<gramGrp .+?>.*?</gramGrp>'
-		]
+	stop_src = [
+		r'<cit>.*?</cit>',
+		r'<bibl .+?>.*?</bibl>',
+		r'<orth .+?>.*?</orth>',
+		r'<etym .+?>.*?</etym>',
+		r'<itype .+?>.*?</itype>',
+		r'<pos .+?>.*?</pos>',
+		r'<number .+?>.*?</number>',
+		r'<gen .+?>.*?</gen>',
+		r'<mood .+?>.*?</mood>',
+		r'<case .+?>.*?</case>',
+		r'<tns .+?>.*?</tns>',
+		r'<per .+?>.*?</per>',
+		r'<pron .+?>.*?</pron>',
+		r'<date>.*?</date>',
+		r'<usg .+?>.*?</usg>',
+		r'<gramGrp .+?>.*?</gramGrp>'
 	]
 	
+	stop = [re.compile(p, re.U) for p in stop_src]
+	
+	# the same nodes, by element name
+	
+	stop_tags = set(re.match(r'<(\w+)', p).group(1) for p in stop_src)
+	
 	# language-specific regular expressions matching the parts of
 	# dictionary entries that are English definitions of the headword
 	
@@ -73,6 +95,18 @@ class pat:
 	
 	foreign = re.compile(r'<foreign lang="greek">(.+?)</foreign>', re.U)
 	
+	# cross-references: an <xr> with a <ref> inside it, or just after it
+	
+	entry_id = re.compile(r'<entryFree [^>]*?\bid="(.+?)"', re.U)
+	
+	xref = re.compile(r'<xr>(.*?)</xr>\s*(<ref\b[^>]*>.*?</ref>)?', re.U)
+	
+	ref = re.compile(r'<ref\b([^>]*)>(.*?)</ref>', re.U)
+	
+	target = re.compile(r'\btarget="(.+?)"')
+	
+	tag = re.compile(r'<[^>]+>')
+	
 	# stuff to remove from english entries
 	
 	clean = {
@@ -80,6 +114,20 @@ class pat:
 		'la': re.compile(r'[^a-z]', re.U),
 		'grc': re.compile(r'[\^_]', re.U)
 	}
+	
+	# byte-string versions, for scanning a memory-mapped lexicon
+	# without decoding the parts of each entry that are thrown away
+	
+	entry_bytes = re.compile(br'<entryFree [^>]*key="(.+?)"[^>]*>(.+?)</entryFree>')
+	
+	entry_id_bytes = re.compile(br'<entryFree [^>]*?\bid="(.+?)"')
+	
+	stop_bytes = [re.compile(p) for p in stop_src]
+	
+	definition_bytes = {
+		'la': re.compile(br'<hi [^>]*rend="ital"[^>]*>(.+?)</hi>'),
+		'grc': re.compile(br'<tr\b[^>]*>(.+?)</tr>')
+	}
 
 
 def standardize(lang, lemma):
@@ -100,12 +148,207 @@ def standardize(lang, lemma):
 	return(lemma)
 
 
+class Standardizer:
+	'''A compiled standardize() for one language
+	
+	ASCII strings, which is nearly all of them, go through
+	str.translate with precomputed tables and skip NFC altogether.
+	Others take the same steps as standardize(); normalize() itself
+	returns quickly for strings already in NFC.  Results are
+	remembered, since English tokens repeat endlessly; the memo
+	grows to the number of distinct strings seen.
+	'''
+	
+	def __init__(self, lang):
+	
+		self.lang = lang
+		self.memo = dict()
+		
+		upper = string.ascii_uppercase
+		lower = string.ascii_lowercase
+		
+		if lang == 'la':
+			self.table  = string.maketrans(upper + 'jv', lower + 'iu')
+			self.delete = self.complement(string.ascii_letters)
+		
+		elif lang == 'grc':
+			self.table  = string.maketrans('\\', '/')
+			self.delete = ''
+		
+		else:
+			self.table  = string.maketrans(upper, lower)
+			self.delete = self.complement(string.ascii_letters + string.digits + '_')
+	
+	@staticmethod
+	def complement(keep):
+		'''All the byte values not in keep'''
+		
+		return ''.join(chr(i) for i in range(256) if chr(i) not in keep)
+	
+	def __call__(self, lemma):
+	
+		s = self.memo.get(lemma)
+		
+		if s is None:
+			s = self.memo[lemma] = self.convert(lemma)
+		
+		return s
+	
+	def convert(self, lemma):
+		'''Standardize one string, without the memo'''
+		
+		try:
+			b = lemma.encode('ascii')
+		except UnicodeError:
+			b = None
+		
+		if b is not None:
+			b = b.translate(self.table, self.delete)
+			
+			if self.lang != 'grc':
+				return b.decode('ascii')
+			
+			lemma = tesslang.beta_to_uni(b.decode('ascii'))
+		
+		elif self.lang == 'la':
+			lemma = lemma.replace('j', 'i')
+			lemma = lemma.replace('v', 'u')
+		
+		elif self.lang == 'grc':
+			lemma = lemma.replace('\\', '/')
+			lemma = tesslang.beta_to_uni(lemma)
+		
+		lemma = unicodedata.normalize('NFC', lemma)
+		lemma = lemma.lower()
+		lemma = pat.clean[self.lang].sub('', lemma)
+		
+		return lemma
+
+
+standardizers = dict((lang, Standardizer(lang)) for lang in ('la', 'grc', 'any'))
+
+
+def standardize_many(lang, iterable):
+	'''Standardize a number of words at once; return a list'''
+	
+	f = standardizers[lang]
+	
+	memo    = f.memo
+	convert = f.convert
+	
+	out = []
+	
+	for w in iterable:
+		s = memo.get(w)
+		
+		if s is None:
+			s = memo[w] = convert(w)
+		
+		out.append(s)
+	
+	return out
+
+
+def check_standardize(langs, quiet):
+	'''Compare standardize_many() with standardize() on the lexica
+	
+	Uses every raw headword and every English token of the
+	definitions, plus some random unicode, and reports any
+	disagreement and the throughput of each (best of three, the
+	memo starting empty each time).
+	'''
+	
+	words = dict()
+	
+	for lang in langs:
+		mm = lexscan.open_map(lexscan.lexicon_file(lang))
+		
+		words[lang] = []
+		tokens = []
+		
+		for m in pat.entry_bytes.finditer(mm):
+			words[lang].append(m.group(1).decode('utf-8'))
+			
+			for d in pat.definition_bytes[lang].findall(m.group(2)):
+				tokens.extend(w for w in pat.clean['any'].split(d.decode('utf-8')) if w)
+		
+		mm.close()
+		
+		words.setdefault('any', []).extend(tokens)
+	
+	# odd cases the lexica may not have
+	
+	rand = random.Random(0)
+	
+	alphabet = (u'aAjJvVsS_^\\/=()|*1 -' + u'\u00e6\u00c6\u0101\u03ac\u1f00\u1f71' + 
+				u'\u0300\u0301\u0313\u0342\u0345\u1100\u1161\u11a8\uac00\u212b\u2126' + 
+				u'\U0001d400')
+	
+	odd = [u''.join(rand.choice(alphabet) for i in range(rand.randint(1, 6))) 
+				for j in range(20000)]
+	
+	failed = 0
+	
+	for lang in sorted(words):
+	
+		# throughput on the lexica
+		
+		t_old = t_new = None
+		
+		for rep in range(3):
+			t0 = time.time()
+			old = [standardize(lang, w) for w in words[lang]]
+			t_old = min(t_old, time.time() - t0) if rep else time.time() - t0
+			
+			standardizers[lang].memo.clear()
+			
+			t0 = time.time()
+			new = standardize_many(lang, words[lang])
+			t_new = min(t_new, time.time() - t0) if rep else time.time() - t0
+		
+		# agreement, on the odd cases too
+		
+		sample = words[lang] + odd
+		
+		old += [standardize(lang, w) for w in odd]
+		new += standardize_many(lang, odd)
+		
+		bad = [(w, a, b) for w, a, b in zip(sample, old, new) if a != b]
+		failed += len(bad)
+		
+		print u'{0:>4}: {1} words, {2:.0f}/s before, {3:.0f}/s after; {4} of {5} differ'.format(
+			lang, len(words[lang]), len(words[lang]) / max(t_old, 1e-6), 
+			len(words[lang]) / max(t_new, 1e-6), len(bad), len(sample))
+		
+		if not quiet:
+			for w, a, b in bad[:10]:
+				print u'      {0!r}: {1!r} != {2!r}'.format(w, a, b)
+	
+	return failed == 0
+
+
 def mo_beta2uni(mo):
 	'''A wrapper for tesslang.beta_to_uni that takes match objects'''
 	
 	return(tesslang.beta_to_uni(mo.group(1)))
 
 
+def find_xrefs(lang, entry):
+	'''Targets of the cross-references in an entry, as (id, headword)'''
+	
+	targets = []
+	
+	for m in pat.xref.finditer(entry):
+		for attrs, word in pat.ref.findall(m.group(0)):
+			t = pat.target.search(attrs)
+			word = pat.tag.sub('', word).strip()
+			
+			targets.append((t.group(1) if t else None, 
+							standardize(lang, word) if word else None))
+	
+	return targets
+
+
 def write_dict(defs, name, quiet):
 	'''Save a copy of the dictionary in pickle format'''
 	
@@ -132,11 +375,228 @@ def read_dict(name, quiet):
 	return(defs)
 
 
-def parse_XML_dictionaries(langs, quiet):
-	'''Create a dictionary of english translations for each lemma'''
+def read_entries_lines(lang, filename, quiet, index=None, xrefs=None):
+	'''Yield headword, definitions for each line of a lexicon'''
+	
+	pr = progressbar.ProgressBar(os.stat(filename).st_size, quiet)
+	
+	try: 
+		f = codecs.open(filename, encoding='utf_8')
+	except IOError as err:
+		print "Can't read {0}: {1}".format(filename, str(err))
+		sys.exit(1)
+	
+	#
+	# Each line in the lexicon is one entry.
+	# Process one at a time to extract headword, definition.
+	#
+	
+	for line in f:
+		pr.advance(len(line.encode('utf-8')))
+		
+		# skip lines that don't conform with the expected entry structure
+		
+		m = pat.entry.search(line)
+		
+		if m is None:
+			continue
+		
+		lemma, entry = m.group(1, 2)
+		
+		# standardize the headword
+		
+		lemma = standardizers[lang](lemma)
+		
+		# note the entry's id and cross-references
+		
+		if xrefs is not None:
+			id_m = pat.entry_id.match(m.group(0))
+			xrefs.add(lemma, lang, id_m.group(1) if id_m else None, find_xrefs(lang, entry))
+		
+		# remove elements on the stoplist
+		
+		for stop in pat.stop:
+			entry = stop.sub('', entry)
+		
+		# transliterate betacode to unicode chars
+		# in foreign tags
+		
+		entry = pat.foreign.sub(mo_beta2uni, entry)
+		
+		# extract strings marked as translations of the headword
+		
+		def_strings = pat.definition[lang].findall(entry)
+		
+		# drop empty defs
+		
+		def_strings = [d for d in def_strings if not d.isspace()]
+		
+		yield lemma, def_strings
+
+
+def read_entries_mmap(lang, filename, quiet, index=None, xrefs=None):
+	'''Yield headword, definitions for each entry of a mapped lexicon
+	
+	Works on the raw bytes: only the key and the definitions are
+	ever decoded.  If index is given, each entry's byte offsets are
+	recorded in it; if xrefs is given, each entry's cross-references.
+	'''
+	
+	try: 
+		mm = lexscan.open_map(filename)
+	except (IOError, ValueError) as err:
+		print "Can't read {0}: {1}".format(filename, str(err))
+		sys.exit(1)
+	
+	pr = progressbar.ProgressBar(max(len(mm), 1), quiet)
+	
+	pos = 0
+	
+	for m in pat.entry_bytes.finditer(mm):
+		pr.advance(m.end() - pos)
+		pos = m.end()
+		
+		lemma, entry = m.group(1, 2)
+		
+		lemma = standardizers[lang](lemma.decode('utf-8'))
+		
+		# only entries with cross-references need decoding for them
+		
+		if xrefs is not None:
+			id_m = pat.entry_id_bytes.match(m.group(0))
+			
+			xrefs.add(lemma, lang, id_m.group(1).decode('utf-8') if id_m else None,
+					find_xrefs(lang, entry.decode('utf-8')) if b'<xr>' in entry else [])
+		
+		# remove elements on the stoplist
+		
+		for stop in pat.stop_bytes:
+			entry = stop.sub(b'', entry)
+		
+		# decode only the definitions, transliterating
+		# betacode in foreign tags as we go
+		
+		def_strings = [pat.foreign.sub(mo_beta2uni, d.decode('utf-8')) 
+							for d in pat.definition_bytes[lang].findall(entry)]
+		
+		def_strings = [d for d in def_strings if not d.isspace()]
+		
+		if index is not None:
+			index.add(lemma, lang, m.start(), m.end())
+		
+		yield lemma, def_strings
+	
+	pr.advance(len(mm) - pos)
+	
+	mm.close()
+
+
+def read_entries_sax(lang, filename, quiet, index=None, xrefs=None):
+	'''Yield headword, definitions for each entry, using a SAX parser
+	
+	Unlike the regex engines, this doesn't depend on one entry per
+	line, and keeps only the text of definition elements.  Byte
+	offsets are not available.
+	'''
+	
+	if lang == 'la':
+		handler = lexsax.EntryHandler(pat.stop_tags, 'hi', {'rend': 'ital'})
+	else:
+		handler = lexsax.EntryHandler(pat.stop_tags, 'tr')
+	
+	pr = progressbar.ProgressBar(max(os.stat(filename).st_size, 1), quiet)
+	
+	try:
+		for lemma, def_strings, entry_id, refs in lexsax.iter_entries(filename, handler, pr):
+		
+			lemma = standardizers[lang](lemma)
+			
+			if xrefs is not None:
+				refs = [(t, pat.tag.sub('', w).strip()) for t, w in refs]
+				
+				xrefs.add(lemma, lang, entry_id, 
+						[(t, standardize(lang, w) if w else None) for t, w in refs])
+			
+			def_strings = [d for d in def_strings if d != '' and not d.isspace()]
+			
+			yield lemma, def_strings
+	
+	except xml.sax.SAXParseException as err:
+		print "Can't parse {0}: {1}".format(filename, str(err))
+		sys.exit(1)
+
+
+# ways of reading the lexica
+
+engines = {
+	'lines': read_entries_lines,
+	'mmap':  read_entries_mmap,
+	'sax':   read_entries_sax
+}
+
+
+def compare_engines(langs, a, b, quiet):
+	'''Time two engines on the same lexica and report differences'''
+	
+	size = sum(os.stat(os.path.join('dict', lang + '.lexicon.xml')).st_size 
+					for lang in langs)
+	
+	defs = dict()
+	
+	for engine in (a, b):
+		t0 = time.time()
+		defs[engine] = parse_XML_dictionaries(langs, 1, engine)
+		t = time.time() - t0
 		
+		print '{0:>6}: {1:.1f}s, {2:.1f} MB/s, {3} headwords'.format(
+			engine, t, size / 1e6 / max(t, 1e-6), len(defs[engine]))
+	
+	only_a = [l for l in defs[a] if l not in defs[b]]
+	only_b = [l for l in defs[b] if l not in defs[a]]
+	differ = [l for l in defs[a] if l in defs[b] and defs[a][l] != defs[b][l]]
+	
+	print 'Only from {0}: {1}'.format(a, len(only_a))
+	print 'Only from {0}: {1}'.format(b, len(only_b))
+	print 'Different definitions: {0}'.format(len(differ))
+	
+	# full details to a file
+	
+	file_diff = os.path.join('data', 'engines.{0}-{1}.diff.txt'.format(a, b))
+	
+	if not quiet:
+		print 'Writing differences to ' + file_diff
+	
+	f = codecs.open(file_diff, 'w', encoding='utf_8')
+	
+	for l in sorted(only_a):
+		f.write(u'< {0}\t{1}\n'.format(l, defs[a][l]))
+	
+	for l in sorted(only_b):
+		f.write(u'> {0}\t{1}\n'.format(l, defs[b][l]))
+	
+	for l in sorted(differ):
+		f.write(u'< {0}\t{1}\n> {0}\t{2}\n'.format(l, defs[a][l], defs[b][l]))
+	
+	f.close()
+
+
+def parse_XML_dictionaries(langs, quiet, engine='mmap', xref=True, offsets=True):
+	'''Create a dictionary of english translations for each lemma
+	
+	Unless offsets is false, entry offsets are saved where the
+	engine records them.
+	'''
+	
 	defs = dict()
 	
+	# byte offsets of each headword's entries, where the engine knows them
+	
+	index = lexscan.EntryIndex()
+	
+	# cross-references, to stand in for missing definitions
+	
+	xrefs = redirects.Redirects() if xref else None
+	
 	# process latin, greek lexica in turn
 	
 	for lang in langs:
@@ -145,53 +605,8 @@ def parse_XML_dictionaries(langs, quiet):
 		if not quiet:
 			print 'Reading lexcion {0}'.format(filename)
 		
-		pr = progressbar.ProgressBar(os.stat(filename).st_size, quiet)
+		for lemma, def_strings in engines[engine](lang, filename, quiet, index, xrefs):
 		
-		try: 
-			f = codecs.open(filename, encoding='utf_8')
-		except IOError as err:
-			print "Can't read {0}: {1}".format(filename, str(err))
-			sys.exit(1)
-		
-		#
-		# Each line in the lexicon is one entry.
-		# Process one at a time to extract headword, definition.
-		#
-				
-		for line in f:
-			pr.advance(len(line.encode('utf-8')))
-			
-			# skip lines that don't conform with the expected entry structure
-						
-			m = pat.entry.search(line)
-			
-			if m is None:
-				continue
-			
-			lemma, entry = m.group(1, 2)
-			
-			# remove elements on the stoplist
-			
-			for stop in pat.stop:
-				entry = stop.sub('', entry)
-			
-			# transliterate betacode to unicode chars
-			# in foreign tags
-			
-			entry = pat.foreign.sub(mo_beta2uni, entry)
-			
-			# standardize the headword
-			
-			lemma = standardize(lang, lemma)
-			
-			# extract strings marked as translations of the headword
-			
-			def_strings = pat.definition[lang].findall(entry)
-			
-			# drop empty defs
-			
-			def_strings = [d for d in def_strings if not d.isspace()]
-			
 			# skip lemmata for which no translation can be extracted
 			
 			if def_strings is None:
@@ -202,6 +617,17 @@ def parse_XML_dictionaries(langs, quiet):
 			else:
 				defs[lemma] = def_strings
 	
+	# headwords that only redirect take the definitions of their targets
+	
+	if xrefs is not None:
+		targets, stats = xrefs.resolve(lambda l: bool(defs.get(l)))
+		
+		for lemma, target in targets.iteritems():
+			defs[lemma] = list(defs[target])
+		
+		if not quiet:
+			print 'Resolved {resolved} redirects; {cycles} in cycles, {dangling} dangling'.format(**stats)
+	
 	if not quiet:
 		print 'Flattening entries with multiple definitions'
 	
@@ -224,11 +650,31 @@ def parse_XML_dictionaries(langs, quiet):
 	for k in empty_keys:
 		del defs[k]
 	
+	if offsets and len(index):
+		index.save(quiet=quiet)
+	
 	return(defs)
 
 
-def bag_of_words(defs, stem_flag, quiet):
-	'''convert dictionary definitions into bags of words'''
+def def_tokens(definition, stem_flag):
+	'''split one definition into standardized English terms'''
+	
+	tokens = standardize_many('any', (w for w in pat.clean['any'].split(definition) 
+										if not w.isspace() and w != ''))
+	
+	if stem_flag:
+		tokens = [stem(w) for w in tokens]
+	
+	return tokens
+
+
+def bag_of_words(defs, stem_flag, quiet, raw=None, keep_hapax=False):
+	'''convert dictionary definitions into bags of words
+	
+	If raw is a dict, it receives each lemma's terms as they
+	stood before hapax legomena were removed.  With keep_hapax,
+	they aren't removed.
+	'''
 	
 	# convert to bag of words, count words
 	
@@ -244,30 +690,29 @@ def bag_of_words(defs, stem_flag, quiet):
 	for lemma in defs:
 		pr.advance()
 		
-		defs[lemma] = [standardize('any', w) 
-							for w in pat.clean['any'].split(defs[lemma]) 
-							if not w.isspace() and w != '']
-				
-		if stem_flag:
-			defs[lemma] = [stem(w) for w in defs[lemma]]
+		defs[lemma] = def_tokens(defs[lemma], stem_flag)
 		
 		if len(defs[lemma]) > 0:
 			count.update(defs[lemma])
+			
+			if raw is not None:
+				raw[lemma] = defs[lemma]
 		else:
 			empty_keys.add(lemma)
 	
-	if not quiet:
-		print "Removing hapax legomena"
-	
-	pr = progressbar.ProgressBar(len(defs), quiet)
-	
-	for lemma in defs:
-		pr.advance()
+	if not keep_hapax:
+		if not quiet:
+			print "Removing hapax legomena"
 		
-		defs[lemma] = [w for w in defs[lemma] if count[w] > 1]
+		pr = progressbar.ProgressBar(len(defs), quiet)
 		
-		if defs[lemma] == []:
-			empty_keys.add(lemma)
+		for lemma in defs:
+			pr.advance()
+			
+			defs[lemma] = [w for w in defs[lemma] if count[w] > 1]
+			
+			if defs[lemma] == []:
+				empty_keys.add(lemma)
 	
 	if not quiet:
 		print 'Lost {} empty definitions'.format(len(empty_keys))
@@ -313,6 +758,12 @@ def make_index(defs, quiet):
 		by_id.append(lemma)
 		by_word[lemma] = len(by_id) - 1
 	
+	write_lookups(by_word, by_id, quiet)
+
+
+def write_lookups(by_word, by_id, quiet):
+	'''Save the by-word and by-id look-up tables'''
+	
 	# save the lookup table
 	
 	file_lookup_word = os.path.join('data', 'lookup_word.pickle')
@@ -335,6 +786,257 @@ def make_index(defs, quiet):
 	pickle.dump(by_id, f)
 	f.close()
 
+	# forgiving lookup for queries
+	
+	lookup.HeadwordLookup.build(by_id, quiet).save(quiet=quiet)
+
+
+def read_lookup_id(quiet):
+	'''Load the id look-up table saved by make_index'''
+	
+	f = open(os.path.join('data', 'lookup_id.pickle'), 'r')
+	by_id = pickle.load(f)
+	f.close()
+	
+	return by_id
+
+
+def plan_memory(n_docs, n_index, num_features, nnz, dense, opt):
+	'''Fit the similarity stage to --memory-budget; None without one'''
+	
+	if opt.memory_budget is None:
+		return None
+	
+	plan = budget.plan(n_docs, n_index, num_features, nnz, dense, opt.memory_budget)
+	
+	if plan is None:
+		print 'The similarity stage cannot fit in {}'.format(budget.format_size(opt.memory_budget))
+		sys.exit(1)
+	
+	if not opt.quiet:
+		print 'Memory plan: {}; expected peak {}'.format(
+			plan.describe(), budget.format_size(plan.expected()))
+	
+	return plan
+
+
+def report_memory(plan, monitor, quiet):
+	'''Compare the peak memory of the similarity stage with the plan's'''
+	
+	if plan is None:
+		return
+	
+	actual = monitor.stop()
+	
+	if not quiet:
+		print 'Memory: expected peak {}, actual peak {}'.format(
+			budget.format_size(plan.expected()), budget.format_size(actual))
+	
+	plan.log(actual)
+
+
+def save_index(corpus_index, num_features, quiet, plan=None):
+	'''Calculate similarities and save the index'''
+	
+	if not quiet:
+		print 'Calculating similarities (please be patient)'
+	
+	dir_calc = os.path.join('data', 'sims')
+	
+	if plan is None:
+		index = similarities.Similarity(dir_calc, corpus_index, num_features)
+	else:
+		index = similarities.Similarity(dir_calc, corpus_index, num_features,
+					chunksize=plan.block, shardsize=plan.shard)
+	
+	file_index = os.path.join('data', 'gensim.index')
+	
+	if not quiet:
+		print 'Saving similarity index ' + file_index
+	
+	index.save(file_index)
+
+
+def update(defs, opt):
+	'''Patch the results of an earlier run to match new definitions'''
+	
+	quiet = opt.quiet
+	
+	if not incremental.have_state():
+		print 'No saved state to update; run once without --update'
+		sys.exit(1)
+	
+	state = incremental.load_state(quiet)
+	
+	if state['stem'] != opt.stem:
+		print 'Stemming must be the same as in the earlier run'
+		sys.exit(1)
+	
+	if weighting.last_scheme() != 'tfidf':
+		print 'Only tf-idf weights can be updated; the last run used ' + weighting.last_scheme()
+		sys.exit(1)
+	
+	# the reduced vectors would need refitting, which is a full build
+	
+	reduction = incremental.last_reduction()
+	
+	if reduction is not None:
+		print 'Reduced vectors cannot be updated; the last run used {0} to {1} dimensions'.format(
+			*reduction)
+		sys.exit(1)
+	
+	old_defs = read_dict('full_defs', quiet)
+	
+	file_dictionary = os.path.join('data', 'gensim.dictionary')
+	file_corpus     = os.path.join('data', 'gensim.corpus_tfidf.mm')
+	file_index      = os.path.join('data', 'gensim.index')
+	
+	dictionary = corpora.Dictionary.load(file_dictionary)
+	
+	upd = incremental.Update(old_defs, defs, read_lookup_id(quiet), dictionary,
+				lambda d: def_tokens(d, opt.stem), quiet)
+	
+	upd.run(state, sparse.load_npz(incremental.file_counts),
+				matrix.load_csr(file_corpus, quiet), opt.tolerance)
+	
+	# save the new state
+	
+	write_dict(defs, 'full_defs', quiet)
+	incremental.save_state(state['tokens'], opt.stem, quiet, state['count'])
+	
+	glosses.build(state['tokens'], opt.stem, quiet).save(quiet=quiet)
+	incremental.save_counts(upd.counts, quiet)
+	
+	write_lookups(dict((w, i) for i, w in enumerate(upd.by_id)), upd.by_id, quiet)
+	
+	if not quiet:
+		print 'Saving dictionary as ' + file_dictionary
+	
+	dictionary.save(file_dictionary)
+	
+	if not quiet:
+		print 'Saving corpus as matrix ' + file_corpus
+	
+	corpora.MmCorpus.serialize(file_corpus, matrix.to_corpus(upd.weights))
+	
+	# the gensim index only stores the vectors, so
+	# rebuilding it is linear in the size of the corpus
+	
+	corpus_index = upd.weights
+	
+	if opt.dedup:
+		groups, reps = dedup.group_rows(matrix.row_keys(upd.weights), quiet)
+		dedup.save_groups(groups, file_index, quiet)
+		
+		corpus_index = upd.weights[reps]
+	else:
+		dedup.remove_groups(file_index)
+	
+	plan = plan_memory(upd.weights.shape[0], corpus_index.shape[0], len(dictionary),
+				upd.weights.nnz, False, opt)
+	
+	monitor = None
+	
+	if plan is not None:
+		monitor = budget.Monitor()
+		monitor.start()
+	
+	save_index(matrix.to_corpus(corpus_index), len(dictionary), quiet, plan)
+	
+	# refresh the neighbour lists
+	
+	if neighbours.exists():
+		ids, scores = neighbours.load(mmap_mode=None, quiet=quiet)
+		
+		k = opt.neighbours or ids.shape[1]
+		
+		ids, scores = upd.patch_neighbours(ids, scores, k)
+	
+	elif opt.neighbours:
+		if plan is None:
+			ids, scores = neighbours.topk(upd.weights, opt.neighbours, quiet=quiet)
+		else:
+			ids, scores = neighbours.topk(upd.weights, opt.neighbours, quiet=quiet,
+						block=plan.block, dtype=plan.dtype)
+	
+	else:
+		ids = None
+	
+	report_memory(plan, monitor, quiet)
+	
+	if ids is not None:
+		neighbours.save(ids, scores, quiet=quiet)
+	
+	# check against a rebuild from scratch
+	
+	if opt.verify:
+		verify(defs, opt.stem, upd, ids, scores, quiet)
+
+
+def verify(defs, stem_flag, upd, ids, scores, quiet):
+	'''Compare an incremental update with a full rebuild'''
+	
+	if not quiet:
+		print 'Rebuilding from scratch for comparison'
+	
+	defs = bag_of_words(dict(defs), stem_flag, 1)
+	
+	by_id  = defs.keys()
+	corpus = [defs[lemma] for lemma in by_id]
+	
+	dictionary = corpora.Dictionary(corpus)
+	corpus = [dictionary.doc2bow(doc) for doc in corpus]
+	
+	full = matrix.to_csr(models.TfidfModel(corpus)[corpus], len(dictionary))
+	
+	terms      = [upd.dictionary[i] for i in range(len(upd.dictionary))]
+	full_terms = [dictionary[i] for i in range(len(dictionary))]
+	
+	diff = incremental.compare(upd.by_id, upd.weights, terms, by_id, full, full_terms)
+	
+	if diff is None:
+		print 'Verify: headwords differ from a full rebuild'
+		return
+	
+	print 'Verify: largest tf-idf weight difference {:.2e}'.format(diff)
+	
+	if ids is None:
+		return
+	
+	# neighbours of the rebuild, in the update's headword order
+	
+	full = incremental.align(upd.by_id, terms, by_id, full, full_terms)
+	
+	full_ids, full_scores = neighbours.topk(full, ids.shape[1], quiet=1)
+	
+	tol = 1e-5
+	
+	worst = abs(full_scores - scores).max(axis=1)
+	
+	# where the ids differ, the rebuild's pick must score the same
+	# in the update as the update's own, i.e. the two were tied
+	
+	r, c = numpy.nonzero(ids != full_ids)
+	
+	picked = full_ids[r, c]
+	valid  = picked >= 0
+	
+	tied = numpy.zeros(len(r), dtype=bool)
+	
+	if valid.any():
+		cos = upd.weights[r[valid]].multiply(upd.weights[picked[valid]]).sum(axis=1)
+		tied[valid] = abs(numpy.asarray(cos).ravel() - scores[r[valid], c[valid]]) < tol
+	
+	tied &= ids[r, c] >= 0
+	
+	bad = worst >= tol
+	bad[r[~tied]] = True
+	
+	print 'Verify: {} of {} neighbour lists match a full rebuild, up to ties'.format(
+		int((~bad).sum()), len(bad))
+	print 'Verify: largest neighbour score difference {:.2e}'.format(
+		float(worst.max()) if len(worst) else 0.)
+
 
 def main():
 	
@@ -350,12 +1052,63 @@ def main():
 				help='Apply porter2 stemmer to definitions')
 	parser.add_argument('-t', '--topics', metavar='N', type=int,
 				help='Perform LSI with N topics')
+	parser.add_argument('-p', '--project', metavar='N', type=int,
+				help='Reduce to N dimensions by sparse random projection instead of LSI')
+	parser.add_argument('--seed', metavar='S', type=int, default=0,
+				help='With -p, seed for the random projection; default 0')
+	parser.add_argument('-d', '--dedup', action='store_const', const=1,
+				help='Index each distinct definition only once')
+	parser.add_argument('-k', '--neighbours', metavar='K', type=int,
+				help='Save the top K neighbours of every headword')
+	parser.add_argument('-u', '--update', action='store_const', const=1,
+				help='Update the results of the last run instead of rebuilding')
+	parser.add_argument('--tolerance', metavar='T', type=float, default=1e-6,
+				help='With -u, ignore weight changes smaller than T')
+	parser.add_argument('--verify', action='store_const', const=1,
+				help='With -u, compare the result with a full rebuild')
+	parser.add_argument('-w', '--weighting', choices=sorted(weighting.SCHEMES), default='tfidf',
+				help='How to weight terms; default tfidf')
+	parser.add_argument('-r', '--reweight', action='store_const', const=1,
+				help='Reweight the saved term counts instead of rebuilding')
+	parser.add_argument('-e', '--engine', choices=sorted(engines), default='mmap',
+				help='How to read the XML lexica; default mmap')
+	parser.add_argument('--no-xref', dest='xref', action='store_false',
+				help="Don't copy definitions to headwords that only cross-reference")
+	parser.add_argument('--check-standardize', action='store_const', const=1,
+				help='Test the compiled standardizers against standardize(), then stop')
+	parser.add_argument('--compare', metavar='ENGINE', choices=sorted(engines),
+				help='Compare the engine with ENGINE, then stop')
+	parser.add_argument('--compare-reduction', metavar='N', type=int,
+				help='Compare LSI and random projection to N dimensions, then stop')
+	parser.add_argument('--memory-budget', metavar='SIZE', type=budget.parse_size,
+				help='Fit the similarity stage in SIZE bytes of memory, e.g. 4G')
 	parser.add_argument('-q', '--quiet', action='store_const', const=1,
 				help='Print less info')
 	
 	opt = parser.parse_args()
 	quiet = opt.quiet
 	
+	if opt.check_standardize:
+		if not check_standardize(['la', 'grc'], opt.quiet):
+			sys.exit(1)
+		return
+	
+	if opt.compare is not None:
+		compare_engines(['la', 'grc'], opt.engine, opt.compare, opt.quiet)
+		return
+	
+	if opt.topics and opt.project:
+		print 'Use either --topics or --project, not both'
+		sys.exit(1)
+	
+	if opt.compare_reduction is not None:
+		compare_reduction(opt.compare_reduction, opt)
+		return
+	
+	if opt.reweight:
+		reweight(opt)
+		return
+	
 	#
 	# read the dictionaries
 	#
@@ -363,12 +1116,34 @@ def main():
 	if opt.cache == 1:
 		defs = read_dict('full_defs', opt.quiet)
 	else:
-		defs = parse_XML_dictionaries(['la', 'grc'], opt.quiet)
-		write_dict(defs, 'full_defs', opt.quiet)
+		defs = parse_XML_dictionaries(['la', 'grc'], opt.quiet, opt.engine, opt.xref)
+		
+		if opt.update is None:
+			write_dict(defs, 'full_defs', opt.quiet)
+	
+	# patch the last run rather than starting over
+	
+	if opt.update == 1:
+		if opt.topics:
+			print 'LSI models cannot be updated; ignoring --topics'
+		
+		if opt.project:
+			print 'Projections cannot be updated; ignoring --project'
+		
+		update(defs, opt)
+		return
 	
 	# convert to bag of words
 	
-	defs = bag_of_words(defs, opt.stem, opt.quiet)
+	raw = dict()
+	
+	defs = bag_of_words(defs, opt.stem, opt.quiet, raw)
+	
+	incremental.save_state(raw, opt.stem, opt.quiet)
+	
+	# English term -> headword search
+	
+	glosses.build(raw, opt.stem, opt.quiet).save(quiet=opt.quiet)
 	
 	# write_dict(defs, 'bow_defs')
 	
@@ -409,39 +1184,148 @@ def main():
 		print 'Converting each doc to bag-of-words'
 	
 	corpus = [dictionary.doc2bow(doc) for doc in corpus]
+	
+	counts = matrix.to_csr(corpus, len(dictionary))
 		
-	# calculate tf-idf scores
+	incremental.save_counts(counts, opt.quiet)
 	
-	if not opt.quiet:
-		print 'Creating tf-idf model'
+	build_index(counts, dictionary, opt)
+
+
+def reweight(opt):
+	'''Rebuild everything after the term counts with new weights'''
+	
+	if not os.path.exists(incremental.file_counts):
+		print 'No saved term counts; run once without --reweight'
+		sys.exit(1)
+	
+	counts = weighting.load_counts(opt.quiet)
+	
+	dictionary = corpora.Dictionary.load(os.path.join('data', 'gensim.dictionary'))
+	
+	build_index(counts, dictionary, opt)
+
+
+def compare_reduction(dims, opt):
+	'''Time LSI and random projection to dims dimensions from the saved counts
+	
+	Each is scored by how many of every headword's top k neighbours
+	in the full weighted space it finds (k from -k, default 10).
+	'''
+	
+	quiet = opt.quiet
+	
+	if not os.path.exists(incremental.file_counts):
+		print 'No saved term counts; run once first'
+		sys.exit(1)
+	
+	scheme = weighting.last_scheme()
+	
+	weighted = weighting.apply(scheme, weighting.load_counts(quiet))
+	
+	dictionary = corpora.Dictionary.load(os.path.join('data', 'gensim.dictionary'))
+	
+	k = opt.neighbours or 10
+	
+	if not quiet:
+		print 'Finding top {} neighbours by {}'.format(k, scheme)
+	
+	exact, exact_scores = neighbours.topk(weighted, k, quiet=1)
 	
-	tfidf = models.TfidfModel(corpus)
+	def overlap(ids):
+		'''Mean fraction of each row's exact neighbours that ids finds'''
+		
+		valid = exact >= 0
+		
+		found = (exact[:, :, None] == ids[:, None, :]).any(axis=2) & valid
 		
+		return float(found.sum(axis=1).sum()) / max(valid.sum(), 1)
+	
+	rows = []
+	
+	# lsi
+	
+	if not quiet:
+		print 'Performing LSI with {} topics'.format(dims)
+	
+	t = time.time()
+	
+	corpus = matrix.to_corpus(weighted)
+	
+	lsi = models.LsiModel(corpus, id2word=dictionary, num_topics=dims)
+	reduced = matrix.normalize(matrix.to_csr(lsi[corpus], dims))
+	
+	t_build = time.time() - t
+	
+	ids, scores = neighbours.topk(reduced, k, quiet=1)
+	
+	rows.append(('lsi', t_build, overlap(ids), ids))
+	
+	# random projection
+	
+	if not quiet:
+		print 'Projecting onto {} random dimensions'.format(dims)
+	
+	t = time.time()
+	
+	reduced = matrix.normalize(sparse.csr_matrix(
+		projection.project(weighted, dims, opt.seed, file=None, quiet=1)))
+	
+	t_build = time.time() - t
+	
+	ids, scores = neighbours.topk(reduced, k, quiet=1)
+	
+	rows.append(('projection', t_build, overlap(ids), ids))
+	
+	print
+	print '{0:12s}{1:>8s}{2:>12s}{3:>16s}'.format('method', 'dims', 'build (s)',
+											'top-{} overlap'.format(k))
+	
+	for name, t_build, frac, ids in rows:
+		print '{0:12s}{1:8d}{2:12.2f}{3:16.3f}'.format(name, dims, t_build, frac)
+	
+	both = (rows[0][3][:, :, None] == rows[1][3][:, None, :]).any(axis=2) & (rows[0][3] >= 0)
+	
+	print
+	print 'LSI and projection share {:.3f} of their top {} neighbours'.format(
+		float(both.sum()) / max((rows[0][3] >= 0).sum(), 1), k)
+
+
+def build_index(counts, dictionary, opt):
+	'''Weight the term counts; save the corpora, index and neighbours'''
+	
 	if not opt.quiet:
-		print 'Transforming the corpus to tf-idf'
+		print 'Weighting terms by ' + opt.weighting
+	
+	weighted = weighting.apply(opt.weighting, counts)
+		
+	weighting.save_scheme(opt.weighting)
 	
-	corpus_tfidf = tfidf[corpus]
+	corpus_weighted = matrix.to_corpus(weighted)
 	
 	# save corpus in market matrix format
+	# (under its old name, whatever the weighting)
 	
 	file_corpus = os.path.join('data', 'gensim.corpus_tfidf.mm')
 	
 	if not opt.quiet:
 		print 'Saving corpus as matrix ' + file_corpus
 	
-	corpora.MmCorpus.serialize(file_corpus, corpus_tfidf)
+	corpora.MmCorpus.serialize(file_corpus, corpus_weighted)
 	
 	# perform lsi transformation
 
-	corpus_final = corpus_tfidf
+	corpus_final = corpus_weighted
+	num_features = len(dictionary)
+	lsi = None
 
 	if opt.topics is not None and opt.topics > 0:
 		if not opt.quiet:
 			print 'Performing LSI with {} topics'.format(opt.topics)
 		
-		lsi = models.LsiModel(corpus_tfidf, id2word=dictionary, num_topics=opt.topics)
+		lsi = models.LsiModel(corpus_weighted, id2word=dictionary, num_topics=opt.topics)
 		
-		corpus_final = lsi[corpus_tfidf]
+		corpus_final = lsi[corpus_weighted]
 
 		# save corpus in market matrix format
 
@@ -450,24 +1334,104 @@ def main():
 		if not opt.quiet:
 			print 'Saving corpus as matrix ' + file_corpus
 
-		if opt.topics is not None and opt.topics > 0:
-			corpora.MmCorpus.serialize(file_corpus, corpus_final)
+		corpora.MmCorpus.serialize(file_corpus, corpus_final)
+		
+		num_features = opt.topics
+	
+	# or project onto random dimensions
+	
+	projected = None
+	
+	if opt.project is not None and opt.project > 0:
+		if not opt.quiet:
+			print 'Projecting onto {} random dimensions'.format(opt.project)
+		
+		projected = projection.project(weighted, opt.project, opt.seed, quiet=opt.quiet)
+		
+		corpus_final = matutils.Dense2Corpus(projected, documents_columns=False)
+		
+		# saved where the query scripts look for LSI (-l)
+		
+		file_corpus = os.path.join('data', 'gensim.corpus_lsi.mm')
+		
+		if not opt.quiet:
+			print 'Saving corpus as matrix ' + file_corpus
+		
+		corpora.MmCorpus.serialize(file_corpus, corpus_final)
+		
+		num_features = opt.project
+	
+	# -u can't refit either, so it needs to know
+	
+	if lsi is not None:
+		incremental.save_reduction('lsi', opt.topics)
+	elif projected is not None:
+		incremental.save_reduction('projection', opt.project)
+	else:
+		incremental.save_reduction()
+	
+	file_index = os.path.join('data', 'gensim.index')
+	
+	# collapse headwords with identical definitions;
+	# the index is built over one copy of each, and 
+	# dedup.load_index fans its results back out
+	
+	corpus_index = corpus_final
+	
+	if opt.dedup:
+		groups, reps = dedup.group_rows(matrix.row_keys(counts), opt.quiet)
+		dedup.save_groups(groups, file_index, opt.quiet)
+		
+		corpus_index = matrix.to_corpus(weighted[reps])
+		
+		if lsi is not None:
+			corpus_index = lsi[corpus_index]
+		
+		if projected is not None:
+			corpus_index = matutils.Dense2Corpus(projected[reps], documents_columns=False)
+	else:
+		dedup.remove_groups(file_index)
+	
+	# fit what follows to the memory budget, if any
+	
+	dense = lsi is not None or projected is not None
+	
+	n_index = len(reps) if opt.dedup else weighted.shape[0]
+	
+	if dense:
+		nnz = weighted.shape[0] * num_features
+	else:
+		nnz = weighted.nnz
+	
+	plan = plan_memory(weighted.shape[0], n_index, num_features, nnz, dense, opt)
+	
+	monitor = None
+	
+	if plan is not None:
+		monitor = budget.Monitor()
+		monitor.start()
 	
 	# calculate similarities
 
-	if not opt.quiet:
-		print 'Calculating similarities (please be patient)'
+	save_index(corpus_index, num_features, opt.quiet, plan)
 	
-	dir_calc = os.path.join('data', 'sims')
+	# top k neighbours of every headword
 	
-	index = similarities.Similarity(dir_calc, corpus_final, len(corpus_final))
+	if opt.neighbours:
+		if not opt.quiet:
+			print 'Finding top {} neighbours'.format(opt.neighbours)
 	
-	file_index = os.path.join('data', 'gensim.index')
+		csr = matrix.normalize(matrix.to_csr(corpus_final, num_features))
+		
+		if plan is None:
+			ids, scores = neighbours.topk(csr, opt.neighbours, quiet=opt.quiet)
+		else:
+			ids, scores = neighbours.topk(csr, opt.neighbours, quiet=opt.quiet,
+						block=plan.block, dtype=plan.dtype)
 	
-	if not opt.quiet:
-		print 'Saving similarity index ' + file_index
+		neighbours.save(ids, scores, quiet=opt.quiet)
 	
-	index.save(file_index)
+	report_memory(plan, monitor, opt.quiet)
 	
 	
 if __name__ == '__main__':
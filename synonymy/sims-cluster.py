@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Cluster the neighbour graph into candidate synsets
+
+Links every headword to those of its top k neighbours, from
+data/neighbours.*.npy as written by read_lexicon.py -k or
+sims-shard.py, that score above a threshold.  The graph is split
+into clusters by connected components or by label propagation, and
+the clusters are written one per line in the synset format read by
+synset-check.py.
+
+See README for workflow details.
+"""
+
+import os
+import sys
+import time
+import pickle
+import argparse
+
+import numpy
+
+from Tesserae import neighbours
+from Tesserae import clusters
+from Tesserae import matrix
+
+
+def main():
+
+	#
+	# check for options
+	#
+	
+	parser = argparse.ArgumentParser(
+			description='Cluster the neighbour graph into candidate synsets')
+	parser.add_argument('-t', '--threshold', metavar='T', default=0.5, type=float,
+			help = 'Keep edges scoring above T; default 0.5')
+	parser.add_argument('-m', '--mutual', action='store_const', const=1,
+			help = 'Keep only edges between headwords in each other\'s lists')
+	parser.add_argument('-a', '--algorithm', choices=['components', 'propagation'],
+			default='components',
+			help = 'Connected components or label propagation; default components')
+	parser.add_argument('--iterations', metavar='N', default=20, type=int,
+			help = 'With -a propagation, at most N rounds; default 20')
+	parser.add_argument('--seed', metavar='S', default=0, type=int,
+			help = 'With -a propagation, random seed; default 0')
+	parser.add_argument('--lang', choices=['la', 'grc'],
+			help = 'Cluster only Latin or only Greek headwords')
+	parser.add_argument('--min-size', metavar='N', default=2, type=int,
+			help = 'Leave out clusters of fewer than N headwords; default 2')
+	parser.add_argument('--max-size', metavar='N', type=int,
+			help = 'Leave out clusters of more than N headwords')
+	parser.add_argument('-o', '--output', metavar='FILE', default='candidates.synsets',
+			help = 'Destination file; default candidates.synsets')
+	parser.add_argument('-q', '--quiet', action='store_const', const=1,
+			help = 'Print less info')
+	
+	opt = parser.parse_args()
+	
+	if not neighbours.exists():
+		print 'No neighbour table; run read_lexicon.py -k K first'
+		sys.exit(1)
+	
+	ids, scores = neighbours.load(quiet=opt.quiet)
+	
+	file_lookup_id = os.path.join('data', 'lookup_id.pickle')
+	
+	if not opt.quiet:
+		print 'Loading index ' + file_lookup_id
+	
+	f = open(file_lookup_id, 'r')
+	by_id = pickle.load(f)
+	f.close()
+	
+	keep = None
+	
+	if opt.lang is not None:
+		keep = matrix.greek_mask(by_id) == (opt.lang == 'grc')
+	
+	#
+	# build and cluster the graph
+	#
+	
+	t = time.time()
+	
+	adj = clusters.graph(ids, scores, opt.threshold, opt.mutual, keep)
+	
+	if not opt.quiet:
+		print 'Graph: {} headwords with edges, {} edges'.format(
+			int((numpy.diff(adj.indptr) > 0).sum()), adj.nnz / 2)
+	
+	if opt.algorithm == 'components':
+		labels = clusters.components(adj)
+	else:
+		labels = clusters.propagate(adj, opt.iterations, opt.seed)
+	
+	found = clusters.groups(labels, opt.min_size, opt.max_size)
+	
+	# headwords of the other language are left on their own
+	
+	if keep is not None:
+		found = [g for g in found if keep[g[0]]]
+	
+	seconds = time.time() - t
+	
+	clusters.write_synsets(opt.output, found, by_id)
+	
+	if not opt.quiet:
+		sizes = [len(g) for g in found]
+		
+		print 'Wrote {} clusters of {} headwords to {} in {:.2f}s'.format(
+			len(found), sum(sizes), opt.output, seconds)
+		
+		if sizes:
+			print 'Largest {}, median {}'.format(max(sizes), int(numpy.median(sizes)))
+
+
+if __name__ == '__main__':
+	main()
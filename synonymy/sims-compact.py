@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Store the neighbour table in compact form
+
+Converts data/neighbours.ids.npy and data/neighbours.scores.npy,
+as written by read_lexicon.py -k or sims-shard.py, into a single
+compact file: scores quantized to float16, or to int8 with a scale
+per row, and neighbour ids delta- and varint-encoded in rank order.
+Read it back with Tesserae.compact.CompactTable.
+
+Prints a report of how quantization changes the ranks.
+
+See README for workflow details.
+"""
+
+import os
+import argparse
+
+from Tesserae import neighbours
+from Tesserae import compact
+
+
+def main():
+
+	#
+	# check for options
+	#
+	
+	parser = argparse.ArgumentParser(
+			description='Store the neighbour table in compact form')
+	parser.add_argument('-m', '--mode', choices=sorted(compact.DTYPES), default='int8',
+			help = 'Score quantization; default int8')
+	parser.add_argument('-o', '--output', metavar='FILE',
+			default=os.path.join('data', 'neighbours.compact.npz'),
+			help = 'Destination file')
+	parser.add_argument('-q', '--quiet', action='store_const', const=1,
+			help = 'Print less info')
+	
+	opt = parser.parse_args()
+	
+	ids, scores = neighbours.load(quiet=opt.quiet)
+	
+	if not opt.quiet:
+		print 'Writing {} x {} neighbours to {}'.format(ids.shape[0], ids.shape[1], opt.output)
+	
+	compact.save(opt.output, ids, scores, opt.mode)
+	
+	#
+	# check the round trip and report fidelity
+	#
+	
+	table = compact.CompactTable(opt.output)
+	
+	ids_c, scores_c = table.rows()
+	
+	if not (ids_c == ids).all():
+		print 'Warning: ids did not survive the round trip'
+	
+	raw  = ids.nbytes + scores.nbytes
+	size = os.path.getsize(opt.output)
+	
+	print 'Size: {} bytes, {:.1f}% of {} bytes uncompressed'.format(
+		size, 100. * size / max(raw, 1), raw)
+	
+	report = compact.fidelity(scores, scores_c, ids)
+	
+	print 'Largest score error:       {:.2e}'.format(report['max_error'])
+	print 'Rows with unchanged ranks: {:.2%}'.format(report['rows_intact'])
+	print 'Mean rank change:          {:.4f}'.format(report['mean_shift'])
+	print 'Largest rank change:       {}'.format(report['max_shift'])
+	print 'Neighbours newly tied:     {:.2%}'.format(report['new_ties'])
+
+
+if __name__ == '__main__':
+	main()
@@ -2,8 +2,12 @@
 """
 Return the top similarity hits for query headwords
 
-Prompts the user for query words.  The top n hits 
-from the similarity matrix are returned to STDOUT.
+Takes every headword in turn as a query and writes its top n hits
+from the similarity matrix to a CSV file, one line per query.
+Queries are scored a block at a time while a separate thread
+encodes and writes the finished blocks.  With --binary, the hits
+are saved instead as columns that Tesserae.translations reads
+memory-mapped; --from-binary turns those back into the CSV.
 
 Requires package 'gensim'.
 
@@ -13,12 +17,21 @@ See README.txt for workflow details.
 import pickle
 import os
 import sys
-import codecs
+import time
+import hashlib
 import unicodedata
 import argparse
+
+import numpy
 from gensim import corpora, models, similarities
 
-from Tesserae import progressbar
+from Tesserae import dedup
+from Tesserae import matrix
+from Tesserae import mutual
+from Tesserae import neighbours
+from Tesserae import writer
+from Tesserae import checkpoint
+from Tesserae import translations
 
 by_word  = dict()
 corpus   = []
@@ -27,38 +40,103 @@ index    = []
 full_def = dict()
 
 
-def get_results(q, n, file, filter):
-	"""test query q against the similarity matrix"""
-		
-	row = [q]
+def top_hits(queries, n, keep=None):
+	"""test a block of queries against the similarity matrix
+	
+	queries is a list of (headword, id); keep, if given, is a boolean
+	array of the headwords allowed as hits.  Returns the ids and
+	scores of each query's top n hits, best first, ties in id order.
+	"""
+	
+	sims = numpy.array(index[[corpus[q_id] for q, q_id in queries]], dtype=numpy.float32, ndmin=2)
+	
+	if keep is not None:
+		sims[:, ~keep] = -numpy.inf
+		kk = min(n, int(keep.sum()))
+	else:
+		kk = min(n, sims.shape[1])
+	
+	return neighbours.select_exact(sims, kk, positive=False)
+
+
+def get_results(queries, n, keep=None):
+	"""one CSV line per query: the query and its top n hits"""
+	
+	hits, scores = top_hits(queries, n, keep)
+	
+	return [u','.join([q] + [by_id[r_id] for r_id in row])
+				for (q, q_id), row in zip(queries, hits)]
+
+
+def export_view(stem, file_output, opt, quiet=0):
+	"""write the CSV view of a columnar export"""
+	
+	try:
+		table = translations.TranslationTable(stem)
+	except IOError as err:
+		print "Can't read {0}.*: {1}".format(stem, str(err))
+		sys.exit(1)
+	
+	try:
+		out = writer.BlockWriter(file_output, opt.compress, opt.queue)
 		
-	if (q in by_word):
-		q_id = by_word[q]
-				
-		# query the similarity matrix
+		for i in range(0, len(table), 4096):
+			out.put(table.lines(i, i + 4096))
 		
-		sims = index[corpus[q_id]]
-		sims = sorted(enumerate(sims), key=lambda item: -item[1])
-				
-		# display each result, its score, and text-only def
+		out.close()
+	except (IOError, OSError) as err:
+		print "Can't write {0}: {1}".format(file_output, str(err))
+		sys.exit(1)
+	
+	if not quiet:
+		print 'Wrote {0} lines, {1:.1f} MB in {2:.1f}s'.format(
+			out.lines, out.bytes / float(1 << 20), out.seconds)
+
+
+def report(done, total, seconds, out):
+	"""progress, with scoring and writing throughput"""
+	
+	print '\r{0:3d}% done; scoring {1:.0f} rows/s, writing {2:.0f} rows/s ({3:.1f} MB/s)'.format(
+		100 * done / max(total, 1),
+		done / max(seconds, 1e-9),
+		out.lines / max(out.seconds, 1e-9),
+		out.bytes / float(1 << 20) / max(out.seconds, 1e-9)),
+	sys.stdout.flush()
+
+
+def export_mutual(file_corpus, file_output, k, opt, quiet=0):
+	"""write the Latin-Greek pairs each in the other's top k"""
+	
+	csr = matrix.normalize(matrix.load_csr(file_corpus, quiet))
+	
+	if not quiet:
+		print 'Finding mutual top {0} Latin-Greek neighbours'.format(k)
+	
+	t = time.time()
+	
+	latin, greek, scores, rank_la, rank_grc = mutual.mutual(
+		csr, matrix.greek_mask(by_id), k, opt.block, quiet)
+	
+	seconds = time.time() - t
+	
+	try:
+		out = writer.BlockWriter(file_output, opt.compress, opt.queue)
 		
-		for pair in sims:	
-			r_id, score = pair
-			
-			r = by_id[r_id]
-			
-			if filter and is_greek(r) != (filter - 1):
-				continue
+		for i in range(0, len(latin), 4096):
+			j = slice(i, i + 4096)
 			
-			row.append(r)
-					
-			if len(row) > n:
-				break
+			out.put([u'{0},{1},{2:.6f},{3},{4}'.format(by_id[a], by_id[b], s, ra, rb)
+						for a, b, s, ra, rb in zip(latin[j], greek[j], scores[j], rank_la[j], rank_grc[j])])
 		
-		if file is not None:
-			file.write(u','.join(row) + '\n')
-		else:
-			print u','.join(row)
+		out.close()
+	except (IOError, OSError) as err:
+		print "Can't write {0}: {1}".format(file_output, str(err))
+		sys.exit(1)
+	
+	if not quiet:
+		print
+		print 'Found {0} mutual pairs in {1:.1f}s; wrote {2:.1f} MB in {3:.1f}s'.format(
+			len(latin), seconds, out.bytes / float(1 << 20), out.seconds)
 
 
 def is_greek(form):
@@ -72,7 +150,7 @@ def is_greek(form):
 
 
 def main():
-	
+
 	#
 	# check for options
 	#
@@ -85,6 +163,24 @@ def main():
 			help = 'Translation mode: 1=Latin to Greek; 2=Greek to Latin')
 	parser.add_argument('-l', '--lsi', action='store_const', const=1,
 			help = 'Use LSI to reduce dimensionality')
+	parser.add_argument('-o', '--output', metavar='FILE', default='trans2.csv',
+			help = 'Write to FILE; default trans2.csv')
+	parser.add_argument('-z', '--compress', metavar='TYPE', choices=writer.COMPRESSION,
+			help = 'Compress the output: ' + ' or '.join(writer.COMPRESSION))
+	parser.add_argument('-b', '--block', metavar='N', default=256, type=int,
+			help = 'Score N queries at a time; default 256')
+	parser.add_argument('--queue', metavar='N', default=8, type=int,
+			help = 'Let up to N scored blocks wait for the writer; default 8')
+	parser.add_argument('--checkpoint', metavar='SECONDS', default=60, type=float,
+			help = 'Save progress this often; default 60, 0 for never')
+	parser.add_argument('--resume', action='store_const', const=1,
+			help = 'Carry on from the last checkpoint of an interrupted run')
+	parser.add_argument('-m', '--mutual', metavar='K', type=int,
+			help = 'Write Latin-Greek pairs each in the other\'s top K instead')
+	parser.add_argument('--binary', metavar='STEM',
+			help = 'Write the results as memory-mappable columns STEM.*.npy instead')
+	parser.add_argument('--from-binary', metavar='STEM',
+			help = 'Write the CSV from the columns saved with --binary STEM; no scoring')
 	
 	opt = parser.parse_args()
 	
@@ -92,7 +188,29 @@ def main():
 		opt.translate = 0
 	
 	quiet = 0
+	
+	if opt.mutual is not None and (opt.binary is not None or opt.from_binary is not None):
+		print 'Translation pairs are only written as CSV; use --mutual without --binary or --from-binary'
+		sys.exit(1)
+	
+	if opt.binary is not None and opt.compress is not None:
+		print 'Columns are not compressed; ignoring --compress'
+		opt.compress = None
+	
+	# the CSV as a view of saved columns
+	
+	if opt.from_binary is not None:
+		file_output = opt.output
+		
+		if opt.compress is not None and not file_output.endswith(writer.SUFFIX[opt.compress]):
+			file_output += writer.SUFFIX[opt.compress]
 		
+		if not quiet:
+			print 'Writing {0}.* as {1}'.format(opt.from_binary, file_output)
+		
+		export_view(opt.from_binary, file_output, opt, quiet)
+		return
+	
 	#
 	# read the text-only defs
 	#
@@ -101,7 +219,7 @@ def main():
 	
 	if not quiet:
 		print 'Reading ' + file_dict
-
+	
 	f = open(file_dict, 'r')
 	
 	# store the defs
@@ -115,7 +233,7 @@ def main():
 	#
 	# load data created by calc-matrix.py
 	#
-		
+	
 	# the index by word
 	
 	global by_word
@@ -151,37 +269,145 @@ def main():
 	else:
 		file_corpus = 'data/gensim.corpus_lsi.mm'
 	
+	# the output file, or stem of the columns
+	
+	file_output = opt.output
+	
+	if opt.binary is not None:
+		file_output = opt.binary
+	
+	if opt.compress is not None and not file_output.endswith(writer.SUFFIX[opt.compress]):
+		file_output += writer.SUFFIX[opt.compress]
+	
+	if not quiet:
+		print 'Exporting dictionary to ' + file_output + ('.*' if opt.binary else '')
+	
+	# translation pairs are found straight from the corpus
+	
+	if opt.mutual is not None:
+		export_mutual(file_corpus, file_output, opt.mutual, opt, quiet)
+		return
+	
 	corpus = corpora.MmCorpus(file_corpus)
 	
 	# the similarities index
 	
 	global index
 	
-	file_index = 'data/gensim.index'
-	
-	if not quiet:		
-		print 'Loading similarity index ' + file_index
-	
-	index = similarities.Similarity.load(file_index)
+	index = dedup.load_index('data/gensim.index', quiet)
 	
- 	if not quiet:
-		print 'Exporting dictionary'
+	# the headwords allowed as hits
 	
-	file_output = codecs.open('trans2.csv', 'w', encoding='utf_8')
+	keep = None
 	
-	pr = progressbar.ProgressBar(len(by_word), quiet)
+	if opt.translate:
+		keep = numpy.array([is_greek(r) == (opt.translate - 1) for r in by_id], dtype=bool)
 	
 	# take each headword in turn as a query
 	
+	queries = []
+	
 	for q in by_word:
-		pr.advance()
-		
 		q = unicodedata.normalize('NFC', q)
-			
+		
 		if opt.translate and is_greek(q) == (opt.translate - 1):
 			continue
-
-		get_results(q, opt.results, file_output, opt.translate)
+		
+		if q in by_word:
+			queries.append((q, by_word[q]))
+	
+	# a checkpoint is only good for the same queries against the same data
+	
+	digest = hashlib.sha1(u'\n'.join(q for q, q_id in queries).encode('utf_8')).hexdigest()
+	
+	ck = checkpoint.Checkpoint(file_output + '.checkpoint', {
+		'results':   opt.results,
+		'translate': opt.translate,
+		'compress':  opt.compress,
+		'binary':    opt.binary is not None,
+		'queries':   digest,
+		'files':     checkpoint.stamp([file_corpus, 'data/gensim.index', file_lookup_id])
+	})
+	
+	start  = 0
+	offset = None
+	
+	if opt.resume:
+		try:
+			ck.load()
+		except (IOError, ValueError, KeyError) as err:
+			print "Can't resume from {0}: {1}".format(ck.file, str(err))
+			sys.exit(1)
+		
+		start  = ck.prefix()
+		offset = ck.info['offset']
+		
+		if not quiet:
+			print 'Resuming after {0} of {1} queries'.format(start, len(queries))
+	
+	try:
+		if opt.binary is None:
+			out = writer.BlockWriter(file_output, opt.compress, opt.queue, offset=offset)
+		else:
+			if not opt.resume:
+				translations.write_lexicon(file_output, by_id)
+			
+			width = min(opt.results, len(by_id) if keep is None else int(keep.sum()))
+			
+			out = translations.ColumnWriter(file_output, [q_id for q, q_id in queries],
+						width, len(by_id), opt.resume)
+	except IOError as err:
+		print "Can't write {0}: {1}".format(file_output, str(err))
+		sys.exit(1)
+	
+	def saver(end):
+		'''Record queries up to end as written, once they're on disk'''
+		
+		def save(offset):
+			ck.add(0, end)
+			ck.info['offset'] = offset
+			ck.save()
+		
+		return save
+	
+	# score in this thread, write in the other
+	
+	seconds = 0.
+	last    = time.time()
+	
+	try:
+		for i in range(start, len(queries), opt.block):
+			end = min(i + opt.block, len(queries))
+			
+			t = time.time()
+			
+			if opt.binary is None:
+				block = get_results(queries[i:end], opt.results, keep)
+			else:
+				block = (i,) + top_hits(queries[i:end], opt.results, keep)
+			
+			seconds += time.time() - t
+			
+			out.put(block)
+			
+			if opt.checkpoint > 0 and time.time() - last >= opt.checkpoint:
+				out.sync(saver(end))
+				last = time.time()
+			
+			if not quiet:
+				report(end - start, len(queries) - start, seconds, out)
+		
+		out.close()
+	except (IOError, OSError) as err:
+		print "Can't write {0}: {1}".format(file_output, str(err))
+		sys.exit(1)
+	
+	ck.remove()
+	
+	if not quiet:
+		print
+		print 'Scored {0} queries in {1:.1f}s; wrote {2:.1f} MB in {3:.1f}s; waited {4:.1f}s for the writer'.format(
+			len(queries) - start, seconds, out.bytes / float(1 << 20), out.seconds, out.waited)
 
 
 if __name__ == '__main__':
@@ -5,6 +5,10 @@ Return the top similarity hits for query headwords
 Prompts the user for query words.  The top n hits 
 from the similarity matrix are returned to STDOUT.
 
+With --gloss, queries are English words instead, and the headwords
+whose definitions use them are returned.  With --centroid, each query
+is a group of headwords, scored together.
+
 Requires package 'gensim'.
 
 See README.txt for workflow details.
@@ -13,30 +17,79 @@ See README.txt for workflow details.
 import pickle
 import os
 import sys
+import re
 import codecs
 import unicodedata
+import time
 import argparse
 from gensim import corpora, models, similarities
 
+import read_lexicon
+
+from Tesserae import matrix
+from Tesserae import postings
+from Tesserae import dedup
+from Tesserae import glosses
+from Tesserae import centroids
+from Tesserae import lookup
+
 by_word  = dict()
 corpus   = []
 by_id    = []
 index    = []
 full_def = dict()
+engine   = None
+gloss    = None
+csr      = None
+folded   = None
+
+
+def find_headword(q):
+	"""q if it is indexed, else the one headword it folds to, else None"""
+	
+	if q in by_word:
+		return q
+	
+	heads = [h for h in folded.exact(q) if h in by_word]
+	
+	if len(heads) == 1:
+		return heads[0]
+	
+	return None
 
 
-def get_results(q, n):
+def not_found(q):
+	"""say q isn't indexed, suggesting what it might mean"""
+	
+	heads, how = folded.resolve(q)
+	
+	heads = [h for h in heads if h in by_word]
+	
+	if heads:
+		return u'{0} is not indexed; did you mean: {1}'.format(q, u', '.join(heads)).encode('utf8')
+	
+	return q.encode('utf8') + ' is not indexed.'
+
+
+def get_results(q, n, max_score=False):
 	"""test query q against the similarity matrix"""
 		
-	if (q in by_word):
+	r_q = find_headword(q)
+	
+	if r_q is not None:
+		q = r_q
 		q_id = by_word[q]
 		
 		print 'query = ' + q.encode('utf8')
 		
-		# query the similarity matrix
+		# query the posting lists, if loaded,
+		# otherwise the similarity matrix
 		
-		sims = index[corpus[q_id]]
-		sims = sorted(enumerate(sims), key=lambda item: -item[1])
+		if engine is not None:
+			sims = engine.get_sims(q_id, n, max_score)
+		else:
+			sims = index[corpus[q_id]]
+			sims = sorted(enumerate(sims), key=lambda item: -item[1])
 		
 		# only return n results
 		
@@ -58,12 +111,88 @@ def get_results(q, n):
 				full_def[r].encode('utf8'))
 			
 	else:
-		print q.encode('utf8') + ' is not indexed.'
+		print not_found(q)
 		
 	print
 	print
 
 
+def get_gloss_results(text, n, lang=None):
+	"""find headwords by the English words in their definitions
+	
+	Words marked + are required and words marked - excluded; hits
+	are ranked by the tf-idf weights of the other words they have.
+	"""
+	
+	print 'query = ' + text.encode('utf8')
+	
+	# treat query words as definitions are treated
+	
+	must, may, must_not = [
+		[t for w in words for t in read_lexicon.def_tokens(w, gloss.stem)]
+		for words in glosses.parse_query(text)]
+	
+	t = time.time()
+	
+	ids, scores = gloss.search(must, may, must_not, n, lang)
+	
+	ms = 1000 * (time.time() - t)
+	
+	for r_id, score in zip(ids, scores):
+		r = gloss.heads[r_id]
+		
+		print '{0}\t{1:.3f}  {2}'.format(
+			r.encode('utf8'), 
+			float(score), 
+			full_def.get(r, u'').encode('utf8'))
+	
+	print '{0} hits in {1:.1f} ms'.format(len(ids), ms)
+	print
+	print
+
+
+def parse_group(text):
+	"""the headwords in a query, separated by spaces or commas"""
+	
+	return [unicodedata.normalize('NFC', w) for w in re.split(r'[\s,]+', text) if w != '']
+
+
+def get_centroid_results(queries, n):
+	"""score groups of headwords by their centroids, all at once
+	
+	Each query is a line of headwords; its hits are the headwords
+	nearest the centroid of their vectors, leaving out the group.
+	"""
+	
+	groups = [[(w, find_headword(w)) for w in parse_group(q)] for q in queries]
+	
+	ids, scores = centroids.search(csr,
+		[[by_word[h] for w, h in words if h is not None] for words in groups], n)
+	
+	for words, row_ids, row_scores in zip(groups, ids, scores):
+		print 'query = ' + u' '.join(h or w for w, h in words).encode('utf8')
+		
+		for w, h in words:
+			if h is None:
+				print not_found(w)
+		
+		# display each result, its score, and text-only def
+		
+		for r_id, score in zip(row_ids, row_scores):
+			if r_id < 0:
+				break
+			
+			r = by_id[r_id]
+			
+			print '{0}\t{1:.3f}  {2}'.format(
+				r.encode('utf8'), 
+				float(score), 
+				full_def[r].encode('utf8'))
+		
+		print
+		print
+
+
 def main():
 	
 	#
@@ -78,11 +207,27 @@ def main():
 			help = 'Read queries from FILE')
 	parser.add_argument('-l', '--lsi', action='store_const', const=1,
 			help = 'Use LSI to reduce dimensionality')
+	parser.add_argument('-i', '--inverted', action='store_const', const=1,
+			help = 'Score tf-idf queries using posting lists')
+	parser.add_argument('--max-df', metavar='F', type=float,
+			help = 'With -i, ignore terms in more than fraction F of headwords')
+	parser.add_argument('--max-score', action='store_const', const=1,
+			help = 'With -i, stop admitting new hits once top N is settled')
+	parser.add_argument('-g', '--gloss', action='store_const', const=1,
+			help = 'Query by English words: +word requires, -word excludes')
+	parser.add_argument('--lang', choices=['la', 'grc'],
+			help = 'With -g, return only Latin or only Greek headwords')
+	parser.add_argument('-c', '--centroid', action='store_const', const=1,
+			help = 'Treat each query as a group of headwords; find words near them all')
 	
 	opt = parser.parse_args()
 	
 	quiet = 0
 	
+	if opt.inverted is not None and opt.lsi is not None:
+		print 'Posting lists need the tf-idf corpus; ignoring --inverted'
+		opt.inverted = None
+	
 	if opt.batch is not None:
 		quiet = 1
 	
@@ -135,6 +280,19 @@ def main():
 	by_id = pickle.load(f)
 	f.close()
 	
+	# the same, forgiving of accents and spelling
+	
+	global folded
+	
+	if os.path.exists(lookup.file_lookup):
+		folded = lookup.HeadwordLookup.load(quiet=quiet)
+	
+	# rebuilt if missing, or left over from older lookup tables
+	
+	if (folded is None or len(folded) != len(by_id)
+			or os.path.getmtime(lookup.file_lookup) < os.path.getmtime(file_lookup_id)):
+		folded = lookup.HeadwordLookup.build(by_id, quiet)
+	
 	# the corpus
 	
 	global corpus
@@ -144,18 +302,32 @@ def main():
 	else:
 		file_corpus = 'data/gensim.corpus_lsi.mm'
 	
-	corpus = corpora.MmCorpus(file_corpus)
-	
-	# the similarities index
+	# the similarities index, or posting lists in its place,
+	# or for English queries the gloss index
 	
 	global index
+	global engine
+	global gloss
+	global csr
+	
+	if opt.gloss is not None:
+		if not glosses.exists():
+			print 'No gloss index; run read_lexicon.py first'
+			sys.exit(1)
+		
+		gloss = glosses.load(quiet=quiet)
 	
-	file_index = 'data/gensim.index'
+	elif opt.centroid is not None:
+		csr = matrix.normalize(matrix.load_csr(file_corpus, quiet))
 	
-	if not quiet:		
-		print 'Loading similarity index ' + file_index
+	elif opt.inverted is not None:
+		engine = postings.PostingsIndex(
+			matrix.load_csr(file_corpus, quiet), opt.max_df, quiet)
 	
-	index = similarities.Similarity.load(file_index)
+	else:
+		corpus = corpora.MmCorpus(file_corpus)
+		
+		index = dedup.load_index('data/gensim.index', quiet)
 	
  	if not quiet:
 		print 'Ready for queries.'
@@ -173,11 +345,22 @@ def main():
 		except IOError as err:
 			print "can't read {0}: {1}".format(file_batch, str(err))
 		
+		# groups are scored all together
+		
+		if csr is not None:
+			get_centroid_results([l for l in f if l.strip()], opt.results)
+			f = []
+		
 		for line in f:
+			if gloss is not None:
+				if line.strip():
+					get_gloss_results(line.strip(), opt.results, opt.lang)
+				continue
+			
 			q = line.split()[0]			
 			q = unicodedata.normalize('NFC', q)
 			
-			get_results(q, opt.results)
+			get_results(q, opt.results, opt.max_score)
 	
 	
 	# otherwise from stdin
@@ -185,7 +368,7 @@ def main():
 	else:
 		while 1:		
 			try:
-				q = raw_input('headword: ')
+				q = raw_input('english: ' if gloss is not None else 'headword: ')
 			except EOFError:
 				break
 			
@@ -202,7 +385,12 @@ def main():
 			
 			q = unicodedata.normalize('NFC', q)
 			
-			get_results(q, opt.results)
+			if gloss is not None:
+				get_gloss_results(q, opt.results, opt.lang)
+			elif csr is not None:
+				get_centroid_results([q], opt.results)
+			else:
+				get_results(q, opt.results, opt.max_score)
 
 
 if __name__ == '__main__':
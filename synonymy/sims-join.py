@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Find every pair of headwords whose similarity exceeds a threshold
+
+Rather than the top n hits per query, this writes all pairs of
+headwords whose tf-idf cosine is at least the threshold, using
+prefix and size filtering to avoid scoring most pairs at all.
+
+Pairs are written as binary (id_a, id_b, score) records, int32,
+int32, float32; see Tesserae.simjoin.read_pairs.  Use --text to
+write tab-separated headwords and scores as well.
+
+See README for workflow details.
+"""
+
+import pickle
+import os
+import argparse
+
+import numpy
+
+from Tesserae import matrix
+from Tesserae import simjoin
+
+
+def main():
+
+	#
+	# check for options
+	#
+	
+	parser = argparse.ArgumentParser(
+			description='Find all headword pairs above a similarity threshold')
+	parser.add_argument('-s', '--threshold', metavar='S', default=0.5, type=float,
+			help = 'Minimum cosine similarity; default 0.5')
+	parser.add_argument('-x', '--cross', action='store_const', const=1,
+			help = 'Only pair Latin headwords with Greek ones')
+	parser.add_argument('-p', '--processes', metavar='N', default=1, type=int,
+			help = 'Number of parallel processes')
+	parser.add_argument('-b', '--block', metavar='N', default=1000, type=int,
+			help = 'Queries per block')
+	parser.add_argument('-o', '--output', metavar='FILE',
+			default=os.path.join('data', 'sims.join'),
+			help = 'Destination file')
+	parser.add_argument('--text', metavar='FILE',
+			help = 'Also write pairs as tab-separated text to FILE')
+	parser.add_argument('-q', '--quiet', action='store_const', const=1,
+			help = 'Print less info')
+	
+	opt = parser.parse_args()
+	
+	#
+	# load data created by read_lexicon.py
+	#
+	
+	file_lookup_id = os.path.join('data', 'lookup_id.pickle')
+	
+	if not opt.quiet:
+		print 'Loading index ' + file_lookup_id
+	
+	f = open(file_lookup_id, 'r')
+	by_id = pickle.load(f)
+	f.close()
+	
+	csr = matrix.load_csr(os.path.join('data', 'gensim.corpus_tfidf.mm'), opt.quiet)
+	
+	#
+	# set up the join
+	#
+	
+	if not opt.quiet:
+		print 'Indexing suffixes for threshold {}'.format(opt.threshold)
+	
+	if opt.cross:
+		greek = matrix.greek_mask(by_id)
+		
+		job = simjoin.SimJoin(csr, opt.threshold,
+					queries = numpy.flatnonzero(~greek),
+					targets = numpy.flatnonzero(greek))
+	else:
+		job = simjoin.SimJoin(csr, opt.threshold)
+	
+	if not opt.quiet:
+		print 'Joining {} queries'.format(len(job.queries))
+	
+	simjoin.run(job, opt.output, opt.processes, opt.block, opt.quiet)
+	
+	if not opt.quiet:
+		print 'Wrote {} pairs to {}'.format(
+			len(simjoin.read_pairs(opt.output)), opt.output)
+	
+	if opt.text is not None:
+		simjoin.write_text(simjoin.read_pairs(opt.output), opt.text, by_id, opt.quiet)
+
+
+if __name__ == '__main__':
+	main()
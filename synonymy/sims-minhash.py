@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""
+Find candidate similar headwords quickly using MinHash and LSH
+
+This script reads the text file 'dict/dict.flat.txt', like
+calc-matrix.py, but instead of exact tf-idf similarities it builds
+a MinHash signature for each headword's set of English terms and
+buckets the signatures band by band.  Headwords sharing a bucket in
+any band become candidate neighbours.
+
+Candidates are written as binary (id_a, id_b, score) records, with
+ids following the lines of the flat file; see
+Tesserae.simjoin.read_pairs.  The score is the Jaccard similarity
+estimated from the signatures, or the exact one with --rescore.
+
+With --report, a sample of headwords is also looked up in the
+gensim index created by calc-matrix.py, and the recall of their
+exact top n neighbours is shown for several band/row settings.
+
+See README for workflow details.
+"""
+
+import pickle
+import os
+import argparse
+
+import numpy
+
+from Tesserae import minhash
+from Tesserae import simjoin
+from Tesserae import dedup
+
+
+def exact_pairs(sample, by_id, n, file_corpus, file_index, quiet):
+	'''Top n exact neighbours of sample headwords, as flat-file ids'''
+	
+	from gensim import corpora
+	
+	f = open(os.path.join('data', 'lookup_word.pickle'), 'r')
+	g_by_word = pickle.load(f)
+	f.close()
+	
+	f = open(os.path.join('data', 'lookup_id.pickle'), 'r')
+	g_by_id = pickle.load(f)
+	f.close()
+	
+	if not quiet:
+		print 'Loading corpus ' + file_corpus
+	
+	corpus = corpora.MmCorpus(file_corpus)
+	index  = dedup.load_index(file_index, quiet)
+	
+	flat_id = dict((w, i) for i, w in enumerate(by_id))
+	
+	a = []
+	b = []
+	
+	for q in sample:
+		if by_id[q] not in g_by_word:
+			continue
+		
+		g_id = g_by_word[by_id[q]]
+		
+		sims = numpy.asarray(index[corpus[g_id]])
+		
+		for r in numpy.argsort(-sims, kind='mergesort')[:n+1]:
+			if r == g_id or sims[r] <= 0 or g_by_id[r] not in flat_id:
+				continue
+			
+			a.append(q)
+			b.append(flat_id[g_by_id[r]])
+	
+	return numpy.array(a, dtype=numpy.int64), numpy.array(b, dtype=numpy.int64)
+
+
+def main():
+
+	#
+	# check for options
+	#
+	
+	parser = argparse.ArgumentParser(
+			description='Generate candidate neighbours using MinHash/LSH')
+	parser.add_argument('-k', '--perms', metavar='K', default=128, type=int,
+			help = 'Number of hash permutations; default 128')
+	parser.add_argument('-r', '--rows', metavar='R', default=4, type=int,
+			help = 'Rows per LSH band; bands = K / R; default 4')
+	parser.add_argument('--seed', metavar='N', default=0, type=int,
+			help = 'Random seed for the hash functions')
+	parser.add_argument('--max-bucket', metavar='N', type=int,
+			help = 'Skip buckets with more than N headwords')
+	parser.add_argument('--rescore', action='store_const', const=1,
+			help = 'Score candidates by exact Jaccard similarity')
+	parser.add_argument('-s', '--min-score', metavar='S', type=float,
+			help = 'Drop candidates scoring below S')
+	parser.add_argument('-o', '--output', metavar='FILE',
+			default=os.path.join('data', 'sims.minhash'),
+			help = 'Destination file')
+	parser.add_argument('--text', metavar='FILE',
+			help = 'Also write candidates as tab-separated text to FILE')
+	parser.add_argument('--report', metavar='N', type=int,
+			help = 'Report recall against the gensim index for N sample headwords')
+	parser.add_argument('-n', '--results', metavar='N', default=25, type=int,
+			help = 'With --report, neighbours per sample headword; default 25')
+	parser.add_argument('--corpus', metavar='FILE',
+			default=os.path.join('data', 'gensim.corpus.mm'),
+			help = 'With --report, the tf-idf corpus')
+	parser.add_argument('--index', metavar='FILE',
+			default=os.path.join('data', 'gensim.index'),
+			help = 'With --report, the similarity index')
+	parser.add_argument('-q', '--quiet', action='store_const', const=1,
+			help = 'Print less info')
+	
+	opt = parser.parse_args()
+	
+	#
+	# read the flat dictionary
+	#
+	
+	file_dict = os.path.join('dict', 'dict.flat.txt')
+	
+	if not opt.quiet:
+		print 'Reading ' + file_dict
+	
+	by_id, docs = minhash.read_flat(file_dict)
+	
+	csr = minhash.term_sets(docs)
+	
+	#
+	# signatures and candidates
+	#
+	
+	if not opt.quiet:
+		print 'Computing {} minhashes for {} headwords'.format(opt.perms, len(by_id))
+	
+	sig = minhash.signatures(csr, opt.perms, opt.seed)
+	
+	bands = opt.perms // opt.rows
+	
+	if not opt.quiet:
+		print 'Bucketing {} bands of {} rows'.format(bands, opt.rows)
+	
+	a, b = minhash.band_pairs(sig, bands, opt.rows, opt.max_bucket)
+	
+	if opt.rescore:
+		score = minhash.jaccard(csr, a, b)
+	else:
+		score = minhash.estimate(sig, a, b)
+	
+	if opt.min_score is not None:
+		keep = score >= opt.min_score
+		a, b, score = a[keep], b[keep], score[keep]
+	
+	pairs = minhash.to_pairs(a, b, score)
+	
+	if not opt.quiet:
+		print 'Writing {} candidate pairs to {}'.format(len(pairs), opt.output)
+	
+	pairs.tofile(opt.output)
+	
+	if opt.text is not None:
+		simjoin.write_text(pairs, opt.text, by_id, opt.quiet)
+	
+	#
+	# recall against exact results
+	#
+	
+	if opt.report is not None:
+		rng = numpy.random.RandomState(opt.seed)
+		
+		sample = rng.choice(len(by_id), min(opt.report, len(by_id)), replace=False)
+		
+		exact_a, exact_b = exact_pairs(sample, by_id, opt.results,
+						opt.corpus, opt.index, opt.quiet)
+		
+		settings = [(opt.perms // r, r) for r in range(1, opt.perms + 1)
+						if opt.perms % r == 0 and r <= 32]
+		
+		print 'Recall of top {} exact neighbours for {} headwords'.format(
+			opt.results, len(sample))
+		print 'bands\trows\tthresh\tpairs\trecall'
+		
+		for row in minhash.recall(sig, exact_a, exact_b, settings, opt.max_bucket):
+			print '{0}\t{1}\t{2:.3f}\t{3}\t{4:.3f}'.format(*row)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Compute the top-k neighbour table in shards
+
+The similarity stage can be split across processes or machines
+sharing a filesystem:
+
+   sims-shard.py prepare              # once: memory-mappable corpus
+   sims-shard.py run --shard 1/4      # on any machine, any order
+   ...
+   sims-shard.py run --shard 4/4
+   sims-shard.py merge 4              # check coverage, assemble
+
+Each shard covers a fixed range of headword ids, reads only the
+shared memory-mapped corpus, and writes its own file under
+data/shards/.  merge writes the global table to
+data/neighbours.ids.npy and data/neighbours.scores.npy.
+
+See README for workflow details.
+"""
+
+import os
+import sys
+import argparse
+
+from Tesserae import matrix
+from Tesserae import neighbours
+from Tesserae import shards
+
+stem_matrix = os.path.join('data', 'corpus')
+dir_shards  = os.path.join('data', 'shards')
+
+
+def prepare(opt):
+	'''Save the normalized corpus as memory-mappable arrays'''
+	
+	if opt.lsi is None:
+		file_corpus = os.path.join('data', 'gensim.corpus_tfidf.mm')
+	else:
+		file_corpus = os.path.join('data', 'gensim.corpus_lsi.mm')
+	
+	csr = matrix.normalize(matrix.load_csr(file_corpus, opt.quiet))
+	
+	matrix.save_mmap(csr, stem_matrix, opt.quiet)
+
+
+def run(opt):
+	'''Compute one shard'''
+	
+	try:
+		i, n = shards.parse(opt.shard)
+	except ValueError as err:
+		print str(err)
+		sys.exit(1)
+	
+	csr = matrix.load_mmap(stem_matrix, opt.quiet)
+	
+	shards.run(csr, i, n, opt.neighbours, dir_shards, opt.block, opt.quiet)
+
+
+def merge(opt):
+	'''Assemble the shards into the global neighbour table'''
+	
+	try:
+		ids, scores = shards.merge(dir_shards, opt.shards, opt.quiet)
+	except ValueError as err:
+		print "Can't merge: " + str(err)
+		sys.exit(1)
+	
+	neighbours.save(ids, scores, quiet=opt.quiet)
+
+
+def main():
+
+	#
+	# check for options
+	#
+	
+	parser = argparse.ArgumentParser(
+			description='Compute the top-k neighbour table in shards')
+	parser.add_argument('-q', '--quiet', action='store_const', const=1,
+			help = 'Print less info')
+	
+	commands = parser.add_subparsers(dest='command')
+	
+	p = commands.add_parser('prepare',
+			help = 'Save the corpus as memory-mappable arrays')
+	p.add_argument('-l', '--lsi', action='store_const', const=1,
+			help = 'Use the LSI corpus')
+	p.set_defaults(func=prepare)
+	
+	p = commands.add_parser('run',
+			help = 'Compute one shard')
+	p.add_argument('--shard', metavar='I/N', required=True,
+			help = 'Compute shard I of N, counting from 1')
+	p.add_argument('-k', '--neighbours', metavar='K', default=100, type=int,
+			help = 'Neighbours per headword; default 100')
+	p.add_argument('-b', '--block', metavar='N', default=256, type=int,
+			help = 'Queries per block')
+	p.set_defaults(func=run)
+	
+	p = commands.add_parser('merge',
+			help = 'Check and assemble the shards')
+	p.add_argument('shards', metavar='N', type=int,
+			help = 'Number of shards')
+	p.set_defaults(func=merge)
+	
+	opt = parser.parse_args()
+	
+	opt.func(opt)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+"""
+Compare pipeline configurations against a synset file
+
+Reads a grid of parameter values from a JSON file, e.g.
+
+   {
+    "grid": {
+     "definition": ["default", "wide"],
+     "stem":       [0, 1],
+     "hapax":      [0, 1],
+     "weighting":  ["tfidf", "bm25"],
+     "topics":     [0, 100, 300, 500]
+    },
+    "definitions": {
+     "wide": {"la": "<hi [^>]*>(.+?)</hi>", "grc": "<tr\\\\b[^>]*>(.+?)</tr>"}
+    }
+   }
+
+and runs every combination, from the XML lexica up, scoring each
+with the synset evaluation of synset-check.py.  Parameters left out
+of the grid take read_lexicon.py's defaults; "default" names its
+own definition patterns.  The stages each configuration needs are
+shared with any other configuration that needs the same ones, kept
+under data/sweep/, and not rerun by later sweeps.
+
+See README for workflow details.
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import pickle
+import argparse
+
+from gensim import corpora, models
+
+import read_lexicon
+
+from Tesserae import matrix
+from Tesserae import pairs
+from Tesserae import evaluate
+from Tesserae import sweep
+from Tesserae import weighting
+from Tesserae import checkpoint
+
+dir_sweep = os.path.join('data', 'sweep')
+
+# values for parameters the grid leaves out
+
+DEFAULTS = {'definition': 'default', 'stem': 0, 'hapax': 0, 'weighting': 'tfidf',
+				'topics': 0, 'xref': 1}
+
+
+#
+# the stages
+#
+
+def load(dir, name):
+
+	f = open(os.path.join(dir, name), 'rb')
+	x = pickle.load(f)
+	f.close()
+	
+	return x
+
+
+def dump(x, dir, name):
+
+	f = open(os.path.join(dir, name), 'wb')
+	pickle.dump(x, f, 2)
+	f.close()
+
+
+def stage_defs(params, inputs, out):
+	'''Parse the lexica with the given definition patterns'''
+	
+	pat = read_lexicon.pat
+	
+	saved = pat.definition, pat.definition_bytes
+	
+	if params['patterns'] is not None:
+		pat.definition = dict((lang, re.compile(p, re.U))
+							for lang, p in params['patterns'].iteritems())
+		pat.definition_bytes = dict((lang, re.compile(p.encode('utf-8')))
+							for lang, p in params['patterns'].iteritems())
+	
+	try:
+		defs = read_lexicon.parse_XML_dictionaries(['la', 'grc'], 1, 'mmap',
+							params['xref'], offsets=False)
+	finally:
+		pat.definition, pat.definition_bytes = saved
+	
+	dump(defs, out, 'defs.pickle')
+
+
+def stage_tokens(params, inputs, out):
+	'''Bags of words, stemmed or not, with or without hapaxes'''
+	
+	defs = read_lexicon.bag_of_words(load(inputs[0], 'defs.pickle'),
+							params['stem'], 1, keep_hapax=params['hapax'])
+	
+	by_id = defs.keys()
+	
+	dump(by_id, out, 'by_id.pickle')
+	dump([defs[lemma] for lemma in by_id], out, 'tokens.pickle')
+
+
+def stage_counts(params, inputs, out):
+	'''The headword x term count matrix'''
+	
+	corpus = load(inputs[0], 'tokens.pickle')
+	
+	dictionary = corpora.Dictionary(corpus)
+	dictionary.save(os.path.join(out, 'gensim.dictionary'))
+	
+	corpus = [dictionary.doc2bow(doc) for doc in corpus]
+	
+	matrix.save_mmap(matrix.to_csr(corpus, len(dictionary)), os.path.join(out, 'counts'), 1)
+
+
+def stage_weight(params, inputs, out):
+	'''The weighted matrix'''
+	
+	counts = matrix.load_mmap(os.path.join(inputs[0], 'counts'), 1)
+	
+	matrix.save_mmap(weighting.apply(params['scheme'], counts), os.path.join(out, 'corpus'), 1)
+
+
+def stage_lsi(params, inputs, out):
+	'''LSI over the weighted matrix'''
+	
+	dir_weighted, dir_counts = inputs
+	
+	csr = matrix.load_mmap(os.path.join(dir_weighted, 'corpus'), 1)
+	
+	dictionary = corpora.Dictionary.load(os.path.join(dir_counts, 'gensim.dictionary'))
+	
+	lsi = models.LsiModel(matrix.to_corpus(csr), id2word=dictionary,
+							num_topics=params['topics'])
+	
+	matrix.save_mmap(matrix.to_csr(lsi[matrix.to_corpus(csr)], params['topics']),
+						os.path.join(out, 'corpus'), 1)
+
+
+def stage_eval(params, inputs, out):
+	'''Score the final matrix against the synsets'''
+	
+	dir_matrix, dir_tokens = inputs
+	
+	csr = matrix.normalize(matrix.load_mmap(os.path.join(dir_matrix, 'corpus'), 1))
+	
+	by_id   = load(dir_tokens, 'by_id.pickle')
+	by_word = dict((lemma, i) for i, lemma in enumerate(by_id))
+	
+	store = pairs.from_synsets(pairs.read_synsets(params['synsets']),
+								by_word.get, len(by_id))
+	
+	store.lookup(pairs.matrix_ranks(csr), store.n_known)
+	
+	summary, table = evaluate.evaluate(store.ranka, store.rankb,
+										store.offsets, store.synsets)
+	
+	evaluate.save(summary, table, os.path.join(out, 'eval'), 1)
+
+
+STAGES = {
+	'defs':   stage_defs,
+	'tokens': stage_tokens,
+	'counts': stage_counts,
+	'weight': stage_weight,
+	'lsi':    stage_lsi,
+	'eval':   stage_eval
+}
+
+
+def build(graph, config, definitions, synsets):
+	'''Add the stages for one configuration; return its eval node'''
+	
+	name = config['definition']
+	
+	if name != 'default' and name not in definitions:
+		raise ValueError('no definition patterns named ' + name)
+	
+	# the lexica's sizes and dates stand in for their contents
+	
+	defs = graph.add('defs', {
+		'patterns': None if name == 'default' else definitions[name],
+		'xref':     bool(config['xref']),
+		'lexica':   checkpoint.stamp([os.path.join('dict', lang + '.lexicon.xml')
+									for lang in ['la', 'grc']])
+	})
+	
+	tokens = graph.add('tokens', {
+		'stem':  bool(config['stem']),
+		'hapax': bool(config['hapax'])
+	}, [defs])
+	
+	counts = graph.add('counts', {}, [tokens])
+	
+	final = graph.add('weight', {'scheme': config['weighting']}, [counts])
+	
+	if config['topics'] > 0:
+		final = graph.add('lsi', {'topics': config['topics']}, [final, counts])
+	
+	# the synset file's size and date stand in for its contents
+	
+	st = os.stat(synsets)
+	
+	return graph.add('eval', {
+		'synsets': os.path.abspath(synsets),
+		'size':    st.st_size,
+		'mtime':   st.st_mtime
+	}, [final, tokens])
+
+
+def report(configs, summaries, file, quiet):
+	'''One row per configuration'''
+	
+	params = sorted(DEFAULTS)
+	ks     = sorted(int(k) for k in summaries[0]['recall'])
+	
+	header = params + ['scored'] + ['recall@{0}'.format(k) for k in ks] + ['mrr', 'median_rank']
+	
+	rows = []
+	
+	for config, s in zip(configs, summaries):
+		rows.append([config[p] for p in params] + [s['scored']] +
+					[s['recall'][str(k)] for k in ks] + [s['mrr'], s['median_rank']])
+	
+	if file is not None:
+		if not quiet:
+			print 'Writing results to ' + file
+		
+		f = open(file, 'wb')
+		w = csv.writer(f)
+		w.writerow(header)
+		w.writerows(rows)
+		f.close()
+	
+	fmt = lambda x: '-' if x is None else '{0:.4f}'.format(x) if isinstance(x, float) else str(x)
+	
+	print '\t'.join(header)
+	
+	for row in rows:
+		print '\t'.join(fmt(x) for x in row)
+
+
+def main():
+
+	#
+	# check for options
+	#
+	
+	parser = argparse.ArgumentParser(
+			description='Compare pipeline configurations against a synset file')
+	parser.add_argument('grid', metavar='GRID',
+			help = 'JSON file of parameter values')
+	parser.add_argument('synsets', metavar='SYNSETS',
+			help = 'Synset file, as for synset-check.py')
+	parser.add_argument('-p', '--processes', metavar='N', type=int, default=1,
+			help = 'Run up to N stages at once')
+	parser.add_argument('-o', '--output', metavar='FILE', default='sweep.csv',
+			help = 'Write results as CSV; default sweep.csv')
+	parser.add_argument('-n', '--dry-run', action='store_const', const=1,
+			help = 'Show the stages that would run, then stop')
+	parser.add_argument('-q', '--quiet', action='store_const', const=1,
+			help = 'Print less info')
+	
+	opt = parser.parse_args()
+	
+	try:
+		f = open(opt.grid, 'r')
+		spec = json.load(f)
+		f.close()
+	except (IOError, ValueError) as err:
+		print "Can't read {0}: {1}".format(opt.grid, str(err))
+		sys.exit(1)
+	
+	unknown = set(spec.get('grid', {})) - set(DEFAULTS)
+	
+	if unknown:
+		print 'Unknown parameters: ' + ', '.join(sorted(unknown))
+		sys.exit(1)
+	
+	schemes = set(spec.get('grid', {}).get('weighting', [])) - set(weighting.SCHEMES)
+	
+	if schemes:
+		print 'Unknown weightings: ' + ', '.join(sorted(schemes))
+		sys.exit(1)
+	
+	values = dict((k, [v]) for k, v in DEFAULTS.iteritems())
+	values.update(spec.get('grid', {}))
+	
+	configs = sweep.grid(values)
+	
+	#
+	# one graph for all the configurations
+	#
+	
+	graph = sweep.Graph(dir_sweep)
+	
+	try:
+		ends = [build(graph, c, spec.get('definitions', {}), opt.synsets) for c in configs]
+	except (ValueError, OSError) as err:
+		print str(err)
+		sys.exit(1)
+	
+	if not opt.quiet:
+		print '{0} configurations share {1} stages; {2} already done'.format(
+			len(configs), len(graph), sum(graph.done(n) for n in graph.nodes.values()))
+	
+	if opt.dry_run:
+		for node in sorted(graph.nodes.values(), key=lambda n: (n.depth, n.key)):
+			print '{0}\t{1}\t{2}'.format(node.key, 'done' if graph.done(node) else 'todo',
+										json.dumps(node.params, sort_keys=True))
+		return
+	
+	graph.run(STAGES, opt.processes, opt.quiet)
+	
+	summaries = [evaluate.load(os.path.join(graph.path(n), 'eval')) for n in ends]
+	
+	report(configs, summaries, opt.output, opt.quiet)
+
+
+if __name__ == '__main__':
+	main()
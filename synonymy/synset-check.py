@@ -15,22 +15,20 @@ See README for workflow details.
 import pickle
 import os
 import sys
-import re
-import codecs
 import unicodedata
+import time
 import argparse
+import numpy
 from gensim import corpora, models, similarities
 from Tesserae import progressbar
+from Tesserae import dedup
+from Tesserae import pairs
+from Tesserae import evaluate
+from Tesserae import checkpoint
 
+# where an interrupted run's progress is kept
 
-class SynPair:
-	"""store information about a pair of words purported to be synonyms"""
-	def __init__(self, synsets=None, sim=None, ranka=None, rankb=None):
-		
-		self.synsets = synsets;
-		self.sim     = sim;
-		self.ranka   = ranka;
-		self.rankb   = rankb;
+file_checkpoint = 'test.results.checkpoint'
 
 
 class LexQuery:
@@ -120,10 +118,7 @@ class SimsDB:
 	def load_index(self, file_index, quiet=0):
 		"""load the similarities index"""
 		
-		if not quiet:		
-			print 'Loading similarity index ' + file_index
-		
-		self.index = similarities.Similarity.load(file_index)
+		self.index = dedup.load_index(file_index, quiet)
 	
 	def get_sims(self, query):
 		"""test query against the similarity matrix"""
@@ -136,10 +131,29 @@ class SimsDB:
 		sims = sorted(enumerate(sims), key=lambda item: -item[1])
 				
 		return sims
+	
+	def get_ranks(self, id):
+		"""similarities to id, and the rank of each among its results"""
+		
+		sims = numpy.asarray(self.index[self.corpus[id]])
+		
+		# same order as get_sims: descending, ties by id
+		
+		order = numpy.argsort(-sims, kind='mergesort')
+		
+		rank = numpy.empty(len(order), dtype=numpy.int32)
+		rank[order] = numpy.arange(len(order), dtype=numpy.int32)
+		
+		return sims, rank
 
 
 def parse_synsets(file, quiet):
-	"""parse a file of synsets"""
+	"""parse a file of synsets into a PairStore
+	
+	Words are given lexicon ids as they are read; words not in the
+	lexicon get ids from len(lexicon) up, and are listed in the
+	store's attribute extra.
+	"""
 	
 	if not quiet:
 		print 'Reading synsets from {0}'.format(file)
@@ -149,90 +163,20 @@ def parse_synsets(file, quiet):
 	pr = progressbar.ProgressBar(os.stat(file).st_size)
 	
 	try: 
-		f = codecs.open(file, encoding='utf_8')
+		return pairs.from_synsets(pairs.read_synsets(file, pr), 
+							LexQuery.LookupByWord, len(LexQuery._by_id))
 	except IOError as err:
 		print "can't read {0}: {1}".format(file, str(err))
 		return None
-		
-	# this dictionary holds links between heads
-	
-	links = dict()
-	
-	# each line should be a separate record
-	
-	for line in f:
-		
-		# show progress
-		
-		pr.advance(len(line.encode('utf-8')))
-		
-		# check for synset id
-		
-		m = re.match('<synset no="(\d+)">', line)
-		
-		# skip lines that don't match synset format
-		
-		if m is None:
-			continue
-		
-		n = int(m.group(1))
-		
-		# get the list of greek words in this set
-		
-		nodes = re.findall('<grcword>(.+?)</grcword>', line)
-		
-		nodes = [unicodedata.normalize('NFC', node) for node in nodes]
-		nodes = [node.encode('utf8') for node in nodes]
-		
-		# create a link for every possible pair
-		
-		for i in range(len(nodes)-1):
-			for j in range(i+1, len(nodes)):
-				
-				keypair = '{0}->{1}'.format(*sorted([nodes[i],nodes[j]]))
-				
-				# create a SynPair instance if one doesn't exist
-				
-				if keypair not in links:
-					links[keypair] = SynPair()
-				
-				# note that the two nodes are joined by this synset
-	
-				if links[keypair].synsets is None:
-					links[keypair].synsets = set([n])
-				else:
-					links[keypair].synsets.add(n)
-	
-	return links		
 
 
-def recip_lookup(pair, link, simsdb, f):
-	"""lookup syn pair in sim database, add info"""
+def lookup_word(store, id):
+	"""the word for an id assigned by parse_synsets"""
 	
-	query_a, query_b = [LexQuery(byword=word) for word in pair.split('->')]
-		
-	if query_a.id is not None and query_b.id is not None:
-				
-		hits_a = simsdb.get_sims(query_a)
-			
-		for i in range(len(hits_a)):
-						
-			if hits_a[i][0] == query_b.id:
-				
-				link.sim   = hits_a[i][1]
-				link.ranka = i
-					
-				break
-				
-		hits_b = simsdb.get_sims(query_b)
-			
-		for i in range(len(hits_b)):
-						
-			if hits_b[i][0] == query_a.id:
-				
-				link.rankb = i
-				
-				break
+	if id < store.n_known:
+		return LexQuery._by_id[id]
+	
+	return store.extra[id - store.n_known]
 
 
 def main():
@@ -246,6 +190,12 @@ def main():
 				epilog='See README.txt for details.')
 	parser.add_argument('file', metavar='FILE', type=str,
 				help='synset file')
+	parser.add_argument('-e', '--eval', metavar='STEM', default='test.eval',
+				help='write evaluation to STEM.json, STEM.synsets.csv; default test.eval')
+	parser.add_argument('--checkpoint', metavar='SECONDS', default=60, type=float,
+				help='save progress this often; default 60, 0 for never')
+	parser.add_argument('--resume', action='store_const', const=1,
+				help='carry on from the last checkpoint of an interrupted run')
 	parser.add_argument('-q', '--quiet', action='store_const', const=1,
 				help='print less info')
 
@@ -271,34 +221,95 @@ def main():
 	# load synset data from input file
 	#
 	
-	links = parse_synsets(file=opt.file, quiet=opt.quiet)
-
+	store = parse_synsets(file=opt.file, quiet=opt.quiet)
+	
+	if store is None:
+		sys.exit(1)
+	
 	#
-	# check all synpairs 
+	# check all synpairs, querying each headword once
 	#
 	
-	f = open('test.results', 'w')
-	
 	print 'cross-referencing synsets'
 	
-	pr = progressbar.ProgressBar(len(links), quiet=1)
+	queries = store.queries(store.n_known)
 	
-	for pair, link in links.iteritems():
+	ck = checkpoint.Checkpoint(file_checkpoint, {
+		'synsets': checkpoint.stamp([opt.file]),
+		'pairs':   len(store),
+		'queries': len(queries),
+		'files':   checkpoint.stamp(['data/gensim.corpus.mm', 'data/gensim.index',
+									'data/lookup_id.pickle'])
+	})
 	
-		pr.advance()
-		sys.stderr.write('\r{0}/{1}'.format(pr._current, pr._total))
-		
-		recip_lookup(pair, link, simsdb, f)
-		f.write('{0}\t{1}\t{2}\t{3}\t{4}\n'.format(
-			pair, 
-			link.sim, 
-			link.ranka, 
-			link.rankb,
-			';'.join([str(synset) for synset in link.synsets])
+	if opt.resume:
+		try:
+			ck.load()
+			store.sim[:]   = ck.arrays['sim']
+			store.ranka[:] = ck.arrays['ranka']
+			store.rankb[:] = ck.arrays['rankb']
+		except (IOError, ValueError, KeyError) as err:
+			print "Can't resume from {0}: {1}".format(file_checkpoint, str(err))
+			sys.exit(1)
+		
+		if not opt.quiet:
+			print 'Resuming with {0} of {1} headwords done'.format(ck.finished(), len(queries))
+	
+	pr = progressbar.ProgressBar(len(queries) - ck.finished(), opt.quiet)
+	
+	last = time.time()
+	
+	for start, end in ck.todo(len(queries)):
+		for i in range(start, end, 64):
+			j = min(i + 64, end)
+			
+			store.lookup(simsdb.get_ranks, store.n_known, pr, queries[i:j])
+			
+			ck.add(i, j)
+			
+			if opt.checkpoint > 0 and time.time() - last >= opt.checkpoint:
+				ck.arrays = {'sim': store.sim, 'ranka': store.ranka, 'rankb': store.rankb}
+				ck.save()
+				last = time.time()
+	
+	#
+	# write the results, each pair in the order of its words
+	#
+	
+	f = open('test.results', 'w')
+	
+	fmt = lambda x, none: 'None' if x == none else str(x)
+	
+	for i in range(len(store)):
+		a = lookup_word(store, store.a[i])
+		b = lookup_word(store, store.b[i])
+		
+		ranka, rankb = store.ranka[i], store.rankb[i]
+		
+		if b < a:
+			a, b = b, a
+			ranka, rankb = rankb, ranka
+		
+		f.write('{0}->{1}\t{2}\t{3}\t{4}\t{5}\n'.format(
+			a.encode('utf8'), 
+			b.encode('utf8'), 
+			'None' if numpy.isnan(store.sim[i]) else str(float(store.sim[i])), 
+			fmt(ranka, -1), 
+			fmt(rankb, -1),
+			';'.join([str(synset) for synset in store.synsets_of(i)])
 		))
-		f.flush()
-		
-	f.close()	
+	
+	f.close()
+	
+	#
+	# summary figures, straight from the rank columns
+	#
+	
+	summary, table = evaluate.evaluate(store.ranka, store.rankb, store.offsets, store.synsets)
+	
+	evaluate.save(summary, table, opt.eval, opt.quiet)
+
+	ck.remove()
 
 
 # call function main as default action
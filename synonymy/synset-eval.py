@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Summarize and compare synset-check results
+
+Reads one or more test.results files written by synset-check.py,
+or .json summaries saved from them, and prints recall at k, MRR and
+reciprocal agreement side by side.
+
+See README.synsets for details.
+"""
+
+import sys
+import argparse
+
+from Tesserae import evaluate
+
+
+def summarize(file, opt):
+	'''Summary figures for a results file or a saved summary'''
+	
+	if file.endswith('.json'):
+		return evaluate.load(file[:-len('.json')])
+	
+	try:
+		columns = evaluate.read_results(file)
+	except IOError as err:
+		print "Can't read {0}: {1}".format(file, str(err))
+		sys.exit(1)
+	
+	summary, table = evaluate.evaluate(*columns, ks=opt.ks, k_synset=opt.k_synset)
+	
+	if opt.output is not None:
+		evaluate.save(summary, table, opt.output, opt.quiet)
+	
+	return summary
+
+
+def show(files, summaries):
+	'''Print the summaries in columns'''
+	
+	rows = [('pairs', lambda s: s['pairs']), ('scored', lambda s: s['scored'])]
+	
+	ks = sorted(set(int(k) for s in summaries for k in s['recall']))
+	
+	for k in ks:
+		rows.append(('recall@{0}'.format(k), lambda s, k=k: s['recall'].get(str(k))))
+	
+	for k in ks:
+		rows.append(('both@{0}'.format(k), lambda s, k=k: s['reciprocal']['both'].get(str(k))))
+	
+	rows.extend([
+		('mrr',         lambda s: s['mrr']),
+		('mean rank',   lambda s: s['mean_rank']),
+		('median rank', lambda s: s['median_rank'])
+	])
+	
+	width = max([12] + [len(f) for f in files]) + 2
+	
+	print ''.ljust(14) + ''.join(f.rjust(width) for f in files)
+	
+	for label, get in rows:
+		cells = []
+		
+		for s in summaries:
+			x = get(s)
+			
+			if x is None:
+				cells.append('-')
+			elif isinstance(x, float):
+				cells.append('{0:.4f}'.format(x))
+			else:
+				cells.append(str(x))
+		
+		print label.ljust(14) + ''.join(c.rjust(width) for c in cells)
+
+
+def main():
+
+	#
+	# check for options
+	#
+	
+	parser = argparse.ArgumentParser(
+				description='Summarize and compare synset-check results',
+				epilog='See README.synsets for details.')
+	parser.add_argument('files', metavar='FILE', nargs='+',
+				help='test.results files, or saved .json summaries')
+	parser.add_argument('-k', dest='ks', metavar='K', type=int, nargs='+',
+				default=list(evaluate.KS),
+				help='cut-offs for recall; default {0}'.format(
+					' '.join(str(k) for k in evaluate.KS)))
+	parser.add_argument('--k-synset', metavar='K', type=int, default=10,
+				help='cut-off for per-synset recall; default 10')
+	parser.add_argument('-o', '--output', metavar='STEM',
+				help='save STEM.json and STEM.synsets.csv (one file only)')
+	parser.add_argument('-q', '--quiet', action='store_const', const=1,
+				help='print less info')
+	
+	opt = parser.parse_args()
+	
+	if opt.output is not None and len(opt.files) > 1:
+		print 'Use -o with a single file'
+		sys.exit(1)
+	
+	summaries = [summarize(file, opt) for file in opt.files]
+	
+	show(opt.files, summaries)
+
+
+if __name__ == '__main__':
+	main()